@@ -8,10 +8,14 @@ bl_info = {
     "category": "Object",
 }
 
-import bpy, importlib, traceback
+import importlib, traceback
+try:
+    import bpy
+except ImportError:  # outside Blender: only the bpy-free modules (core, kernels, solver, backend) are usable
+    bpy = None
 
 _SUBMODULES = [
-    ".constants",".utils",".attrs",".sampling",".materials",".heightfill",".gn",
+    ".constants",".backend",".utils",".attrs",".sampling",".cache",".materials",".heightfill",".worker",".gn",".gn_blend",
     ".settings",".ops_layers",".ops_masks",".ops_materials",".ops_assign_from_disp",
     ".ops_pipeline",".ops_reset_all",".ops_reset",".ops_bake",".ops_pack",
     ".ops_settings_io",".ops_vc_channels",".ui",
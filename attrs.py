@@ -1,7 +1,9 @@
 # attrs.py — helpers for mesh attributes & color attributes (Blender 4.x safe)
 from __future__ import annotations
 import bpy
+import numpy as np
 from typing import Optional
+from .kernels import SparseMask
 
 # ---------------------------
 # Generic mesh attributes (FLOAT / FLOAT_VECTOR etc.)
@@ -53,6 +55,92 @@ def remove_attribute_safely(me: bpy.types.Mesh, name: str):
     except Exception:
         pass
 
+# ---------------------------
+# Bulk attribute I/O (whole attributes through flat buffers)
+# ---------------------------
+
+# data_type -> (RNA property used by foreach_get/set, components per element)
+_BULK_PROPS = {
+    'FLOAT':        ('value',  1),
+    'INT':          ('value',  1),
+    'BOOLEAN':      ('value',  1),
+    'FLOAT2':       ('vector', 2),
+    'FLOAT_VECTOR': ('vector', 3),
+    'FLOAT_COLOR':  ('color',  4),
+    'BYTE_COLOR':   ('color',  4),
+}
+
+def _bulk_prop(attr):
+    """Return (prop, width) for attribute; legacy vertex colors have no data_type."""
+    return _BULK_PROPS.get(getattr(attr, "data_type", 'BYTE_COLOR'), ('value', 1))
+
+def _get_any_attr(me: bpy.types.Mesh, name: str):
+    a = me.attributes.get(name) if hasattr(me, "attributes") else None
+    return a if a is not None else _get_color_attr(me, name)
+
+def read_attr_array(me: bpy.types.Mesh, name: str, dtype=np.float32) -> Optional[np.ndarray]:
+    """
+    Read a whole attribute with one foreach_get.
+    Returns shape (n,) for scalar attributes, (n, width) otherwise; None if missing.
+    """
+    a = _get_any_attr(me, name)
+    if a is None:
+        return None
+    prop, width = _bulk_prop(a)
+    n = len(a.data)
+    buf = np.empty(n * width, dtype=dtype)
+    try:
+        a.data.foreach_get(prop, buf)
+    except Exception as e:
+        print(f"[MLD] Bulk read of '{name}' failed: {e}")
+        return None
+    return buf if width == 1 else buf.reshape(n, width)
+
+def write_attr_array(me: bpy.types.Mesh, name: str, values) -> bool:
+    """
+    Write a whole attribute with one foreach_set.
+    values: (n,) or (n, width) buffer. Shorter buffers only overwrite the leading
+    elements (the rest keeps its current data), longer ones are truncated.
+    """
+    a = _get_any_attr(me, name)
+    if a is None:
+        return False
+    prop, width = _bulk_prop(a)
+    n = len(a.data)
+    src = np.asarray(values, dtype=np.float32).reshape(-1, width)
+    if len(src) == n:
+        buf = src
+    else:
+        buf = read_attr_array(me, name)
+        if buf is None:
+            return False
+        buf = buf.reshape(n, width)
+        k = min(n, len(src))
+        buf[:k] = src[:k]
+    try:
+        a.data.foreach_set(prop, np.ascontiguousarray(buf, dtype=np.float32).ravel())
+    except Exception as e:
+        print(f"[MLD] Bulk write of '{name}' failed: {e}")
+        return False
+    return True
+
+def write_offs_z(me: bpy.types.Mesh, name: str, offs_z) -> bool:
+    """Write scalar displacement as (0, 0, z) into a FLOAT_VECTOR attribute."""
+    z = np.asarray(offs_z, dtype=np.float32)
+    vec = np.zeros((len(z), 3), dtype=np.float32)
+    vec[:, 2] = z
+    return write_attr_array(me, name, vec)
+
+def copy_attr_array(src_me: bpy.types.Mesh, dst_me: bpy.types.Mesh, name: str) -> int:
+    """Copy attribute `name` between meshes (leading elements); returns copied count."""
+    buf = read_attr_array(src_me, name)
+    dst = _get_any_attr(dst_me, name)
+    if buf is None or dst is None:
+        return 0
+    if not write_attr_array(dst_me, name, buf):
+        return 0
+    return min(len(buf), len(dst.data))
+
 # ---------------------------
 # Color attributes (masks etc.)
 # ---------------------------
@@ -124,7 +212,7 @@ def loop_red(me: bpy.types.Mesh, name: str, loop_index: int) -> Optional[float]:
     Returns None if attribute is not CORNER or index invalid.
     """
     a = _get_color_attr(me, name)
-    if not a:
+    if not a or getattr(a, "domain", 'CORNER') != 'CORNER':
         return None
     try:
         # color_attributes / vertex_colors both expose .data[li].color
@@ -132,6 +220,29 @@ def loop_red(me: bpy.types.Mesh, name: str, loop_index: int) -> Optional[float]:
     except Exception:
         return None
 
+def read_color_red(me: bpy.types.Mesh, name: str):
+    """
+    Bulk-read red channel of a color attribute.
+    Returns (red float32 array, domain) or (None, None) if missing.
+    """
+    a = _get_color_attr(me, name)
+    if not a:
+        return None, None
+    rgba = read_attr_array(me, name)
+    if rgba is None:
+        return None, None
+    return np.ascontiguousarray(rgba[:, 0]), getattr(a, "domain", 'CORNER')
+
+def read_sparse_red(me: bpy.types.Mesh, name: str):
+    """
+    Red channel of a color attribute as kernels.SparseMask (painted elements only).
+    Returns (sparse, domain) or (None, None) if missing.
+    """
+    red, domain = read_color_red(me, name)
+    if red is None:
+        return None, None
+    return SparseMask.from_dense(red), domain
+
 def point_red(me: bpy.types.Mesh, name: str, vert_index: int) -> Optional[float]:
     """
     Read red channel from POINT domain color attribute.
@@ -150,6 +261,44 @@ def point_red(me: bpy.types.Mesh, name: str, vert_index: int) -> Optional[float]
     return None
 
 
+def packed_loop_colors(me: bpy.types.Mesh, s, chan_map, nloops: int) -> np.ndarray:
+    """
+    (nloops, 4) float32 packed colors. Assigned channels start at 0 and only
+    the painted loops of each sparse mask are scattered in; POINT masks are
+    mapped to loops through their vertex index.
+    """
+    default_fill = 1.0 if getattr(s, 'fill_empty_vc_white', False) else 0.0
+    packed = np.full((nloops, 4), default_fill, dtype=np.float32)
+    for ch, layer_idx in chan_map.items():
+        if layer_idx is None:
+            continue  # Use default fill
+            
+        L = s.layers[layer_idx]
+        mask_name = getattr(L, 'mask_name', '')
+        
+        print(f"[MLD] Processing layer {layer_idx} channel {ch} with mask: {mask_name}")
+        
+        if not mask_name or not color_attr_exists(me, mask_name):
+            print(f"[MLD] Warning: Layer {layer_idx} channel {ch} has no mask: {mask_name}")
+            continue
+        
+        # Sparse mask (red channel): cost follows the painted area
+        sm, domain = read_sparse_red(me, mask_name)
+        if sm is None:
+            continue
+        col = "RGBA".index(ch)
+        packed[:, col] = 0.0
+        if domain == 'POINT':
+            loop_vi = np.empty(nloops, dtype=np.int64)
+            me.loops.foreach_get("vertex_index", loop_vi)
+            packed[:, col] = sm.take(loop_vi)
+        else:
+            keep = sm.indices < nloops
+            packed[sm.indices[keep], col] = sm.values[keep]
+        print(f"[MLD] Channel {ch}: {sm.nnz} painted loops ({100.0 * sm.coverage:.1f}%)")
+    return packed
+
+
 # --- Added helpers for mask/color attributes ---
 def remove_color_attr(me: bpy.types.Mesh, name: str) -> bool:
     ca = getattr(me, "color_attributes", None)
@@ -0,0 +1,237 @@
+# backend.py — kernel backend for per-loop sampling and blending (no bpy imports)
+"""
+The NumPy kernels allocate several full-size temporaries per blend step. When
+Numba is importable, fused single-pass loops (bilinear sampling, the three
+blend modes + per-vertex reduction) are compiled instead; they write straight
+into their output arrays.
+
+A self-check at startup compiles the JIT kernels and compares them with the
+NumPy ones on small random inputs; the JIT backend only becomes active when
+they agree. sample_bilinear / blend_reduce dispatch to the active backend.
+"""
+from __future__ import annotations
+import threading
+from typing import Optional
+
+import numpy as np
+from . import kernels
+
+try:
+    import numba
+except Exception:  # optional dependency
+    numba = None
+
+# ------------------------------------------------------------------------------
+# NumPy backend (reference)
+# ------------------------------------------------------------------------------
+
+def _numpy_blend_reduce(loop_vi, raws, masks, stack, table):
+    n = len(loop_vi)
+    heights, cmasks = [], []
+    for L, raw, m in zip(stack.layers, raws, masks):
+        if raw is None:
+            heights.append(np.zeros(n, dtype=np.float32)); cmasks.append(np.zeros(n, dtype=np.float32))
+        else:
+            # strength и bias слоя применяются ДО смешивания
+            heights.append(raw * np.float32(L.strength) + np.float32(L.bias)); cmasks.append(m)
+    final, alphas = kernels.blend_stack(heights, cmasks, table)
+    offs_loop = (final - np.float32(stack.midlevel)) * np.float32(stack.strength)
+    return kernels.reduce_chunk(loop_vi, [offs_loop] + alphas)
+
+# ------------------------------------------------------------------------------
+# Numba backend: same arithmetic as the NumPy kernels (float32 blends, float64
+# bilinear weights and sums), one pass per chunk, no temporaries
+# ------------------------------------------------------------------------------
+
+_MODE_CODES = {'SIMPLE': 1, 'HEIGHT_BLEND': 2, 'SWITCH': 3}  # 0 = layer never blends
+
+if numba is not None:
+
+    @numba.njit(nogil=True, cache=True)
+    def _bilinear_jit(plane, u, v, scale, out):
+        h, w = plane.shape
+        for k in range(len(u)):
+            uu = np.float64(u[k]); vv = np.float64(v[k])
+            uu = uu - np.trunc(uu)
+            if uu < 0.0:
+                uu += 1.0
+            vv = vv - np.trunc(vv)
+            if vv < 0.0:
+                vv += 1.0
+            x = uu * (w - 1); y = vv * (h - 1)
+            x0 = np.int64(x); y0 = np.int64(y)
+            tx = x - x0; ty = y - y0
+            x0 %= w; y0 %= h
+            x1 = (x0 + 1) % w; y1 = (y0 + 1) % h
+            c0 = np.float64(plane[y0, x0]) * (1.0 - tx) + np.float64(plane[y0, x1]) * tx
+            c1 = np.float64(plane[y1, x0]) * (1.0 - tx) + np.float64(plane[y1, x1]) * tx
+            val = c0 * (1.0 - ty) + c1 * ty
+            if scale != 1.0:
+                val *= scale
+            out[k] = np.float32(min(max(val, 0.0), 1.0))
+
+    @numba.njit(nogil=True, cache=True)
+    def _blend_reduce_jit(local, raws, masks, present, modes, strength, bias, offset, one_minus_offset,
+                          opacity, midlevel, gstrength, sums):
+        one = np.float32(1.0); zero = np.float32(0.0)
+        two = np.float32(2.0); three = np.float32(3.0); half = np.float32(0.5)
+        n_layers = len(present)
+        for k in range(len(local)):
+            col = local[k]
+            if present[0]:
+                m = masks[0][k]
+                cur = (raws[0][k] * strength[0] + bias[0]) * m
+            else:
+                m = zero
+                cur = zero
+            sums[1, col] += np.float64(m)
+            for i in range(1, n_layers):
+                if not present[i] or modes[i] == 0:
+                    continue
+                m = masks[i][k]
+                if m <= zero:
+                    continue
+                hh = raws[i][k] * strength[i] + bias[i]
+                mode = modes[i]
+                if mode == 1:
+                    fb = min(max(m, zero), one)
+                elif mode == 2:
+                    if offset[i] >= one:
+                        fb = m
+                    else:
+                        nd = (hh - cur + one) * half
+                        bf = min(max((nd - one_minus_offset[i]) / offset[i], zero), one)
+                        bf = bf * bf * (three - two * bf)
+                        fb = bf * m
+                else:
+                    fb = min(max(opacity[i] * m, zero), one)
+                cur = cur * (one - fb) + hh * fb
+                sums[1 + i, col] += np.float64(fb)
+            sums[0, col] += np.float64((cur - midlevel) * gstrength)
+
+def _jit_sample_bilinear(plane, u, v, scale: float = 1.0) -> np.ndarray:
+    plane = np.asarray(plane)
+    if plane.dtype == np.float16:  # no float16 arithmetic in Numba
+        return kernels.sample_bilinear(plane, u, v, scale)
+    out = np.empty(len(u), dtype=np.float32)
+    _bilinear_jit(plane, np.asarray(u), np.asarray(v), float(scale), out)
+    return out
+
+def _jit_blend_reduce(loop_vi, raws, masks, stack, table):
+    n = len(loop_vi)
+    n_layers = len(stack.layers)
+    if n == 0 or n_layers == 0:
+        return kernels.reduce_chunk(loop_vi, [np.zeros(n, dtype=np.float32)] * (1 + n_layers))
+    f32 = lambda xs: np.array(xs, dtype=np.float32)
+    empty = np.zeros(0, dtype=np.float32)
+    present = np.array([r is not None for r in raws], dtype=np.bool_)
+    modes = np.array([_MODE_CODES.get(L.blend_mode, 0) if table[i] is not None else 0
+                      for i, L in enumerate(stack.layers)], dtype=np.int8)
+    verts, local = kernels.compact_vertices(loop_vi)
+    sums = np.zeros((1 + n_layers, len(verts)), dtype=np.float64)
+    _blend_reduce_jit(
+        local,
+        tuple(empty if r is None else np.ascontiguousarray(r, dtype=np.float32) for r in raws),
+        tuple(empty if r is None else np.ascontiguousarray(m, dtype=np.float32) for r, m in zip(raws, masks)),
+        present, modes,
+        f32([L.strength for L in stack.layers]), f32([L.bias for L in stack.layers]),
+        f32([L.height_offset for L in stack.layers]), f32([1.0 - L.height_offset for L in stack.layers]),
+        f32([L.switch_opacity for L in stack.layers]),
+        np.float32(stack.midlevel), np.float32(stack.strength), sums,
+    )
+    return verts, sums
+
+# ------------------------------------------------------------------------------
+# Registry, dispatch and startup self-check
+# ------------------------------------------------------------------------------
+
+# name -> label, implementations
+BACKENDS = {
+    'NUMPY': ("NumPy", {"sample_bilinear": kernels.sample_bilinear, "blend_reduce": _numpy_blend_reduce}),
+}
+if numba is not None:
+    BACKENDS['NUMBA'] = ("Numba JIT", {"sample_bilinear": _jit_sample_bilinear, "blend_reduce": _jit_blend_reduce})
+
+_ACTIVE = {"name": 'NUMPY', "impl": BACKENDS['NUMPY'][1], "reason": "self-check not run"}
+_CHECK_LOCK = threading.Lock()
+
+def sample_bilinear(plane, u, v, scale: float = 1.0) -> np.ndarray:
+    """kernels.sample_bilinear on the active backend."""
+    return _ACTIVE["impl"]["sample_bilinear"](plane, u, v, scale)
+
+def blend_reduce(loop_vi, raws, masks, stack, table):
+    """Blend one loop chunk (None = disabled layer) and return its per-vertex partial sums."""
+    return _ACTIVE["impl"]["blend_reduce"](loop_vi, raws, masks, stack, table)
+
+def active_backend() -> str:
+    return _ACTIVE["name"]
+
+def backend_info() -> dict:
+    """Active backend name, UI label and why it was chosen."""
+    return {"name": _ACTIVE["name"], "label": BACKENDS[_ACTIVE["name"]][0], "reason": _ACTIVE["reason"]}
+
+def _self_check_inputs(seed: int = 7):
+    rng = np.random.default_rng(seed)
+    lum = rng.random((13, 17), dtype=np.float32)
+    planes = [kernels.encode_plane(lum, st) for st in ('FLOAT32', 'UINT16')]
+    u = (rng.random(257) * 6.0 - 3.0).astype(np.float32)
+    v = (rng.random(257) * 6.0 - 3.0).astype(np.float32)
+    layers = tuple(
+        kernels.LayerParams(True, mode, float(rng.uniform(-2, 2)), float(rng.uniform(-0.5, 0.5)), 1.0, off, op, "")
+        for mode, off, op in (('SIMPLE', 0.5, 1.0), ('HEIGHT_BLEND', 0.35, 1.0), ('HEIGHT_BLEND', 1.0, 1.0),
+                              ('SWITCH', 0.5, 0.6), ('HEIGHT_BLEND', 0.0, 1.0), ('SIMPLE', 0.5, 1.0))
+    )
+    stack = kernels.StackParams(layers, 0.7, 0.4)
+    n = 509
+    loop_vi = np.sort(rng.integers(0, 97, n)).astype(np.int32)
+    raws = [rng.random(n, dtype=np.float32) for _ in layers]
+    raws[5] = None
+    masks = [np.where(rng.random(n) < 0.4, 0.0, rng.choice([1.0, 0.5, 0.25], n)).astype(np.float32)
+             for _ in layers]
+    masks[3][:] = 0.0
+    return planes, u, v, (loop_vi, raws, masks, stack, kernels.compile_blend_table(stack))
+
+def self_check(name: str) -> Optional[str]:
+    """None when backend `name` matches the NumPy kernels, else the reason it does not."""
+    impl = BACKENDS[name][1]
+    ref = BACKENDS['NUMPY'][1]
+    try:
+        planes, u, v, blend_args = _self_check_inputs()
+        for plane, scale in planes:
+            a = impl["sample_bilinear"](plane, u, v, scale)
+            b = ref["sample_bilinear"](plane, u, v, scale)
+            if a.dtype != b.dtype or not np.allclose(a, b, rtol=0.0, atol=1e-6):
+                return f"bilinear mismatch ({plane.dtype})"
+        verts_a, sums_a = impl["blend_reduce"](*blend_args)
+        verts_b, sums_b = ref["blend_reduce"](*blend_args)
+        if not np.array_equal(verts_a, verts_b) or sums_a.shape != sums_b.shape or not np.allclose(sums_a, sums_b, rtol=1e-6, atol=1e-6):
+            return "blend mismatch"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def select_backend() -> str:
+    """Startup self-check: activate the fastest backend whose kernels match the NumPy reference."""
+    with _CHECK_LOCK:
+        chosen, reason = 'NUMPY', "Numba not installed" if numba is None else ""
+        for name in BACKENDS:
+            if name == 'NUMPY':
+                continue
+            failure = self_check(name)
+            if failure is None:
+                chosen, reason = name, "self-check passed"
+                break
+            reason = f"{BACKENDS[name][0]} self-check failed: {failure}"
+        _ACTIVE.update(name=chosen, impl=BACKENDS[chosen][1], reason=reason)
+    print(f"[MLD] Kernel backend: {BACKENDS[chosen][0]} ({reason})")
+    return chosen
+
+def register():
+    # compiling takes a moment on first run: check off the main thread, NumPy meanwhile
+    if len(BACKENDS) > 1:
+        threading.Thread(target=select_backend, daemon=True).start()
+    else:
+        select_backend()
+
+def unregister():
+    _ACTIVE.update(name='NUMPY', impl=BACKENDS['NUMPY'][1], reason="self-check not run")
@@ -0,0 +1,232 @@
+# cache.py — content fingerprints and per-layer height sample cache
+"""
+Recalculate keeps the per-loop height samples of every layer between runs.
+A layer is only resampled when one of its inputs changed:
+image identity / pixel generation, UV content, tiling or mesh topology.
+The last solve's results and mask block hashes are kept for incremental recalc,
+and the per-stage input keys let Recalculate skip stages that are up to date.
+"""
+from __future__ import annotations
+import bpy
+import os
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from .constants import DEFAULT_LAYER_SAMPLE_CACHE_MB
+
+# ------------------------------------------------------------------------------
+# Image pixel generations (bumped whenever the depsgraph reports an image update)
+# ------------------------------------------------------------------------------
+
+_IMAGE_GENERATION: Dict[int, int] = {}
+
+def bump_image_generation(img) -> int:
+    key = img.as_pointer()
+    gen = _IMAGE_GENERATION.get(key, 0) + 1
+    _IMAGE_GENERATION[key] = gen
+    return gen
+
+def image_generation(img) -> int:
+    return _IMAGE_GENERATION.get(img.as_pointer(), 0)
+
+def image_file_stat(img) -> Optional[Tuple[str, int, int]]:
+    """
+    (absolute path, mtime_ns, size) of an unmodified file-backed image, None otherwise.
+    Only os.stat is used: reading img.size / img.channels makes Blender load and
+    decode the file.
+    """
+    if getattr(img, "source", None) != 'FILE' or getattr(img, "packed_file", None):
+        return None
+    if getattr(img, "is_dirty", False):
+        return None
+    try:
+        src = os.path.normcase(os.path.abspath(bpy.path.abspath(img.filepath, library=img.library)))
+        st = os.stat(src)
+    except Exception:
+        return None
+    return src, st.st_mtime_ns, st.st_size
+
+def image_fingerprint(img) -> Tuple:
+    """Identity + pixel generation of an image datablock (file images: by file stat, not decoded)."""
+    content = image_file_stat(img)
+    if content is None:
+        try:
+            size = (int(img.size[0]), int(img.size[1]))
+        except Exception:
+            size = (0, 0)
+        content = (size, int(getattr(img, "channels", 4)))
+    return (
+        img.as_pointer(), getattr(img, "session_uid", 0), getattr(img, "name_full", img.name),
+        content, getattr(img, "filepath", ""), image_generation(img),
+    )
+
+@bpy.app.handlers.persistent
+def _on_depsgraph_update(scene, depsgraph):
+    try:
+        for upd in depsgraph.updates:
+            if isinstance(upd.id, bpy.types.Image):
+                bump_image_generation(upd.id.original)
+    except Exception:
+        pass
+
+# ------------------------------------------------------------------------------
+# Array digests
+# ------------------------------------------------------------------------------
+
+def array_digest(arr: np.ndarray, *extra) -> str:
+    """Short content hash of an array (plus optional scalars, e.g. counts)."""
+    h = hashlib.blake2b(digest_size=16)
+    a = np.ascontiguousarray(arr)
+    h.update(str((a.dtype.str, a.shape) + tuple(extra)).encode())
+    h.update(a.view(np.uint8).reshape(-1) if a.size else b"")
+    return h.hexdigest()
+
+def block_digests(arr: np.ndarray, block: int) -> np.ndarray:
+    """64-bit content hash of every `block` consecutive elements (last block may be short)."""
+    a = np.ascontiguousarray(arr)
+    raw = a.reshape(-1).view(np.uint8)
+    step = max(1, int(block)) * a.itemsize
+    nb = (len(raw) + step - 1) // step
+    out = np.empty(nb, dtype=np.uint64)
+    for b in range(nb):
+        out[b] = int.from_bytes(hashlib.blake2b(raw[b * step:(b + 1) * step], digest_size=8).digest(), "little")
+    return out
+
+# ------------------------------------------------------------------------------
+# Per-layer sample cache: (object, layer index) -> (key, raw per-loop samples, valid loops)
+# valid is None when every loop was sampled; culled solves only sample some loops.
+# LRU under a memory budget, like the sampler cache.
+# ------------------------------------------------------------------------------
+
+_LAYER_SAMPLES: "OrderedDict[Tuple[str, int], Tuple[Tuple, np.ndarray, Optional[np.ndarray]]]" = OrderedDict()
+_LAYER_SAMPLES_BUDGET = DEFAULT_LAYER_SAMPLE_CACHE_MB * 1024 * 1024  # bytes
+_LAYER_SAMPLES_STATS = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+def _entry_nbytes(entry) -> int:
+    _, samples, valid = entry
+    return int(samples.nbytes) + (int(valid.nbytes) if valid is not None else 0)
+
+def _drop_layer_entry(k):
+    _LAYER_SAMPLES_STATS["bytes"] -= _entry_nbytes(_LAYER_SAMPLES.pop(k))
+
+def _evict_layer_samples(budget: int):
+    while _LAYER_SAMPLES and _LAYER_SAMPLES_STATS["bytes"] > budget:
+        _, old = _LAYER_SAMPLES.popitem(last=False)
+        _LAYER_SAMPLES_STATS["bytes"] -= _entry_nbytes(old)
+        _LAYER_SAMPLES_STATS["evictions"] += 1
+
+def set_layer_sample_budget(megabytes: float):
+    """Set the layer sample cache budget (MB) and evict down to it."""
+    global _LAYER_SAMPLES_BUDGET
+    _LAYER_SAMPLES_BUDGET = max(0, int(float(megabytes) * 1024 * 1024))
+    _evict_layer_samples(_LAYER_SAMPLES_BUDGET)
+
+def layer_sample_stats() -> dict:
+    return dict(_LAYER_SAMPLES_STATS, entries=len(_LAYER_SAMPLES), budget=_LAYER_SAMPLES_BUDGET)
+
+def get_layer_samples(obj, layer_index: int, key: Tuple) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """(samples, valid) for a matching key, else None."""
+    k = (obj.name, layer_index)
+    hit = _LAYER_SAMPLES.get(k)
+    if hit is not None and hit[0] == key:
+        _LAYER_SAMPLES.move_to_end(k)
+        _LAYER_SAMPLES_STATS["hits"] += 1
+        return hit[1], hit[2]
+    _LAYER_SAMPLES_STATS["misses"] += 1
+    return None
+
+def store_layer_samples(obj, layer_index: int, key: Tuple, samples: np.ndarray,
+                        valid: Optional[np.ndarray] = None):
+    k = (obj.name, layer_index)
+    if k in _LAYER_SAMPLES:
+        _drop_layer_entry(k)
+    entry = (key, samples, valid)
+    if _entry_nbytes(entry) > _LAYER_SAMPLES_BUDGET:
+        return  # larger than the whole budget: not cached
+    _LAYER_SAMPLES[k] = entry
+    _LAYER_SAMPLES_STATS["bytes"] += _entry_nbytes(entry)
+    _evict_layer_samples(_LAYER_SAMPLES_BUDGET)
+
+def _object_gone(name: str) -> bool:
+    try:
+        return bpy.data.objects.get(name) is None
+    except Exception:
+        return False
+
+def prune_layer_samples(obj, n_layers: int):
+    """Drop entries for layers that no longer exist on the object and for deleted/renamed objects."""
+    gone = {name for name in {k[0] for k in _LAYER_SAMPLES} if name != obj.name and _object_gone(name)}
+    for k in [k for k in _LAYER_SAMPLES if k[0] in gone or (k[0] == obj.name and k[1] >= n_layers)]:
+        _drop_layer_entry(k)
+
+def clear_layer_samples(obj=None):
+    if obj is None:
+        _LAYER_SAMPLES.clear()
+        _LAYER_SAMPLES_STATS.update(hits=0, misses=0, evictions=0, bytes=0)
+        return
+    for k in [k for k in _LAYER_SAMPLES if k[0] == obj.name]:
+        _drop_layer_entry(k)
+
+# ------------------------------------------------------------------------------
+# Solve state for incremental recalc: object -> inputs signature, per-layer mask
+# block hashes and the previous per-vertex results
+# ------------------------------------------------------------------------------
+
+_SOLVE_STATE: Dict[str, dict] = {}
+
+def get_solve_state(obj) -> Optional[dict]:
+    return _SOLVE_STATE.get(obj.name)
+
+def store_solve_state(obj, state: dict):
+    _SOLVE_STATE[obj.name] = state
+
+def clear_solve_state(obj=None):
+    if obj is None:
+        _SOLVE_STATE.clear()
+    else:
+        _SOLVE_STATE.pop(obj.name, None)
+
+# ------------------------------------------------------------------------------
+# Recalculate stage memo: object -> {stage: key of the inputs it last ran with}
+# ------------------------------------------------------------------------------
+
+_STAGE_KEYS: Dict[str, Dict[str, Tuple]] = {}
+
+def get_stage_keys(obj) -> Dict[str, Tuple]:
+    return dict(_STAGE_KEYS.get(obj.name, {}))
+
+def store_stage_keys(obj, keys: Dict[str, Tuple]):
+    _STAGE_KEYS[obj.name] = dict(keys)
+
+def clear_stage_keys(obj=None):
+    if obj is None:
+        _STAGE_KEYS.clear()
+    else:
+        _STAGE_KEYS.pop(obj.name, None)
+
+@bpy.app.handlers.persistent
+def _on_undo_redo(scene, *args):
+    # undo / redo reverts MLD_Offs, MLD_A_* and the carrier but not these memos:
+    # forget them so the next Recalculate does not skip stages or reuse old results
+    _STAGE_KEYS.clear()
+    _SOLVE_STATE.clear()
+
+_HANDLERS = (("depsgraph_update_post", _on_depsgraph_update),
+             ("undo_post", _on_undo_redo), ("redo_post", _on_undo_redo))
+
+def register():
+    for name, fn in _HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if fn not in handlers:
+            handlers.append(fn)
+
+def unregister():
+    for name, fn in _HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if fn in handlers:
+            handlers.remove(fn)
+    clear_layer_samples()
+    _SOLVE_STATE.clear()
+    _STAGE_KEYS.clear()
+    _IMAGE_GENERATION.clear()
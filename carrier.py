@@ -4,6 +4,7 @@ import bmesh
 from mathutils import Matrix
 from .constants import OFFS_ATTR, ALPHA_PREFIX
 from .utils import ensure_visible
+from .attrs import write_attr_array
 
 def ensure_point_attr(mesh: bpy.types.Mesh, name: str, dtype='FLOAT'):
     try:
@@ -60,17 +61,15 @@ def write_offs_on_carrier(carr: bpy.types.Object, per_vert_scalar: list, normal_
     me_c = carr.data
     ensure_point_attr(me_c, OFFS_ATTR, 'FLOAT_VECTOR')
     bm = bmesh.new(); bm.from_mesh(normal_source_mesh); bm.verts.ensure_lookup_table(); bm.normal_update()
+    vecs = [0.0] * (len(bm.verts) * 3)
     for v in bm.verts:
         d = float(per_vert_scalar[v.index]) if v.index < len(per_vert_scalar) else 0.0
         if d != 0.0:
-            n = v.normal.normalized(); vec = (n.x*d, n.y*d, n.z*d)
-        else:
-            vec = (0.0,0.0,0.0)
-        try:
-            me_c.attributes[OFFS_ATTR].data[v.index].vector = vec
-        except Exception:
-            pass
-    bm.free(); me_c.update()
+            n = v.normal.normalized()
+            vecs[v.index*3:v.index*3+3] = (n.x*d, n.y*d, n.z*d)
+    bm.free()
+    write_attr_array(me_c, OFFS_ATTR, vecs)
+    me_c.update()
 
 def write_alphas_on_carrier(carr: bpy.types.Object, alphas_per_layer: list):
     """Store per-layer alpha weights as point-float attributes on carrier."""
@@ -78,10 +77,7 @@ def write_alphas_on_carrier(carr: bpy.types.Object, alphas_per_layer: list):
     for i, arr in enumerate(alphas_per_layer):
         name = f"{ALPHA_PREFIX}{i}"
         ensure_point_attr(me, name, 'FLOAT')
-        data = me.attributes[name].data
-        for vi, val in enumerate(arr):
-            if vi < len(data):
-                data[vi].value = float(val)
+        write_attr_array(me, name, arr)
     me.update()
 
 def register():
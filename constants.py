@@ -26,6 +26,22 @@ DEFAULT_STRENGTH = 0.25
 DEFAULT_MIDLEVEL = 0.50
 DEFAULT_FILL_POWER = 1.0
 
+# Heightfill engine defaults
+DEFAULT_HEIGHTFILL_ENGINE = 'NUMPY'
+DEFAULT_SAMPLER_PRECISION = 'FLOAT32'
+DEFAULT_SAMPLING_FILTER = 'BILINEAR'
+DEFAULT_SAMPLER_CACHE_MB = 1024
+DEFAULT_LAYER_SAMPLE_CACHE_MB = 256
+DEFAULT_DISK_CACHE_ENABLE = False
+DEFAULT_HEIGHTFILL_THREADS = 0        # 0 = all cores
+DEFAULT_HEIGHTFILL_CHUNK = 262144      # loops per work chunk
+DEFAULT_HEIGHTFILL_MEMORY_MB = 2048    # STREAMING engine budget
+DEFAULT_INCREMENTAL_RECALC = True
+DEFAULT_HEIGHTFILL_WORKER = False       # NUMPY engine in a persistent worker process
+DEFAULT_RECALC_SCOPE = 'ALL'           # ALL / SELECTED / VERTEX_GROUP
+DEFAULT_RECALC_VERTEX_GROUP = ""
+INCREMENTAL_BLOCK_LOOPS = 4096         # mask hash granularity for incremental recalc
+
 
 
 # Material assignment settings defaults
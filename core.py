@@ -0,0 +1,325 @@
+# core.py — headless MLD core: plain arrays in, OFFS and alphas out (no bpy imports)
+"""
+The heightfill without Blender. solve_arrays takes per-loop UVs and vertex
+indices, per-loop layer masks, height planes and layer parameters and returns
+the per-vertex OFFS.z height and one alpha per layer — the values Recalculate
+writes to MLD_Offs / MLD_A_*. heightfill.py is the Blender adapter over
+new_job / plan_job (mesh and attribute reads, caches, incremental state).
+
+Also holds the per-loop scalar reference of the blend modes and of bilinear
+sampling (the Python engine); kernels.py and backend.py vectorize them.
+
+    from mld_tool import core
+    offs_z, alphas = core.solve_arrays(uv, loop_vi, vcount, masks, planes,
+                                       [{"blend_mode": 'SIMPLE'}, {"blend_mode": 'HEIGHT_BLEND', "height_offset": 0.5}])
+"""
+from __future__ import annotations
+import numpy as np
+from typing import Callable, List, Optional, Sequence, Tuple
+from . import kernels, solver
+from .constants import DEFAULT_HEIGHTFILL_CHUNK
+
+# ------------------------------------------------------------------------------
+# Scalar reference (Python engine)
+# ------------------------------------------------------------------------------
+
+# blend_mode -> binder(layer) -> callable(base, height, mask) -> (height, alpha)
+SCALAR_BLENDS = {
+    'SIMPLE': lambda L: apply_simple_blend,
+    'HEIGHT_BLEND': lambda L: (lambda b, h, m, off=L.height_offset: apply_height_blend(b, h, m, off)),
+    'SWITCH': lambda L: (lambda b, h, m, op=L.switch_opacity: apply_switch_blend(b, h, m, op)),
+}
+
+def compile_scalar_blend_table(layers):
+    """Scalar counterpart of kernels.compile_blend_table (None = skipped layer)."""
+    table = []
+    for L in layers:
+        bind = SCALAR_BLENDS.get(L.blend_mode) if L.enabled else None
+        table.append(bind(L) if bind else None)
+    return table
+
+def blend_layers_scalar(layer_data, table=None):
+    """
+    НОВАЯ СИСТЕМА СМЕШИВАНИЯ с Height Blend и Switch modes.
+    
+    Args:
+        layer_data: List of dicts with 'height', 'mask', 'layer' for each layer
+        table: per-layer blend callables from compile_scalar_blend_table (built here if None)
+    
+    Returns:
+        (final_height, alphas_list)
+    """
+    if not layer_data:
+        return 0.0, []
+    
+    n_layers = len(layer_data)
+    alphas = [0.0] * n_layers
+    
+    # Начинаем с первого слоя (базовый слой, без смешивания)
+    current_height = layer_data[0]['height'] * layer_data[0]['mask']
+    alphas[0] = layer_data[0]['mask']
+    
+    if table is None:
+        table = compile_scalar_blend_table(ld['layer'] for ld in layer_data)
+
+    # Смешиваем последующие слои
+    for i in range(1, n_layers):
+        layer = layer_data[i]
+        blend = table[i]
+
+        # Пропускаем отключенные слои или слои без маски
+        if blend is None or layer['mask'] <= 0.0:
+            continue
+
+        current_height, alphas[i] = blend(current_height, layer['height'], layer['mask'])
+    
+    return current_height, alphas
+
+def apply_simple_blend(base_height, layer_height, layer_mask):
+    """
+    Применить простое смешивание по маске.
+    
+    Args:
+        base_height: Высота от слоев ниже
+        layer_height: Высота текущего слоя
+        layer_mask: Сила маски (0-1) - прямое управление смешиванием
+    
+    Returns:
+        (blended_height, alpha_contribution)
+    """
+    if layer_mask <= 0.0:
+        return base_height, 0.0
+    
+    # Прямое использование маски как blend factor
+    final_blend = max(0.0, min(1.0, layer_mask))
+    
+    # Простая линейная интерполяция
+    blended_height = base_height * (1.0 - final_blend) + layer_height * final_blend
+    
+    return blended_height, final_blend
+
+def apply_height_blend(base_height, layer_height, layer_mask, height_offset):
+    """
+    Применить Height Blend в стиле Substance Designer.
+    
+    Args:
+        base_height: Высота от слоев ниже
+        layer_height: Высота текущего слоя  
+        layer_mask: Сила маски (0-1)
+        height_offset: Порог высоты (0-1)
+    
+    Returns:
+        (blended_height, alpha_contribution)
+    """
+    if layer_mask <= 0.0:
+        return base_height, 0.0
+    
+    # Расчет разности высот
+    height_diff = layer_height - base_height
+    
+    # Применяем height_offset как порог
+    # При offset=0: слой никогда не проступает
+    # При offset=1: слой всегда проступает полностью
+    # При offset=0.5: сбалансированное смешивание на основе разности высот
+    
+    # Преобразуем height_offset в blend_factor
+    # Это имитирует поведение height blend из Substance Designer
+    if height_offset <= 0.0:
+        blend_factor = 0.0
+    elif height_offset >= 1.0:
+        blend_factor = 1.0
+    else:
+        # Плавное смешивание на основе разности высот и offset
+        # Offset действует как смещение - больший offset означает, что слой проступает легче
+        normalized_diff = (height_diff + 1.0) * 0.5  # Нормализуем в диапазон 0-1
+        
+        # Создаем S-образную кривую для более естественного смешивания
+        # height_offset контролирует точку перехода
+        blend_factor = max(0.0, min(1.0, 
+            (normalized_diff - (1.0 - height_offset)) / height_offset
+        ))
+        
+        # Сглаживание с помощью smoothstep
+        if blend_factor > 0.0 and blend_factor < 1.0:
+            blend_factor = blend_factor * blend_factor * (3.0 - 2.0 * blend_factor)
+    
+    # Применяем маску к blend_factor
+    final_blend = blend_factor * layer_mask
+    
+    # Линейная интерполяция
+    blended_height = base_height * (1.0 - final_blend) + layer_height * final_blend
+    
+    return blended_height, final_blend
+
+def apply_switch_blend(base_height, layer_height, layer_mask, switch_opacity):
+    """
+    Применить простое Switch/lerp смешивание.
+    
+    Args:
+        base_height: Высота от слоев ниже
+        layer_height: Высота текущего слоя
+        layer_mask: Сила маски (0-1) 
+        switch_opacity: Фактор переключения (0-1)
+    
+    Returns:
+        (blended_height, alpha_contribution)
+    """
+    if layer_mask <= 0.0 or switch_opacity <= 0.0:
+        return base_height, 0.0
+    
+    # Комбинируем switch opacity с маской слоя
+    final_blend = switch_opacity * layer_mask
+    final_blend = max(0.0, min(1.0, final_blend))
+    
+    # Простая линейная интерполяция
+    blended_height = base_height * (1.0 - final_blend) + layer_height * final_blend
+    
+    return blended_height, final_blend
+
+# ------------------------------------------------------------------------------
+# Scalar bilinear sampling
+# ------------------------------------------------------------------------------
+
+def _pix(plane, w, h, x, y):
+    return plane[y % h, x % w]
+
+def sample_bilinear_scalar(sampler, u: float, v: float) -> float:
+    """Per-sample reference of kernels.sample_bilinear (sampler dict as built by sampling.make_sampler)."""
+    w = sampler["w"]; h = sampler["h"]; plane = sampler["plane"]
+    u = u - int(u); v = v - int(v)
+    if u < 0: u += 1.0
+    if v < 0: v += 1.0
+    x = u * (w - 1); y = v * (h - 1)
+    x0 = int(x); y0 = int(y)
+    x1 = (x0 + 1) % w; y1 = (y0 + 1) % h
+    tx = x - x0; ty = y - y0
+    c00 = float(_pix(plane, w, h, x0, y0))
+    c10 = float(_pix(plane, w, h, x1, y0))
+    c01 = float(_pix(plane, w, h, x0, y1))
+    c11 = float(_pix(plane, w, h, x1, y1))
+    c0 = c00*(1-tx) + c10*tx
+    c1 = c01*(1-tx) + c11*tx
+    val = (c0*(1-ty) + c1*ty) * sampler["scale"]
+    return max(0.0, min(1.0, float(val)))
+
+# ------------------------------------------------------------------------------
+# Array solve
+# ------------------------------------------------------------------------------
+
+_LAYER_DEFAULTS = dict(enabled=True, blend_mode='SIMPLE', strength=1.0, bias=0.0, tiling=1.0,
+                       height_offset=0.5, switch_opacity=1.0, mask_name="")
+
+def make_stack(layers: Sequence, strength: float = 1.0, midlevel: float = 0.0) -> kernels.StackParams:
+    """StackParams from LayerParams or dicts (missing keys take the MLD_Layer defaults)."""
+    return kernels.StackParams(
+        layers=tuple(L if isinstance(L, kernels.LayerParams) else kernels.LayerParams(**dict(_LAYER_DEFAULTS, **L))
+                     for L in layers),
+        strength=float(strength), midlevel=float(midlevel),
+    )
+
+def make_plane_sampler(plane, storage: str = 'FLOAT32') -> Optional[dict]:
+    """Sampler dict (see sampling.make_sampler) from a 2D height plane; dicts pass through."""
+    if plane is None or isinstance(plane, dict):
+        return plane
+    lum = np.asarray(plane, dtype=np.float32)
+    if lum.ndim != 2 or lum.size == 0:
+        raise ValueError(f"height plane must be a non-empty 2D array, got shape {lum.shape}")
+    enc, scale = kernels.encode_plane(lum, storage)
+    return {"w": lum.shape[1], "h": lum.shape[0], "plane": enc, "scale": scale, "storage": storage}
+
+def loop_data(uv: np.ndarray, filt: str = 'BILINEAR', footprint: Optional[np.ndarray] = None,
+              threads: int = 1, chunk: int = DEFAULT_HEIGHTFILL_CHUNK) -> dict:
+    """Per-solve loop data shared by every layer (the unique UV set is added on first use)."""
+    return {"uv": uv, "filter": filt, "footprint": footprint, "unique": None,
+            "threads": kernels.resolve_threads(threads), "chunk": max(1024, int(chunk))}
+
+def new_job(stack: kernels.StackParams, ld: dict, loop_vi: np.ndarray, vcount: int) -> dict:
+    """Empty solve job; plan_job adds the masks and sample plans, solver.run_job the result."""
+    return {"stack": stack, "table": kernels.compile_blend_table(stack), "ld": ld, "loop_vi": loop_vi,
+            "nloops": len(loop_vi), "vcount": int(vcount), "n_layers": len(stack.layers),
+            "stats": {"sampled": 0, "cached": 0, "coords": 0}, "result": None, "state": None}
+
+def plan_job(job: dict, smasks: Sequence[Optional[kernels.SparseMask]],
+             make_plan: Callable[[int, kernels.LayerParams, np.ndarray], Optional[dict]],
+             region: Optional[Tuple[np.ndarray, np.ndarray]] = None, alphas_only: bool = False):
+    """
+    Lay the sparse per-loop masks (None = disabled layer) over the painted loops,
+    cull heights that cannot change the result and ask make_plan(i, layer, need)
+    for each layer's sample plan (need = loop indices that must be sampled).
+    region = (loops, vertices) restricts blending to those loops (job["state"] holds
+    the previous result for the other vertices). Sets job["needed"] for statistics.
+    alphas_only: only the alphas of the result are used (the height may be wrong).
+    """
+    stack, table = job["stack"], job["table"]
+    support = kernels.sparse_support(smasks)
+    if region is None:
+        loops_r, verts_r = None, None
+        sup_r = support
+        masks = [None if m is None else kernels.scatter_to_support(m, sup_r) for m in smasks]
+    else:
+        loops_r, verts_r = region
+        sup_r = np.intersect1d(support, loops_r, assume_unique=True)
+        masks = [None if m is None else m.take(sup_r) for m in smasks]
+    needed = (kernels.plan_alpha_culling if alphas_only else kernels.plan_culling)(stack, masks, table)
+    plans = [None if masks[i] is None else make_plan(i, L, sup_r[needed[i]]) for i, L in enumerate(stack.layers)]
+    job.update(support=support, n_support=len(support), sup_r=sup_r, masks=masks, verts_r=verts_r,
+               plans=plans, needed=needed, n_region=job["nloops"] if loops_r is None else len(loops_r))
+    return job
+
+def _as_sparse(mask, nloops: int) -> kernels.SparseMask:
+    if mask is None:
+        return kernels.SparseMask.empty(nloops)
+    if isinstance(mask, kernels.SparseMask):
+        return mask
+    mask = np.asarray(mask, dtype=np.float32).reshape(-1)
+    if len(mask) != nloops:
+        raise ValueError(f"mask has {len(mask)} values for {nloops} loops")
+    return kernels.SparseMask.from_dense(mask)
+
+def solve_arrays(uv, loop_vi, vcount: int, masks: Sequence, planes: Sequence, layers: Sequence,
+                 strength: float = 1.0, midlevel: float = 0.0, filt: str = 'BILINEAR',
+                 loop_start=None, loop_total=None, threads: int = 1,
+                 chunk: int = DEFAULT_HEIGHTFILL_CHUNK) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Heightfill on plain arrays.
+      uv        : (nloops, 2) per-loop UVs
+      loop_vi   : (nloops,) vertex index of each loop
+      masks     : per layer, (nloops,) mask values, a kernels.SparseMask or None (unpainted)
+      planes    : per layer, 2D height plane (row 0 = v 0), sampler dict or None (no image)
+      layers    : per layer, LayerParams or dict of MLD_Layer values
+      strength, midlevel : global blend values; the defaults give the raw height OFFS.z stores
+      filt      : 'BILINEAR' or 'PREFILTERED' (needs polygon loop_start / loop_total)
+    Returns (offs_z, alphas) as per-vertex float32 arrays, same as the NUMPY engine.
+    """
+    uv = np.ascontiguousarray(uv, dtype=np.float32).reshape(-1, 2)
+    loop_vi = np.ascontiguousarray(loop_vi, dtype=np.int32).reshape(-1)
+    nloops = len(loop_vi)
+    if len(uv) != nloops:
+        raise ValueError(f"{len(uv)} UVs for {nloops} loops")
+    stack = make_stack(layers, strength, midlevel)
+    if not (len(masks) == len(planes) == len(stack.layers)):
+        raise ValueError("masks, planes and layers need one entry per layer")
+    footprint = None
+    if filt == 'PREFILTERED':
+        if loop_start is None or loop_total is None:
+            raise ValueError("PREFILTERED sampling needs polygon loop_start and loop_total")
+        footprint = kernels.face_uv_footprint(uv, np.asarray(loop_start, dtype=np.int64),
+                                              np.asarray(loop_total, dtype=np.int64))
+    samplers = [make_plane_sampler(p) for p in planes]
+
+    def make_plan(i, L, need):
+        sp = samplers[i]
+        if sp is None:
+            return None
+        plan = solver.sample_plan(i, None, None, max(1e-8, L.tiling), need)
+        plan["sampler"] = sp
+        if filt == 'PREFILTERED':
+            if "mips" not in sp:
+                sp["mips"] = kernels.build_mip_pyramid(sp["plane"], sp["scale"])
+            plan["mips"] = sp["mips"]
+        return plan
+
+    job = new_job(stack, loop_data(uv, filt, footprint, threads, chunk), loop_vi, vcount)
+    plan_job(job, [_as_sparse(m, nloops) if L.enabled else None for m, L in zip(masks, stack.layers)], make_plan)
+    solver.run_job(job)
+    return job["result"]
@@ -2,12 +2,64 @@
 
 from __future__ import annotations
 import bpy
-from .constants import OFFS_ATTR, GN_MOD_NAME
+from .constants import OFFS_ATTR, GN_MOD_NAME, DEFAULT_STRENGTH, DEFAULT_MIDLEVEL
+
+# OFFS.z holds the raw blended height; the graph applies (height - Midlevel) * Strength,
+# so the global sliders only touch modifier inputs.
+GN_STRENGTH_INPUT = "Strength"
+GN_MIDLEVEL_INPUT = "Midlevel"
 
 def _make_group_interface_45(ng: bpy.types.NodeTree):
     iface = ng.interface
     iface.new_socket(name="Geometry", in_out='INPUT',  socket_type='NodeSocketGeometry')
     iface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    _ensure_param_sockets(ng)
+
+def _ensure_param_sockets(ng: bpy.types.NodeTree) -> bool:
+    """Add Strength/Midlevel float inputs if missing. Returns True when the interface changed."""
+    iface = ng.interface
+    names = {it.name for it in iface.items_tree if getattr(it, "in_out", None) == 'INPUT'}
+    changed = False
+    for name, default in ((GN_STRENGTH_INPUT, DEFAULT_STRENGTH), (GN_MIDLEVEL_INPUT, DEFAULT_MIDLEVEL)):
+        if name not in names:
+            sock = iface.new_socket(name=name, in_out='INPUT', socket_type='NodeSocketFloat')
+            sock.default_value = default
+            changed = True
+    return changed
+
+def _height_to_offset(nodes, links, n_in, height_socket, loc=(0, 0)):
+    """(height - Midlevel) * Strength from group inputs; returns the output socket."""
+    n_sub = nodes.new("ShaderNodeMath"); n_sub.location = (loc[0], loc[1])
+    n_sub.operation = 'SUBTRACT'
+    n_mul = nodes.new("ShaderNodeMath"); n_mul.location = (loc[0] + 160, loc[1])
+    n_mul.operation = 'MULTIPLY'
+    links.new(height_socket, n_sub.inputs[0])
+    links.new(n_in.outputs[GN_MIDLEVEL_INPUT], n_sub.inputs[1])
+    links.new(n_sub.outputs["Value"], n_mul.inputs[0])
+    links.new(n_in.outputs[GN_STRENGTH_INPUT], n_mul.inputs[1])
+    return n_mul.outputs["Value"]
+
+def set_gn_inputs(obj: bpy.types.Object, strength: float, midlevel: float) -> bool:
+    """Push global Strength/Midlevel into the MLD modifier (no re-solve needed)."""
+    md = obj.modifiers.get(GN_MOD_NAME) if obj else None
+    ng = getattr(md, "node_group", None)
+    if ng is None:
+        return False
+    try:
+        ids = {it.name: it.identifier for it in ng.interface.items_tree
+               if getattr(it, "in_out", None) == 'INPUT'}
+        changed = False
+        for name, value in ((GN_STRENGTH_INPUT, strength), (GN_MIDLEVEL_INPUT, midlevel)):
+            key = ids.get(name)
+            if key is not None and md.get(key) != float(value):
+                md[key] = float(value)
+                changed = True
+        if changed:
+            obj.update_tag()
+        return True
+    except Exception as e:
+        print(f"[MLD] Failed to set GN inputs: {e}")
+        return False
 
 def _build_carrier_reader_graph(ng: bpy.types.NodeTree, obj: bpy.types.Object):
     """Build GN graph that reads displacement from carrier mesh."""
@@ -64,9 +116,9 @@ def _build_carrier_reader_graph(ng: bpy.types.NodeTree, obj: bpy.types.Object):
     links.new(n_named.outputs["Attribute"], n_sample_index.inputs["Value"])
     links.new(n_index.outputs["Index"], n_sample_index.inputs["Index"])
     
-    # Process displacement
+    # Process displacement: raw height -> (h - Midlevel) * Strength
     links.new(n_sample_index.outputs["Value"], n_sep.inputs["Vector"])
-    links.new(n_sep.outputs["Z"], n_vmath.inputs["Scale"])
+    links.new(_height_to_offset(nodes, links, n_in, n_sep.outputs["Z"], loc=(-200, -200)), n_vmath.inputs["Scale"])
     links.new(n_normal.outputs["Normal"], n_vmath.inputs["Vector"])
     links.new(n_vmath.outputs["Vector"], n_set.inputs["Offset"])
     
@@ -100,7 +152,7 @@ def _build_simple_graph(ng: bpy.types.NodeTree):
     # Connections
     links.new(n_in.outputs["Geometry"],        n_set.inputs["Geometry"])
     links.new(n_named.outputs["Attribute"],    n_sep.inputs["Vector"])
-    links.new(n_sep.outputs["Z"],              n_vmath.inputs["Scale"])
+    links.new(_height_to_offset(nodes, links, n_in, n_sep.outputs["Z"], loc=(-160, -320)), n_vmath.inputs["Scale"])
     links.new(n_normal.outputs["Normal"],      n_vmath.inputs["Vector"])
     links.new(n_vmath.outputs["Vector"],       n_set.inputs["Offset"])
     links.new(n_set.outputs["Geometry"],       n_out.inputs["Geometry"])
@@ -141,13 +193,18 @@ def _ensure_gn_group_for_obj(obj: bpy.types.Object) -> bpy.types.GeometryNodeTre
         carrier_name = f"MLD_Carrier::{obj.name}"
         carrier_obj = bpy.data.objects.get(carrier_name)
         
+        # Groups from older versions lack the Strength/Midlevel inputs (OFFS held final offsets)
+        upgraded = _ensure_param_sockets(ng)
+        if upgraded:
+            print(f"[MLD] Added Strength/Midlevel inputs to GN group")
+
         # Check if we need to switch between carrier/simple modes
         has_obj_info = any(n.bl_idname == "GeometryNodeObjectInfo" for n in ng.nodes)
         
-        if carrier_obj and not has_obj_info:
+        if carrier_obj and (upgraded or not has_obj_info):
             print(f"[MLD] Rebuilding GN graph for carrier mode")
             _build_carrier_reader_graph(ng, obj)
-        elif not carrier_obj and has_obj_info:
+        elif not carrier_obj and (upgraded or has_obj_info):
             print(f"[MLD] Rebuilding GN graph for simple mode")
             _build_simple_graph(ng)
         elif carrier_obj and has_obj_info:
@@ -285,9 +342,9 @@ def _build_carrier_reader_graph(ng: bpy.types.NodeTree, obj: bpy.types.Object):
     links.new(n_named.outputs["Attribute"], n_sample_index.inputs["Value"])
     links.new(n_index.outputs["Index"], n_sample_index.inputs["Index"])
     
-    # Process displacement
+    # Process displacement: raw height -> (h - Midlevel) * Strength
     links.new(n_sample_index.outputs["Value"], n_sep.inputs["Vector"])
-    links.new(n_sep.outputs["Z"], n_vmath.inputs["Scale"])
+    links.new(_height_to_offset(nodes, links, n_in, n_sep.outputs["Z"], loc=(-200, -200)), n_vmath.inputs["Scale"])
     links.new(n_normal.outputs["Normal"], n_vmath.inputs["Vector"])
     links.new(n_vmath.outputs["Vector"], n_set.inputs["Offset"])
     
@@ -0,0 +1,291 @@
+# gn_blend.py — Geometry Nodes–native height blending (alternative to the carrier)
+"""
+Builds a GN group that does the whole heightfill inside Blender's field evaluator:
+each layer's height image is sampled with Image Texture nodes at the (tiled) UV,
+masks are read as named attributes and the SIMPLE / HEIGHT_BLEND / SWITCH chain
+of core.blend_layers_scalar is rebuilt from Math nodes.
+
+The blend runs on the CORNER domain (Evaluate on Domain); using it in point context
+averages the corners of each vertex, i.e. the same valence average as the solvers.
+Per-layer strength, bias, tiling, offset and opacity are modifier inputs, so editing
+them (or painting masks / editing images) updates the viewport without Recalculate.
+Adding/removing layers or changing blend mode, mask or material rebuilds the group.
+
+Differences from the Python reference: Blender's texel addressing and colour
+management (use Non-Color height maps), and float32 evaluation.
+"""
+from __future__ import annotations
+import bpy
+from typing import Optional
+
+from .constants import (
+    GN_MOD_NAME, ALPHA_PREFIX, DEFAULT_STRENGTH, DEFAULT_MIDLEVEL,
+    DEFAULT_LAYER_MULTIPLIER, DEFAULT_LAYER_BIAS, DEFAULT_LAYER_TILING,
+)
+from .gn import GN_STRENGTH_INPUT, GN_MIDLEVEL_INPUT, set_gn_inputs
+from .kernels import LUMA_R, LUMA_G, LUMA_B
+from .sampling import find_image_and_uv_from_displacement, active_uv_layer_name
+
+# MLD_Layer property -> modifier input suffix (input name is f"L{i} {suffix}")
+LAYER_INPUTS = (
+    ("strength", "Strength", DEFAULT_LAYER_MULTIPLIER),
+    ("bias", "Bias", DEFAULT_LAYER_BIAS),
+    ("tiling", "Tiling", DEFAULT_LAYER_TILING),
+    ("height_offset", "Offset", 0.5),
+    ("switch_opacity", "Opacity", 0.5),
+)
+
+def blend_group_name(obj) -> str:
+    return f"MLD_BlendGN::{obj.name}"
+
+def _layer_input(i: int, suffix: str) -> str:
+    return f"L{i} {suffix}"
+
+# ------------------------------------------------------------------------------
+# Node helpers
+# ------------------------------------------------------------------------------
+
+def _link_or_set(links, sock_in, value):
+    if isinstance(value, (int, float)):
+        sock_in.default_value = float(value)
+    else:
+        links.new(value, sock_in)
+
+def _math(nodes, links, op: str, a, b=None, c=None, loc=(0, 0), clamp=False):
+    n = nodes.new("ShaderNodeMath"); n.location = loc
+    n.operation = op
+    n.use_clamp = clamp
+    for sock, value in zip(n.inputs, (a, b, c)):
+        if value is not None:
+            _link_or_set(links, sock, value)
+    return n.outputs["Value"]
+
+def _lerp(nodes, links, base, height, f, loc=(0, 0)):
+    """base * (1 - f) + height * f"""
+    x, y = loc
+    inv = _math(nodes, links, 'SUBTRACT', 1.0, f, loc=(x, y))
+    a = _math(nodes, links, 'MULTIPLY', base, inv, loc=(x + 160, y))
+    return _math(nodes, links, 'MULTIPLY_ADD', height, f, a, loc=(x + 320, y))
+
+def _on_corners(nodes, links, value, loc=(0, 0)):
+    n = nodes.new("GeometryNodeFieldOnDomain"); n.location = loc
+    n.domain = 'CORNER'
+    n.data_type = 'FLOAT'
+    links.new(value, n.inputs["Value"])
+    return n.outputs["Value"]
+
+# ------------------------------------------------------------------------------
+# Per-layer fields
+# ------------------------------------------------------------------------------
+
+def _layer_height(nodes, links, n_in, i: int, img, uv_out, loc):
+    """clamp(luminance(image(uv * tiling)), 0, 1) * strength + bias"""
+    x, y = loc
+    lum = 0.0
+    if img is not None:
+        n_scale = nodes.new("ShaderNodeVectorMath"); n_scale.location = (x, y)
+        n_scale.operation = 'SCALE'
+        links.new(uv_out, n_scale.inputs["Vector"])
+        links.new(n_in.outputs[_layer_input(i, "Tiling")], n_scale.inputs["Scale"])
+
+        n_tex = nodes.new("GeometryNodeImageTexture"); n_tex.location = (x + 180, y)
+        n_tex.interpolation = 'Linear'
+        n_tex.extension = 'REPEAT'
+        n_tex.inputs["Image"].default_value = img
+        links.new(n_scale.outputs["Vector"], n_tex.inputs["Vector"])
+
+        if int(getattr(img, "channels", 4)) >= 3:
+            n_dot = nodes.new("ShaderNodeVectorMath"); n_dot.location = (x + 360, y)
+            n_dot.operation = 'DOT_PRODUCT'
+            links.new(n_tex.outputs["Color"], n_dot.inputs[0])
+            n_dot.inputs[1].default_value = (LUMA_R, LUMA_G, LUMA_B)
+            lum = n_dot.outputs["Value"]
+        else:
+            n_sep = nodes.new("FunctionNodeSeparateColor"); n_sep.location = (x + 360, y)
+            links.new(n_tex.outputs["Color"], n_sep.inputs["Color"])
+            lum = n_sep.outputs["Red"]
+        lum = _math(nodes, links, 'MULTIPLY', lum, 1.0, loc=(x + 540, y), clamp=True)
+    h = _math(nodes, links, 'MULTIPLY', lum, n_in.outputs[_layer_input(i, "Strength")], loc=(x + 700, y))
+    return _math(nodes, links, 'ADD', h, n_in.outputs[_layer_input(i, "Bias")], loc=(x + 860, y))
+
+def _layer_mask(nodes, links, mask_name: str, loc):
+    """Red channel of the mask colour attribute (0 when the name is empty)."""
+    if not mask_name:
+        return 0.0
+    n_attr = nodes.new("GeometryNodeInputNamedAttribute"); n_attr.location = loc
+    n_attr.data_type = 'FLOAT_COLOR'
+    n_attr.inputs["Name"].default_value = mask_name
+    n_sep = nodes.new("FunctionNodeSeparateColor"); n_sep.location = (loc[0] + 180, loc[1])
+    links.new(n_attr.outputs["Attribute"], n_sep.inputs["Color"])
+    return n_sep.outputs["Red"]
+
+def _blend_factor(nodes, links, n_in, i: int, mode: str, base, height, mask, loc):
+    """Blend factor of _apply_*_blend (== alpha contribution)."""
+    x, y = loc
+    if mode == 'HEIGHT_BLEND':
+        off = n_in.outputs[_layer_input(i, "Offset")]
+        diff = _math(nodes, links, 'SUBTRACT', height, base, loc=(x, y))
+        nd = _math(nodes, links, 'MULTIPLY_ADD', diff, 0.5, 0.5, loc=(x + 160, y))  # (diff + 1) * 0.5
+        thr = _math(nodes, links, 'SUBTRACT', 1.0, off, loc=(x + 160, y - 160))
+        t = _math(nodes, links, 'SUBTRACT', nd, thr, loc=(x + 320, y))
+        t = _math(nodes, links, 'DIVIDE', t, off, loc=(x + 480, y), clamp=True)
+        # smoothstep t*t*(3-2t)
+        s3 = _math(nodes, links, 'MULTIPLY_ADD', t, -2.0, 3.0, loc=(x + 640, y - 160))
+        t2 = _math(nodes, links, 'MULTIPLY', t, t, loc=(x + 640, y))
+        bf = _math(nodes, links, 'MULTIPLY', t2, s3, loc=(x + 800, y))
+        # offset <= 0 -> 0, offset >= 1 -> 1
+        pos = _math(nodes, links, 'GREATER_THAN', off, 0.0, loc=(x + 800, y - 160))
+        bf = _math(nodes, links, 'MULTIPLY', bf, pos, loc=(x + 960, y))
+        full = _math(nodes, links, 'LESS_THAN', off, 1.0, loc=(x + 960, y - 160))
+        full = _math(nodes, links, 'SUBTRACT', 1.0, full, loc=(x + 1120, y - 160))
+        bf = _math(nodes, links, 'MAXIMUM', bf, full, loc=(x + 1120, y))
+        return _math(nodes, links, 'MULTIPLY', bf, mask, loc=(x + 1280, y))
+    if mode == 'SWITCH':
+        op = n_in.outputs[_layer_input(i, "Opacity")]
+        return _math(nodes, links, 'MULTIPLY', op, mask, loc=(x, y), clamp=True)
+    # SIMPLE
+    return _math(nodes, links, 'MULTIPLY', mask, 1.0, loc=(x, y), clamp=True)
+
+# ------------------------------------------------------------------------------
+# Group
+# ------------------------------------------------------------------------------
+
+def _build_interface(ng, n_layers: int):
+    iface = ng.interface
+    iface.clear()
+    iface.new_socket(name="Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    iface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    for name, default in ((GN_STRENGTH_INPUT, DEFAULT_STRENGTH), (GN_MIDLEVEL_INPUT, DEFAULT_MIDLEVEL)):
+        sock = iface.new_socket(name=name, in_out='INPUT', socket_type='NodeSocketFloat')
+        sock.default_value = default
+    for i in range(n_layers):
+        for _, suffix, default in LAYER_INPUTS:
+            sock = iface.new_socket(name=_layer_input(i, suffix), in_out='INPUT', socket_type='NodeSocketFloat')
+            sock.default_value = default
+
+def build_blend_graph(ng, obj, s) -> int:
+    """(Re)build the native blend graph for the layer stack. Returns the number of blended layers."""
+    layers = list(s.layers)
+    _build_interface(ng, len(layers))
+    nodes, links = ng.nodes, ng.links
+    nodes.clear()
+
+    n_in = nodes.new("NodeGroupInput"); n_in.location = (-1200, 0)
+    n_out = nodes.new("NodeGroupOutput"); n_out.location = (1600 + 1800 * len(layers), 0)
+
+    uv_name = active_uv_layer_name(obj.data) or ""
+    n_uv = nodes.new("GeometryNodeInputNamedAttribute"); n_uv.location = (-1000, -300)
+    n_uv.data_type = 'FLOAT_VECTOR'
+    n_uv.inputs["Name"].default_value = uv_name
+
+    current, alphas, used = 0.0, [], 0
+    for i, L in enumerate(layers):
+        x, y = -800 + 1800 * i, -600 * i
+        if not L.enabled:
+            alphas.append(None)
+            continue
+        img = None
+        if L.material:
+            img, _ = find_image_and_uv_from_displacement(L.material)
+        h = _layer_height(nodes, links, n_in, i, img, n_uv.outputs["Attribute"], (x, y))
+        m = _layer_mask(nodes, links, str(L.mask_name or ""), (x, y - 300))
+        used += 1
+        if i == 0:
+            # base layer: height * mask, alpha = mask
+            current = _math(nodes, links, 'MULTIPLY', h, m, loc=(x + 1040, y))
+            alphas.append(m)
+            continue
+        f = _blend_factor(nodes, links, n_in, i, str(L.blend_mode), current, h, m, (x + 1040, y - 200))
+        current = _lerp(nodes, links, current, h, f, loc=(x + 1400, y))
+        alphas.append(f)
+
+    geo = n_in.outputs["Geometry"]
+    if isinstance(current, float):
+        links.new(geo, n_out.inputs["Geometry"])
+        return used
+
+    # height per corner -> averaged per vertex -> (h - Midlevel) * Strength along the normal
+    x_end = 1800 * len(layers)
+    h_c = _on_corners(nodes, links, current, loc=(x_end, 200))
+    offs = _math(nodes, links, 'SUBTRACT', h_c, n_in.outputs[GN_MIDLEVEL_INPUT], loc=(x_end + 180, 200))
+    offs = _math(nodes, links, 'MULTIPLY', offs, n_in.outputs[GN_STRENGTH_INPUT], loc=(x_end + 360, 200))
+    n_normal = nodes.new("GeometryNodeInputNormal"); n_normal.location = (x_end + 360, 400)
+    n_vec = nodes.new("ShaderNodeVectorMath"); n_vec.location = (x_end + 540, 300)
+    n_vec.operation = 'SCALE'
+    links.new(n_normal.outputs["Normal"], n_vec.inputs["Vector"])
+    links.new(offs, n_vec.inputs["Scale"])
+
+    # per-layer alphas (same names as the carrier engine writes)
+    for i, a in enumerate(alphas):
+        if a is None or isinstance(a, float):
+            continue
+        n_store = nodes.new("GeometryNodeStoreNamedAttribute"); n_store.location = (x_end + 200 * i, -300)
+        n_store.data_type = 'FLOAT'
+        n_store.domain = 'POINT'
+        n_store.inputs["Name"].default_value = f"{ALPHA_PREFIX}{i}"
+        links.new(geo, n_store.inputs["Geometry"])
+        links.new(_on_corners(nodes, links, a, loc=(x_end + 200 * i, -500)), n_store.inputs["Value"])
+        geo = n_store.outputs["Geometry"]
+
+    n_set = nodes.new("GeometryNodeSetPosition"); n_set.location = (x_end + 800, 0)
+    links.new(geo, n_set.inputs["Geometry"])
+    links.new(n_vec.outputs["Vector"], n_set.inputs["Offset"])
+    links.new(n_set.outputs["Geometry"], n_out.inputs["Geometry"])
+    return used
+
+def set_layer_inputs(obj: bpy.types.Object, s) -> bool:
+    """Push per-layer parameters into the native blend modifier inputs."""
+    md = obj.modifiers.get(GN_MOD_NAME) if obj else None
+    ng = getattr(md, "node_group", None)
+    if ng is None or ng.name != blend_group_name(obj):
+        return False
+    try:
+        ids = {it.name: it.identifier for it in ng.interface.items_tree
+               if getattr(it, "in_out", None) == 'INPUT'}
+        changed = False
+        for i, L in enumerate(s.layers):
+            for prop, suffix, default in LAYER_INPUTS:
+                key = ids.get(_layer_input(i, suffix))
+                if key is None:
+                    continue
+                value = float(getattr(L, prop, default))
+                if prop == "tiling":
+                    value = max(1e-8, value)
+                if md.get(key) != value:
+                    md[key] = value
+                    changed = True
+        if changed:
+            obj.update_tag()
+        return True
+    except Exception as e:
+        print(f"[MLD] Failed to set blend GN inputs: {e}")
+        return False
+
+def ensure_blend_gn(obj: bpy.types.Object, s) -> Optional[bpy.types.NodesModifier]:
+    """Create/rebuild the native blend group and put it on the MLD modifier."""
+    name = blend_group_name(obj)
+    ng = bpy.data.node_groups.get(name)
+    if ng and ng.bl_idname != 'GeometryNodeTree':
+        try:
+            bpy.data.node_groups.remove(ng, do_unlink=True)
+        except Exception:
+            pass
+        ng = None
+    if ng is None:
+        ng = bpy.data.node_groups.new(name=name, type='GeometryNodeTree')
+    used = build_blend_graph(ng, obj, s)
+    print(f"[MLD] Built native blend GN graph: {used} layer(s)")
+
+    md = obj.modifiers.get(GN_MOD_NAME)
+    if not md or md.type != 'NODES':
+        md = obj.modifiers.new(GN_MOD_NAME, 'NODES')
+    md.node_group = ng
+    set_gn_inputs(obj, getattr(s, "strength", DEFAULT_STRENGTH), getattr(s, "midlevel", DEFAULT_MIDLEVEL))
+    set_layer_inputs(obj, s)
+    return md
+
+def register():
+    pass
+
+def unregister():
+    pass
@@ -2,13 +2,25 @@
 
 from __future__ import annotations
 import bpy
+import numpy as np
 from typing import List, Optional, Tuple
 from .sampling import (
-    make_sampler, find_image_and_uv_from_displacement,
+    get_sampler, make_sampler, ensure_mips, set_sampler_cache_budget, sampler_cache_stats, set_disk_cache_dir,
+    find_image_and_uv_from_displacement,
     active_uv_layer_name, sample_height_at_loop,
 )
-from .attrs import ensure_float_attr, ensure_color_attr, point_red, loop_red, color_attr_exists
-from .constants import OFFS_ATTR, ALPHA_PREFIX
+from .attrs import (
+    ensure_float_attr, point_red, loop_red, color_attr_exists,
+    read_sparse_red, read_attr_array, write_attr_array, write_offs_z,
+)
+from .constants import (
+    INCREMENTAL_BLOCK_LOOPS, OFFS_ATTR, ALPHA_PREFIX, DEFAULT_SAMPLER_CACHE_MB, DEFAULT_LAYER_SAMPLE_CACHE_MB,
+    DEFAULT_HEIGHTFILL_CHUNK, DEFAULT_HEIGHTFILL_MEMORY_MB,
+)
+from . import kernels, backend, cache, core, worker
+from .solver import (
+    SolveCancelled, sample_plan, blend_reduce as _blend_reduce, run_job as _run_numpy,
+)
 
 def _get_evaluated_mesh(obj: bpy.types.Object, context):
     """Get mesh with modifiers applied for heightfill calculation."""
@@ -38,27 +50,30 @@ def _ensure_output_attrs(me: bpy.types.Mesh, n_layers: int):
     for i in range(n_layers):
         ensure_float_attr(me, f"{ALPHA_PREFIX}{i}", domain='POINT', data_type='FLOAT')
 
+def _gather_layer_images(s) -> List[Optional[bpy.types.Image]]:
+    """For each enabled layer return its height image or None (no pixels are read)."""
+    images: List[Optional[bpy.types.Image]] = []
+    for L in s.layers:
+        if not (L.enabled and L.material):
+            images.append(None); continue
+        img, _ = find_image_and_uv_from_displacement(L.material)
+        images.append(img)
+    return images
+
 def _gather_layer_samplers(obj: bpy.types.Object, s) -> Tuple[List[Optional[object]], Optional[str]]:
     """For each enabled layer return ImageSampler or None; also return active UV name."""
     me = obj.data
     uv_name = active_uv_layer_name(me)
-    samplers: List[Optional[object]] = []
-    for L in s.layers:
-        if not (L.enabled and L.material):
-            samplers.append(None); continue
-        img, _ = find_image_and_uv_from_displacement(L.material)
-        samplers.append(make_sampler(img))
+    storage = getattr(s, "sampler_precision", 'FLOAT32')
+    disk = getattr(s, "disk_cache_enable", False)
+    samplers: List[Optional[object]] = [get_sampler(img, storage, disk) for img in _gather_layer_images(s)]
     return samplers, uv_name
 
 def _transfer_result_to_original(original_me: bpy.types.Mesh, eval_me: bpy.types.Mesh, 
-                                accum_offs: list, accum_alpha: list, n_layers: int):
-    """Transfer heightfill results from evaluated mesh back to original mesh attributes."""
+                                offs_z, alphas, n_layers: int):
+    """Transfer heightfill results (per-vertex arrays) back to original mesh attributes."""
     
-    # Prepare write access on ORIGINAL mesh
-    offs_attr = original_me.attributes.get(OFFS_ATTR)
-    alpha_attrs = [original_me.attributes.get(f"{ALPHA_PREFIX}{i}") for i in range(n_layers)]
-    
-    if not offs_attr:
+    if not original_me.attributes.get(OFFS_ATTR):
         print("[MLD] Error: OFFS_ATTR not found on original mesh")
         return False
     
@@ -68,43 +83,67 @@ def _transfer_result_to_original(original_me: bpy.types.Mesh, eval_me: bpy.types
     
     print(f"[MLD] Mapping: {eval_vcount} eval vertices → {orig_vcount} original vertices")
     
-    # Direct mapping for same topology
-    for vi in range(min(orig_vcount, eval_vcount)):
-        if vi < len(accum_offs):
-            ox, oy, oz = accum_offs[vi]
-            offs_attr.data[vi].vector = (0.0, 0.0, oz)
-            for i in range(n_layers):
-                if alpha_attrs[i] and vi < len(accum_alpha[i]):
-                    alpha_attrs[i].data[vi].value = accum_alpha[i][vi]
+    # Direct mapping for same topology: one bulk write per attribute
+    ok = write_offs_z(original_me, OFFS_ATTR, offs_z)
+    for i in range(n_layers):
+        if i < len(alphas):
+            write_attr_array(original_me, f"{ALPHA_PREFIX}{i}", alphas[i])
     
     original_me.update()
-    return True
+    return ok
 
-def _get_mask_value_for_loop(obj, eval_me, layer, li, vi, uv_name):
+def _build_orig_loop_map(obj, eval_me, uv_name) -> np.ndarray:
+    """
+    Work mesh loop -> nearest original loop by UV, for meshes whose topology
+    changed under modifiers. One KD-tree over the original UVs per solve;
+    each distinct work UV is looked up once.
+    """
+    from mathutils.kdtree import KDTree
+    orig_me = obj.data
+    n_orig = len(orig_me.loops)
+    n_work = len(eval_me.loops)
+    if n_orig == 0:
+        return np.zeros(n_work, dtype=np.int64)
+    if not (orig_me.uv_layers.get(uv_name) and eval_me.uv_layers.get(uv_name)):
+        return np.minimum(np.arange(n_work), n_orig - 1)
+    _, orig_uv = _read_loop_arrays(orig_me, uv_name)
+    _, work_uv = _read_loop_arrays(eval_me, uv_name)
+    kd = KDTree(n_orig)
+    for oi, (u, v) in enumerate(orig_uv.tolist()):
+        kd.insert((u, v, 0.0), oi)
+    kd.balance()
+    first, inverse = kernels.unique_coords(work_uv[:, 0], work_uv[:, 1])
+    nearest = np.fromiter((kd.find((u, v, 0.0))[1] for u, v in work_uv[first].tolist()),
+                          dtype=np.int64, count=len(first))
+    return nearest[inverse]
+
+def _orig_loop_map(obj, eval_me, uv_name, ctx: dict) -> Optional[np.ndarray]:
+    """Cached per solve in ctx; None when work and original loops correspond 1:1."""
+    if eval_me is obj.data or len(eval_me.loops) == len(obj.data.loops):
+        return None
+    if "loop_map" not in ctx:
+        ctx["loop_map"] = _build_orig_loop_map(obj, eval_me, uv_name)
+        print(f"[MLD] Mask mapping: {len(eval_me.loops)} work loops → {len(obj.data.loops)} original loops (UV nearest)")
+    return ctx["loop_map"]
+
+def _get_mask_value_for_loop(obj, eval_me, layer, li, vi, uv_name, ctx: Optional[dict] = None):
     """Get mask value for loop with proper mapping."""
     m = 0.0
     if layer.mask_name and color_attr_exists(obj.data, layer.mask_name):
-        # Map work mesh loop to original mesh loop properly
-        if li < len(obj.data.loops):
-            orig_li = li
+        # Attribute propagated through the modifier stack: read it on the work mesh
+        if eval_me is not obj.data and color_attr_exists(eval_me, layer.mask_name):
+            m = point_red(eval_me, layer.mask_name, vi)
+            if m is None:
+                m = loop_red(eval_me, layer.mask_name, li)
+            if m is not None:
+                return m
+        # Map work mesh loop to original mesh loop
+        loop_map = _orig_loop_map(obj, eval_me, uv_name, ctx if ctx is not None else {})
+        if loop_map is None:
+            orig_li = min(li, len(obj.data.loops) - 1)
         else:
-            # For modified meshes, find closest original loop
-            try:
-                work_uv = eval_me.uv_layers[uv_name].data[li].uv
-                min_dist = float('inf')
-                orig_li = 0
-                for orig_loop_idx in range(min(len(obj.data.loops), 1000)):  # Limit search
-                    try:
-                        orig_uv = obj.data.uv_layers[uv_name].data[orig_loop_idx].uv
-                        dist = ((work_uv.x - orig_uv.x) ** 2 + (work_uv.y - orig_uv.y) ** 2) ** 0.5
-                        if dist < min_dist:
-                            min_dist = dist
-                            orig_li = orig_loop_idx
-                    except Exception:
-                        continue
-            except Exception:
-                orig_li = min(li, len(obj.data.loops) - 1)
-        
+            orig_li = int(loop_map[li])
+
         m = loop_red(obj.data, layer.mask_name, orig_li)
         if m is None:
             # Fallback to vertex-based reading
@@ -123,209 +162,508 @@ def _get_height_value_for_loop(eval_me, uv_name, li, layer, sampler):
     except Exception:
         return 0.0
 
-def _blend_layers_new(layer_data, settings):
-    """
-    НОВАЯ СИСТЕМА СМЕШИВАНИЯ с Height Blend и Switch modes.
-    
-    Args:
-        layer_data: List of dicts with 'height', 'mask', 'layer' for each layer
-        settings: Global MLD settings
-    
-    Returns:
-        (final_height, alphas_list)
-    """
-    if not layer_data:
-        return 0.0, []
-    
-    n_layers = len(layer_data)
-    alphas = [0.0] * n_layers
-    
-    # Начинаем с первого слоя (базовый слой, без смешивания)
-    current_height = layer_data[0]['height'] * layer_data[0]['mask']
-    alphas[0] = layer_data[0]['mask']
-    
-    # Смешиваем последующие слои
-    for i in range(1, n_layers):
-        layer = layer_data[i]
-        L = layer['layer']
-        
-        # Пропускаем отключенные слои или слои без маски
-        if not L.enabled or layer['mask'] <= 0.0:
+# ------------------------------------------------------------------------------
+# Settings snapshot: RNA is read once per solve, never in the per-loop path
+# ------------------------------------------------------------------------------
+
+def snapshot_stack(s) -> kernels.StackParams:
+    """Copy the layer stack and global blend values of MLD_Settings into immutable tuples."""
+    return kernels.StackParams(
+        layers=tuple(
+            kernels.LayerParams(
+                enabled=bool(L.enabled), blend_mode=str(L.blend_mode),
+                strength=float(L.strength), bias=float(L.bias), tiling=float(L.tiling),
+                height_offset=float(L.height_offset), switch_opacity=float(L.switch_opacity),
+                mask_name=str(L.mask_name or ""),
+            ) for L in s.layers
+        ),
+        strength=float(s.strength), midlevel=float(s.midlevel),
+    )
+
+# Scalar reference blends live in the bpy-free core (the Python engine calls them per loop)
+_apply_simple_blend = core.apply_simple_blend
+_apply_height_blend = core.apply_height_blend
+_apply_switch_blend = core.apply_switch_blend
+_compile_scalar_blend_table = core.compile_scalar_blend_table
+
+def _blend_layers_new(layer_data, settings, table=None):
+    """НОВАЯ СИСТЕМА СМЕШИВАНИЯ: see core.blend_layers_scalar (settings are not used)."""
+    return core.blend_layers_scalar(layer_data, table)
+
+# ------------------------------------------------------------------------------
+# Culling statistics of the last solve (shown in the Recalculate report)
+# ------------------------------------------------------------------------------
+
+_LAST_SOLVE_STATS: dict = {}
+
+def last_solve_stats() -> dict:
+    """Skipped-work counters of the last heightfill solve (empty for the Python engine)."""
+    return dict(_LAST_SOLVE_STATS)
+
+def clear_solve_stats():
+    """Forget the last solve's counters (e.g. when Recalculate skips the heightfill stage)."""
+    _LAST_SOLVE_STATS.clear()
+
+def _reset_cull_stats():
+    _LAST_SOLVE_STATS.clear()
+    _LAST_SOLVE_STATS.update(loops=0, layer_loops=0, sampled_loops=0, culled_layers=0, occluded_loops=0, coverage=[])
+
+def _cull_counts(stack, images, masks, needed, nloops: int):
+    """Coverage and skipped (layer, loop) counts of one solve or streaming window (thread-safe, no globals)."""
+    counts = {"layer_loops": 0, "sampled_loops": 0, "occluded_loops": 0, "coverage": []}
+    for i, (m, need) in enumerate(zip(masks, needed)):
+        if m is None:
+            counts["coverage"].append((0, 0.0))
             continue
-            
-        if L.blend_mode == 'SIMPLE':
-            current_height, alpha = _apply_simple_blend(
-                current_height,
-                layer['height'],
-                layer['mask']
-            )
-            alphas[i] = alpha
-            
-        elif L.blend_mode == 'HEIGHT_BLEND':
-            current_height, alpha = _apply_height_blend(
-                current_height, 
-                layer['height'], 
-                layer['mask'],
-                L.height_offset
-            )
-            alphas[i] = alpha
-            
-        elif L.blend_mode == 'SWITCH':
-            current_height, alpha = _apply_switch_blend(
-                current_height,
-                layer['height'],
-                layer['mask'],
-                L.switch_opacity
-            )
-            alphas[i] = alpha
-    
-    return current_height, alphas
+        active_m = m > 0.0
+        active = int(np.count_nonzero(active_m))
+        counts["coverage"].append((active, float(m.max(initial=0.0))))
+        if images[i] is None:
+            continue
+        counts["layer_loops"] += nloops
+        counts["sampled_loops"] += int(np.count_nonzero(need))
+        counts["occluded_loops"] += active - int(np.count_nonzero(need & active_m))
+    return counts
+
+def _record_cull_stats(counts, nloops: int):
+    """Merge counts into the last-solve stats (main thread only)."""
+    st = _LAST_SOLVE_STATS
+    if not st:
+        _reset_cull_stats()
+    for k in ("layer_loops", "sampled_loops", "occluded_loops"):
+        st[k] += counts[k]
+    cov = st["coverage"]
+    for i, (act, mx) in enumerate(counts["coverage"]):
+        if i == len(cov):
+            cov.append([0, 0.0])
+        cov[i][0] += act
+        cov[i][1] = max(cov[i][1], mx)
+    st["loops"] = st.get("loops", 0) + nloops
+
+def _report_cull_stats(stack):
+    st = _LAST_SOLVE_STATS
+    if not st:
+        return
+    loops = max(1, st.get("loops", 0))
+    st["culled_layers"] = sum(1 for L, (act, mx) in zip(stack.layers, st["coverage"]) if L.enabled and mx <= 0.0)
+    cov = ", ".join(f"{i}:{100.0 * act / loops:.0f}%" for i, (act, mx) in enumerate(st["coverage"])
+                    if stack.layers[i].enabled)
+    skipped = st["layer_loops"] - st["sampled_loops"]
+    print(f"[MLD] Culling: {st['culled_layers']} empty layer(s), {st['occluded_loops']} occluded + "
+          f"{skipped - st['occluded_loops']} unmasked layer-loops skipped of {st['layer_loops']}; coverage {cov}")
+
+# ------------------------------------------------------------------------------
+# NumPy engine: bulk-read loop data once, blend all loops with array ops
+# ------------------------------------------------------------------------------
+
+def _read_loop_arrays(me: bpy.types.Mesh, uv_name: str):
+    """Bulk-read loops.vertex_index and UVs into flat arrays."""
+    nloops = len(me.loops)
+    loop_vi = np.empty(nloops, dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loop_vi)
+    uv = np.zeros(nloops * 2, dtype=np.float32)
+    uv_layer = me.uv_layers.get(uv_name)
+    if uv_layer:
+        uv_layer.data.foreach_get("uv", uv)
+    return loop_vi, uv.reshape(nloops, 2)
+
+def _read_poly_arrays(me: bpy.types.Mesh):
+    """Bulk-read polygon loop_start / loop_total."""
+    npoly = len(me.polygons)
+    loop_start = np.empty(npoly, dtype=np.int64)
+    loop_total = np.empty(npoly, dtype=np.int64)
+    me.polygons.foreach_get("loop_start", loop_start)
+    me.polygons.foreach_get("loop_total", loop_total)
+    return loop_start, loop_total
+
+def _point_mask_to_loops(sm: kernels.SparseMask, loop_vi: np.ndarray) -> kernels.SparseMask:
+    """Per-loop sparse mask from a per-point one (loop value = its vertex value)."""
+    return kernels.SparseMask.from_dense(sm.take(loop_vi))
+
+def _read_mask_sparse(obj, eval_me, L, loop_vi: np.ndarray, uv_name: str, ctx: dict) -> kernels.SparseMask:
+    """Per-loop mask of the work mesh in sparse form (same mapping as _get_mask_value_for_loop)."""
+    nloops = len(loop_vi)
+    if not (L.mask_name and color_attr_exists(obj.data, L.mask_name)):
+        return kernels.SparseMask.empty(nloops)
+    # Attribute propagated through the modifier stack: read it on the work mesh
+    if eval_me is not obj.data:
+        sm, domain = read_sparse_red(eval_me, L.mask_name)
+        if sm is not None:
+            if domain == 'POINT' and sm.size == len(eval_me.vertices):
+                return _point_mask_to_loops(sm, loop_vi)
+            if domain == 'CORNER' and sm.size == nloops:
+                return sm
+    sm, domain = read_sparse_red(obj.data, L.mask_name)
+    if sm is None or sm.size == 0:
+        return kernels.SparseMask.empty(nloops)
+    if domain == 'POINT':
+        # point masks follow vertex indices (clamped like the reference path)
+        return _point_mask_to_loops(sm, np.minimum(loop_vi, sm.size - 1))
+    loop_map = _orig_loop_map(obj, eval_me, uv_name, ctx)
+    if loop_map is None:
+        if sm.size >= nloops:
+            keep = sm.indices < nloops
+            return kernels.SparseMask(nloops, sm.indices[keep], sm.values[keep])
+        loop_map = np.minimum(np.arange(nloops), sm.size - 1)
+    return kernels.SparseMask.from_dense(sm.take(loop_map))
 
-def _apply_simple_blend(base_height, layer_height, layer_mask):
+def _read_mask_loops_np(obj, eval_me, L, loop_vi: np.ndarray, uv_name: str, ctx: dict) -> np.ndarray:
+    """Dense per-loop mask red channel for the work mesh."""
+    return _read_mask_sparse(obj, eval_me, L, loop_vi, uv_name, ctx).dense()
+
+def _layer_sample_key(s, L, img, ld) -> Tuple[Tuple, float]:
+    """Sample cache key of a layer (image content, precision, filter, UVs, tiling, topology) and its tiling."""
+    tiling = max(1e-8, L.tiling)
+    storage = getattr(s, "sampler_precision", 'FLOAT32')
+    return (cache.image_fingerprint(img), storage, ld["filter"], ld["uv_key"], float(tiling), ld["topo_key"]), tiling
+
+def _layer_sample_plan(obj, s, i, L, img, ld, need: Optional[np.ndarray] = None) -> Optional[dict]:
     """
-    Применить простое смешивание по маске.
-    
-    Args:
-        base_height: Высота от слоев ниже
-        layer_height: Высота текущего слоя
-        layer_mask: Сила маски (0-1) - прямое управление смешиванием
-    
-    Returns:
-        (blended_height, alpha_contribution)
+    Main-thread half of a layer's height samples: cache lookup and, when samples are
+    missing, the sampler (pixels are read here). None for layers without an image.
+    need: indices of loops that must hold real samples (None = all); other loops may stay 0.
     """
-    if layer_mask <= 0.0:
-        return base_height, 0.0
-    
-    # Прямое использование маски как blend factor
-    final_blend = max(0.0, min(1.0, layer_mask))
-    
-    # Простая линейная интерполяция
-    blended_height = base_height * (1.0 - final_blend) + layer_height * final_blend
-    
-    return blended_height, final_blend
+    if img is None:
+        return None
+    key, tiling = _layer_sample_key(s, L, img, ld)
+    plan = sample_plan(i, key, cache.get_layer_samples(obj, i, key), tiling, need)
+    if plan["cached"]:
+        return plan
+    storage = getattr(s, "sampler_precision", 'FLOAT32')
+    sp = get_sampler(img, storage, getattr(s, "disk_cache_enable", False)) if len(ld["uv"]) else None
+    plan["sampler"] = sp
+    if sp is not None and ld["filter"] == 'PREFILTERED':
+        plan["mips"] = ensure_mips(sp)
+    return plan
 
-def _apply_height_blend(base_height, layer_height, layer_mask, height_offset):
+def _layer_remote_plan(s, i, L, img, ld, need: Optional[np.ndarray] = None) -> Optional[dict]:
+    """Worker-process counterpart of _layer_sample_plan: the worker owns the sample cache and planes."""
+    if img is None:
+        return None
+    key, tiling = _layer_sample_key(s, L, img, ld)
+    return {"index": i, "key": key, "tiling": tiling, "need": need, "store": False,
+            "plane": (key[0], key[1]), "image": img}
+
+def _store_layer_plan(obj, plan: Optional[dict]):
+    """Main thread: keep freshly sampled heights in the sample cache."""
+    if plan is not None and plan["store"]:
+        cache.store_layer_samples(obj, plan["index"], plan["key"], plan["raw"], plan["valid"])
+
+def _prepare_numpy(obj, s, stack, eval_me, uv_name, images, remote: bool = False,
+                   scope_verts: Optional[np.ndarray] = None) -> dict:
     """
-    Применить Height Blend в стиле Substance Designer.
-    
-    Args:
-        base_height: Высота от слоев ниже
-        layer_height: Высота текущего слоя  
-        layer_mask: Сила маски (0-1)
-        height_offset: Порог высоты (0-1)
-    
-    Returns:
-        (blended_height, alpha_contribution)
+    Main-thread half of the NumPy solve: every bpy read (mesh arrays, masks, pixels,
+    cached samples and incremental state) happens here. The returned job only holds
+    NumPy arrays and tuples; job["result"] is already set when nothing needs blending.
+    remote: plans for the worker process (no local cache lookup, no pixels read).
+    scope_verts: recalc_scope_vertices result already read by the caller (None = read here).
     """
-    if layer_mask <= 0.0:
-        return base_height, 0.0
-    
-    # Расчет разности высот
-    height_diff = layer_height - base_height
-    
-    # Применяем height_offset как порог
-    # При offset=0: слой никогда не проступает
-    # При offset=1: слой всегда проступает полностью
-    # При offset=0.5: сбалансированное смешивание на основе разности высот
-    
-    # Преобразуем height_offset в blend_factor
-    # Это имитирует поведение height blend из Substance Designer
-    if height_offset <= 0.0:
-        blend_factor = 0.0
-    elif height_offset >= 1.0:
-        blend_factor = 1.0
+    loop_vi, uv = _read_loop_arrays(eval_me, uv_name)
+    nloops = len(loop_vi)
+    vcount = len(eval_me.vertices)
+    filt = getattr(s, "sampling_filter", 'BILINEAR')
+
+    threads = getattr(s, "heightfill_threads", 0)
+    chunk = getattr(s, "heightfill_chunk_size", DEFAULT_HEIGHTFILL_CHUNK)
+
+    # Per-solve loop data + fingerprints shared by every layer's sample cache key
+    footprint = kernels.face_uv_footprint(uv, *_read_poly_arrays(eval_me)) if filt == 'PREFILTERED' else None
+    ld = core.loop_data(uv, filt, footprint, threads, chunk)
+    ld.update(topo_key=cache.array_digest(loop_vi, vcount, len(eval_me.polygons)), uv_key=cache.array_digest(uv))
+    cache.set_layer_sample_budget(getattr(s, "layer_sample_cache_mb", DEFAULT_LAYER_SAMPLE_CACHE_MB))
+    cache.prune_layer_samples(obj, len(stack.layers))
+    job = core.new_job(stack, ld, loop_vi, vcount)
+
+    # Masks are sparse: blending only runs on loops painted by some layer (the support).
+    smasks = [_read_mask_sparse(obj, eval_me, L, loop_vi, uv_name, ld) if L.enabled else None
+              for L in stack.layers]
+
+    # Scoped recalc: only the scope's loops are re-blended, other vertices keep their values.
+    # Incremental recalc: only loops of vertices touching changed mask blocks are re-blended
+    scoped = _scope_region(obj, s, eval_me, loop_vi, vcount, len(stack.layers), scope_verts)
+    incremental = scoped is None and bool(getattr(s, "incremental_recalc", True))
+    state = signature = hashes = region = None
+    if scoped is not None:
+        region, state = scoped
+        cache.clear_solve_state(obj)  # the stored result no longer matches the masks everywhere
+    elif incremental:
+        storage = getattr(s, "sampler_precision", 'FLOAT32')
+        signature = (stack, tuple(cache.image_fingerprint(img) if img is not None else None for img in images),
+                     filt, storage, ld["topo_key"], ld["uv_key"])
+        hashes = [None if m is None else cache.block_digests(m.dense(), INCREMENTAL_BLOCK_LOOPS) for m in smasks]
+        state = cache.get_solve_state(obj)
+        region = _incremental_region(state, signature, hashes, loop_vi, vcount)
     else:
-        # Плавное смешивание на основе разности высот и offset
-        # Offset действует как смещение - больший offset означает, что слой проступает легче
-        normalized_diff = (height_diff + 1.0) * 0.5  # Нормализуем в диапазон 0-1
-        
-        # Создаем S-образную кривую для более естественного смешивания
-        # height_offset контролирует точку перехода
-        blend_factor = max(0.0, min(1.0, 
-            (normalized_diff - (1.0 - height_offset)) / height_offset
-        ))
-        
-        # Сглаживание с помощью smoothstep
-        if blend_factor > 0.0 and blend_factor < 1.0:
-            blend_factor = blend_factor * blend_factor * (3.0 - 2.0 * blend_factor)
-    
-    # Применяем маску к blend_factor
-    final_blend = blend_factor * layer_mask
-    
-    # Линейная интерполяция
-    blended_height = base_height * (1.0 - final_blend) + layer_height * final_blend
-    
-    return blended_height, final_blend
+        cache.clear_solve_state(obj)
+    job.update(incremental=incremental, signature=signature, hashes=hashes, state=state, region=region)
+    if region is not None and len(region[0]) == 0:
+        print("[MLD] Scope: no vertices in scope, keeping current values" if scoped is not None
+              else "[MLD] Incremental: no mask blocks changed, reusing previous result")
+        job["result"] = (state["offs_z"].copy(), [a.copy() for a in state["alphas"]])
+        job["unchanged"] = True
+        return job
+
+    if region is not None:
+        print(f"[MLD] {'Scope' if scoped is not None else 'Incremental'}: re-blending {len(region[0])}/{nloops} loops of {len(region[1])} vertices")
+    make_plan = (lambda i, L, need: _layer_remote_plan(s, i, L, images[i], ld, need)) if remote else \
+                (lambda i, L, need: _layer_sample_plan(obj, s, i, L, images[i], ld, need))
+    core.plan_job(job, smasks, make_plan, region)
+    job["cull"] = _cull_counts(stack, images, job["masks"], job.pop("needed"), job["n_region"])
+    return job
 
-def _apply_switch_blend(base_height, layer_height, layer_mask, switch_opacity):
+def _finish_numpy(obj, job):
+    """Main-thread end of the NumPy solve: sample cache, incremental state and culling stats."""
+    offs_z, alphas_v = job["result"]
+    if job.get("unchanged"):
+        _LAST_SOLVE_STATS.clear()
+        return offs_z, alphas_v
+    for plan in job["plans"]:
+        _store_layer_plan(obj, plan)
+    _record_cull_stats(job["cull"], job["n_region"])
+    if job["incremental"]:
+        state = job["state"]
+        cache.store_solve_state(obj, {
+            "signature": job["signature"], "hashes": job["hashes"],
+            "csr": state["csr"] if job["region"] is not None else None,
+            "offs_z": offs_z.copy(), "alphas": [a.copy() for a in alphas_v],
+        })
+    return offs_z, alphas_v
+
+def _solve_numpy(obj, s, stack, eval_me, uv_name, images, scope_verts=None):
     """
-    Применить простое Switch/lerp смешивание.
-    
-    Args:
-        base_height: Высота от слоев ниже
-        layer_height: Высота текущего слоя
-        layer_mask: Сила маски (0-1) 
-        switch_opacity: Фактор переключения (0-1)
-    
-    Returns:
-        (blended_height, alpha_contribution)
+    Vectorized heightfill, loop chunks blended on a thread pool.
+    Returns (offs_z, alphas) as per-vertex float32 arrays; bit-identical for any thread count.
+    Layer parameters come from the `stack` snapshot; `s` only supplies engine options.
     """
-    if layer_mask <= 0.0 or switch_opacity <= 0.0:
-        return base_height, 0.0
-    
-    # Комбинируем switch opacity с маской слоя
-    final_blend = switch_opacity * layer_mask
-    final_blend = max(0.0, min(1.0, final_blend))
-    
-    # Простая линейная интерполяция
-    blended_height = base_height * (1.0 - final_blend) + layer_height * final_blend
-    
-    return blended_height, final_blend
+    job = _prepare_numpy(obj, s, stack, eval_me, uv_name, images, scope_verts=scope_verts)
+    _run_numpy(job)
+    return _finish_numpy(obj, job)
 
-def solve_heightfill(obj: bpy.types.Object, s, context=None, work_mesh: bpy.types.Mesh = None) -> bool:
+def _solve_worker(obj, s, stack, eval_me, uv_name, images, scope_verts=None):
     """
-    ОБНОВЛЕННАЯ Core heightfill с новой системой смешивания слоев.
-    Returns True on success.
+    NumPy solve in the persistent worker process (worker.py): Blender only reads the
+    inputs and decodes planes the worker does not hold yet. (None, None) when the
+    worker is unavailable; the caller then solves in-process.
     """
-    if context is None:
-        context = bpy.context
-    
-    # Use provided work_mesh or get evaluated mesh
-    if work_mesh:
-        eval_me = work_mesh
-        print(f"[MLD] Using provided work mesh: {len(eval_me.vertices)} vertices")
-    else:
-        eval_me, eval_obj = _get_evaluated_mesh(obj, context)
-    
-    if eval_me is None or eval_me.loop_triangles is None:
-        eval_me.calc_loop_triangles()
+    job = _prepare_numpy(obj, s, stack, eval_me, uv_name, images, remote=True, scope_verts=scope_verts)
+    storage = getattr(s, "sampler_precision", 'FLOAT32')
+    disk = getattr(s, "disk_cache_enable", False)
+    try:
+        worker.run_remote_job(job, obj.name, lambda plan: make_sampler(plan["image"], storage, disk),
+                              getattr(s, "sampler_cache_mb", DEFAULT_SAMPLER_CACHE_MB))
+    except worker.WorkerError as e:
+        print(f"[MLD] Heightfill worker unavailable, solving in-process: {e}")
+        return None, None
+    return _finish_numpy(obj, job)
 
-    # UV layer (check both work mesh and original)
-    uv_name = active_uv_layer_name(eval_me)
-    if not uv_name:
-        uv_name = active_uv_layer_name(obj.data)  # fallback to original
-    if not uv_name:
-        print("[MLD] Error: No UV layer found")
-        return False
+def _incremental_region(state, signature, hashes, loop_vi: np.ndarray, vcount: int):
+    """
+    (region_loops, region_vertices) to re-blend, ([], []) if nothing changed,
+    or None when a full solve is needed (no state, other inputs changed).
+    Region = every loop of every vertex that touches a changed mask block.
+    """
+    if not state or state["signature"] != signature or len(state["hashes"]) != len(hashes):
+        return None
+    changed = None
+    for old, new in zip(state["hashes"], hashes):
+        if (old is None) != (new is None) or (new is not None and len(old) != len(new)):
+            return None
+        if new is None:
+            continue
+        diff = old != new
+        changed = diff if changed is None else (changed | diff)
+    empty = np.zeros(0, dtype=np.int64)
+    if changed is None or not changed.any():
+        return empty, empty
+    nloops = len(loop_vi)
+    blocks = np.flatnonzero(changed)
+    starts = blocks * INCREMENTAL_BLOCK_LOOPS
+    dirty_loops = kernels.gather_ranges(starts, np.minimum(starts + INCREMENTAL_BLOCK_LOOPS, nloops) - starts)
+    verts = np.unique(loop_vi[dirty_loops])
+    if state.get("csr") is None:
+        state["csr"] = kernels.vertex_loops_csr(loop_vi, vcount)
+    return kernels.loops_of_vertices(state["csr"], verts), verts
 
-    # samplers per layer
-    samplers, uv_from = _gather_layer_samplers(obj, s)
-    if not any(samplers):
-        print("[MLD] Error: No valid samplers found")
-        return False
+def recalc_scope_vertices(obj, s, me: bpy.types.Mesh, loop_vi: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """
+    Sorted vertex indices inside s.recalc_scope (vertices of selected faces, or with
+    weight > 0 in s.recalc_vertex_group); None = whole mesh.
+    """
+    scope = getattr(s, "recalc_scope", 'ALL')
+    if scope == 'SELECTED':
+        sel = np.zeros(len(me.polygons), dtype=bool)
+        me.polygons.foreach_get("select", sel)
+        loop_start, loop_total = _read_poly_arrays(me)
+        if loop_vi is None:
+            loop_vi = np.empty(len(me.loops), dtype=np.int32)
+            me.loops.foreach_get("vertex_index", loop_vi)
+        return np.unique(loop_vi[kernels.gather_ranges(loop_start[sel], loop_total[sel])]).astype(np.int64)
+    if scope == 'VERTEX_GROUP':
+        name = getattr(s, "recalc_vertex_group", "")
+        vg = obj.vertex_groups.get(name) if name else None
+        if vg is None:
+            print(f"[MLD] Scope: vertex group '{name}' not found, recalculating the whole mesh")
+            return None
+        # no bulk accessor for deform weights: one pass over the vertices (callers read it once per recalc)
+        gi = vg.index
+        verts = []
+        for v in me.vertices:
+            for g in v.groups:
+                if g.group == gi:
+                    if g.weight > 0.0:
+                        verts.append(v.index)
+                    break
+        return np.array(verts, dtype=np.int64)
+    return None
 
-    n_layers = len(s.layers)
-    
-    # Ensure output attributes exist on ORIGINAL mesh
-    _ensure_output_attrs(obj.data, n_layers)
+def _scope_region(obj, s, eval_me, loop_vi: np.ndarray, vcount: int, n_layers: int,
+                  verts: Optional[np.ndarray] = None):
+    """
+    (region, previous) for a scoped recalc, or None for a whole-mesh solve.
+    Region = every loop of every in-scope vertex: that one-ring covers all loops the
+    scope vertices average over. previous = current OFFS z / alphas of the original
+    mesh, kept for every vertex outside the scope.
+    """
+    if getattr(s, "recalc_scope", 'ALL') == 'ALL':
+        return None
+    me = obj.data
+    if vcount != len(me.vertices) or len(loop_vi) != len(me.loops):
+        print("[MLD] Scope: work mesh does not match the object mesh, recalculating the whole mesh")
+        return None
+    if verts is None:
+        verts = recalc_scope_vertices(obj, s, eval_me, loop_vi)
+    if verts is None:
+        return None
+    offs = read_attr_array(me, OFFS_ATTR)
+    alphas = [read_attr_array(me, f"{ALPHA_PREFIX}{i}") for i in range(n_layers)]
+    if offs is None or offs.ndim != 2 or len(offs) != vcount or any(a is None or len(a) != vcount for a in alphas):
+        print("[MLD] Scope: no current result to keep, recalculating the whole mesh")
+        return None
+    loops = kernels.loops_of_vertices(kernels.vertex_loops_csr(loop_vi, vcount), verts)
+    return (loops, verts), {"offs_z": np.ascontiguousarray(offs[:, 2]), "alphas": alphas}
+
+# ------------------------------------------------------------------------------
+# Streaming engine: fixed-size loop windows, bounded peak memory
+# ------------------------------------------------------------------------------
+
+def _stream_window_loops(s, nloops: int, vcount: int, n_layers: int, persistent: int, threads: int) -> int:
+    """Loops per window so that persistent arrays + in-flight windows fit the memory budget."""
+    budget = int(getattr(s, "heightfill_memory_mb", DEFAULT_HEIGHTFILL_MEMORY_MB)) * 1048576
+    # per loop and layer: raw, height, mask, alpha (f32) + float64 sampling temps; plus shared temps.
+    # Window sums are compact (at most one float64 column per loop) + the vertex index arrays.
+    per_loop = n_layers * 24 + 64 + (1 + n_layers) * 8 + 24
+    avail = budget - persistent
+    if avail <= 0:
+        print(f"[MLD] Streaming: persistent data ({persistent / 1048576.0:.0f} MB) exceeds the "
+              f"{budget / 1048576.0:.0f} MB budget, using minimal windows")
+    # windows being computed plus finished ones waiting for the ordered reduction
+    window = avail // max(1, per_loop * max(threads, kernels.chunks_in_flight(threads)))
+    return int(min(max(window, 4096), max(nloops, 1)))
+
+def _solve_streaming(obj, s, stack, eval_me, uv_name, images) -> bool:
+    """
+    Bounded-memory heightfill. Only compact per-loop inputs (vertex index, UV,
+    uint8 mask palettes) and float32 per-vertex accumulators live for the whole
+    solve; heights are sampled per window and never cached. Results are
+    written straight into the output attributes of the original mesh.
+    """
+    loop_vi, uv = _read_loop_arrays(eval_me, uv_name)
+    nloops = len(loop_vi)
+    vcount = len(eval_me.vertices)
+    n_layers = len(stack.layers)
+    filt = getattr(s, "sampling_filter", 'BILINEAR')
+    storage = getattr(s, "sampler_precision", 'FLOAT32')
+    disk = getattr(s, "disk_cache_enable", False)
+    threads = kernels.resolve_threads(getattr(s, "heightfill_threads", 0))
+    footprint = kernels.face_uv_footprint(uv, *_read_poly_arrays(eval_me)) if filt == 'PREFILTERED' else None
+
+    ctx = {}
+    samplers, masks = [], []
+    for i, L in enumerate(stack.layers):
+        if not L.enabled:
+            samplers.append(None); masks.append(None)
+            continue
+        sp = get_sampler(images[i], storage, disk) if images[i] is not None else None
+        if sp is not None and filt == 'PREFILTERED':
+            ensure_mips(sp)
+        samplers.append(sp)
+        masks.append(kernels.compact_values(_read_mask_loops_np(obj, eval_me, L, loop_vi, uv_name, ctx)))
+    ctx.clear()  # drop the eval→orig loop map before the windows start
+
+    persistent = loop_vi.nbytes + uv.nbytes + (footprint.nbytes if footprint is not None else 0)
+    persistent += sum((m[0] if m[0] is not None else m[1]).nbytes for m in masks if m is not None)
+    persistent += vcount * 4 * (n_layers + 1) + vcount * 8
+    window = _stream_window_loops(s, nloops, vcount, n_layers, persistent, threads)
+    ranges = kernels.chunk_ranges(nloops, window)
+
+    table = kernels.compile_blend_table(stack)
+    tilings = [max(1e-8, L.tiling) for L in stack.layers]
+    idx_none = np.zeros(0, dtype=np.int64)
+
+    def _window(r):
+        a, b = r
+        wmasks = []
+        for i in range(n_layers):
+            if masks[i] is None:
+                wmasks.append(None)
+                continue
+            codes, lut = masks[i]
+            wmasks.append(lut[codes[a:b]] if codes is not None else lut[a:b])
+        needed = kernels.plan_culling(stack, wmasks, table)
+        raws = []
+        for i in range(n_layers):
+            sp = samplers[i]
+            if wmasks[i] is None:
+                raws.append(None)
+                continue
+            raw = np.zeros(b - a, dtype=np.float32)
+            idx = np.nonzero(needed[i])[0] if sp is not None else idx_none
+            if len(idx):
+                uu = uv[a + idx, 0] * tilings[i]; vv = uv[a + idx, 1] * tilings[i]
+                if footprint is not None:
+                    fp = footprint[a + idx] * np.float32(tilings[i] * max(sp["w"], sp["h"]))
+                    raw[idx] = kernels.sample_trilinear(sp["mips"], uu, vv, fp, backend.sample_bilinear)
+                else:
+                    raw[idx] = backend.sample_bilinear(sp["plane"], uu, vv, sp["scale"])
+            raws.append(raw)
+        verts, sums = _blend_reduce(loop_vi[a:b], raws, wmasks, stack, table)
+        return verts, sums, _cull_counts(stack, samplers, wmasks, needed, b - a), b - a
+
+    def _reduced():
+        for verts, sums, counts, n in kernels.map_chunks(_window, ranges, threads):
+            _record_cull_stats(counts, n)
+            yield verts, sums
+
+    acc = kernels.accumulate_chunks(_reduced(), 1 + n_layers, vcount, dtype=np.float32)
+    print(f"[MLD] Streaming: {nloops} loops in {len(ranges)} window(s) of {window} on {threads} thread(s), "
+          f"~{persistent / 1048576.0:.0f} MB resident")
+
+    # Finished per-vertex sums go straight into the output attributes
+    valence = kernels.loop_valence(loop_vi, vcount).astype(np.float32)
+    del loop_vi, uv, masks, footprint
+    me = obj.data
+    ok = write_offs_z(me, OFFS_ATTR, acc[0] / valence)
+    for i in range(n_layers):
+        write_attr_array(me, f"{ALPHA_PREFIX}{i}", acc[1 + i] / valence)
+    me.update()
+    return ok
+
+# ------------------------------------------------------------------------------
+# Python engine (reference implementation)
+# ------------------------------------------------------------------------------
+
+def _solve_python(obj, s, stack, eval_me, uv_name, samplers):
+    """Per-loop reference heightfill. Returns (accum_offs, accum_alpha) lists."""
+    n_layers = len(stack.layers)
+    ctx = {}  # per-solve mask mapping
+    table = _compile_scalar_blend_table(stack.layers)
+    midlevel, strength = stack.midlevel, stack.strength
 
     # Init accumulators for WORK mesh
     vcount = len(eval_me.vertices)
     accum_offs = [(0.0, 0.0, 0.0)] * vcount
     accum_alpha = [ [0.0]*vcount for _ in range(n_layers) ]
 
-    print(f"[MLD] Processing {len(eval_me.polygons)} polygons with NEW blending system...")
-
     # Process polygons on WORK mesh
     for poly in eval_me.polygons:
         for li in range(poly.loop_start, poly.loop_start + poly.loop_total):
@@ -334,13 +672,13 @@ def solve_heightfill(obj: bpy.types.Object, s, context=None, work_mesh: bpy.type
             # Собираем данные по всем слоям для этого loop
             layer_data = []
             
-            for i, L in enumerate(s.layers):
+            for i, L in enumerate(stack.layers):
                 if not L.enabled:
                     layer_data.append({'height': 0.0, 'mask': 0.0, 'layer': L})
                     continue
                     
                 # Получаем значение маски (из оригинального меша)
-                m = _get_mask_value_for_loop(obj, eval_me, L, li, vi, uv_name)
+                m = _get_mask_value_for_loop(obj, eval_me, L, li, vi, uv_name, ctx)
                 
                 # Получаем значение высоты (из work mesh)
                 h = _get_height_value_for_loop(eval_me, uv_name, li, L, samplers[i])
@@ -355,11 +693,11 @@ def solve_heightfill(obj: bpy.types.Object, s, context=None, work_mesh: bpy.type
                 })
 
             # НОВЫЙ АЛГОРИТМ СМЕШИВАНИЯ
-            final_height, alphas = _blend_layers_new(layer_data, s)
+            final_height, alphas = _blend_layers_new(layer_data, s, table)
 
             # Накапливаем для вершины work mesh
             ox, oy, oz = accum_offs[vi]
-            accum_offs[vi] = (ox, oy, oz + (final_height - s.midlevel) * s.strength)
+            accum_offs[vi] = (ox, oy, oz + (final_height - midlevel) * strength)
             for i in range(n_layers):
                 accum_alpha[i][vi] += alphas[i]
 
@@ -377,12 +715,215 @@ def solve_heightfill(obj: bpy.types.Object, s, context=None, work_mesh: bpy.type
         for i in range(n_layers):
             accum_alpha[i][vi] = accum_alpha[i][vi] / d
 
+    return accum_offs, accum_alpha
+
+def _solve_inputs(obj: bpy.types.Object, s, context=None, work_mesh: bpy.types.Mesh = None):
+    """
+    Main-thread setup shared by every engine: work mesh, UV layer, height images and the
+    layer stack snapshot. Returns (eval_me, uv_name, images, stack) or None on error.
+    """
+    if context is None:
+        context = bpy.context
+    
+    # Use provided work_mesh or get evaluated mesh
+    if work_mesh:
+        eval_me = work_mesh
+        print(f"[MLD] Using provided work mesh: {len(eval_me.vertices)} vertices")
+    else:
+        eval_me, eval_obj = _get_evaluated_mesh(obj, context)
+    
+    if eval_me is None or eval_me.loop_triangles is None:
+        eval_me.calc_loop_triangles()
+
+    # UV layer (check both work mesh and original)
+    uv_name = active_uv_layer_name(eval_me)
+    if not uv_name:
+        uv_name = active_uv_layer_name(obj.data)  # fallback to original
+    if not uv_name:
+        print("[MLD] Error: No UV layer found")
+        return None
+
+    # height images per layer (samplers are only built where samples are not cached)
+    images = _gather_layer_images(s)
+    if not any(images):
+        print("[MLD] Error: No valid samplers found")
+        return None
+
+    # Layer stack is read from RNA once; the engines only see the snapshot.
+    # OFFS.z stores the raw blended height: GN applies (height - midlevel) * strength.
+    stack = snapshot_stack(s)._replace(strength=1.0, midlevel=0.0)
+    _LAST_SOLVE_STATS.clear()
+    
+    # Ensure output attributes exist on ORIGINAL mesh
+    _ensure_output_attrs(obj.data, len(stack.layers))
+    set_sampler_cache_budget(getattr(s, "sampler_cache_mb", DEFAULT_SAMPLER_CACHE_MB))
+    set_disk_cache_dir(getattr(s, "disk_cache_dir", ""))
+    return eval_me, uv_name, images, stack
+
+def _report_solve(vcount: int, stack):
+    print(f"[MLD] NEW heightfill completed successfully on {vcount} vertices")
+    blend_modes_used = [L.blend_mode for L in stack.layers if L.enabled]
+    print(f"[MLD] Blend modes used: {blend_modes_used}")
+    _report_cull_stats(stack)
+    st = sampler_cache_stats()
+    print(f"[MLD] Sampler cache: {st['hits']} hits, {st['misses']} misses, {st['evictions']} evictions, "
+          f"{st['entries']} images / {st['bytes'] / 1048576.0:.1f} MB")
+
+# ------------------------------------------------------------------------------
+# Background solve: begin (main thread) -> run (any thread) -> end (main thread)
+# ------------------------------------------------------------------------------
+
+def begin_heightfill(obj: bpy.types.Object, s, context=None, work_mesh: bpy.types.Mesh = None,
+                     scope_verts: Optional[np.ndarray] = None) -> Optional[dict]:
+    """
+    Snapshot every input of a NumPy solve on the main thread. Returns a job for
+    run_heightfill_job / end_heightfill, or None when the solve cannot run in the
+    background (other engine or invalid inputs) — use solve_heightfill then.
+    """
+    if getattr(s, "heightfill_engine", 'NUMPY') != 'NUMPY':
+        return None
+    inputs = _solve_inputs(obj, s, context, work_mesh)
+    if inputs is None:
+        return None
+    eval_me, uv_name, images, stack = inputs
+    print(f"[MLD] Processing {len(eval_me.polygons)} polygons with NEW blending system (NUMPY engine, background)...")
+    return _prepare_numpy(obj, s, stack, eval_me, uv_name, images, scope_verts=scope_verts)
+
+def run_heightfill_job(job: dict, progress=None, cancelled=None) -> bool:
+    """Blend a begun job (NumPy only, safe off the main thread). False when cancelled."""
+    try:
+        _run_numpy(job, progress, cancelled)
+    except SolveCancelled:
+        return False
+    return True
+
+def stale_heightfill_target(obj: bpy.types.Object, job: dict) -> Optional[str]:
+    """
+    Why a begun job's result can no longer be written to obj.data (None = it can).
+    The UI stays live while the job runs: undo may have replaced the mesh, Edit Mode
+    would drop the write, and a topology edit would shift it onto other vertices.
+    """
+    mode = getattr(obj, "mode", 'OBJECT')
+    if mode != 'OBJECT':
+        return f"object is in {mode.replace('_', ' ').title()} mode"
+    me = obj.data
+    loop_vi = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loop_vi)
+    if cache.array_digest(loop_vi, len(me.vertices), len(me.polygons)) != job["ld"]["topo_key"]:
+        return "mesh topology changed"
+    return None
+
+def end_heightfill(obj: bpy.types.Object, job: dict) -> bool:
+    """Main thread: store caches and write the finished job's results to the (re-read) mesh."""
+    if job.get("result") is None or stale_heightfill_target(obj, job) is not None:
+        return False
+    offs_z, alphas_v = _finish_numpy(obj, job)
+    success = _transfer_result_to_original(obj.data, obj.data, offs_z, alphas_v, job["n_layers"])
+    if success:
+        _report_solve(job["vcount"], job["stack"])
+    return success
+
+def solve_heightfill(obj: bpy.types.Object, s, context=None, work_mesh: bpy.types.Mesh = None,
+                     scope_verts: Optional[np.ndarray] = None) -> bool:
+    """
+    ОБНОВЛЕННАЯ Core heightfill с новой системой смешивания слоев.
+    Engine is picked by s.heightfill_engine ('NUMPY', 'STREAMING' or the 'PYTHON' reference).
+    Returns True on success.
+    """
+    inputs = _solve_inputs(obj, s, context, work_mesh)
+    if inputs is None:
+        return False
+    eval_me, uv_name, images, stack = inputs
+    n_layers = len(stack.layers)
+
+    vcount = len(eval_me.vertices)
+    engine = getattr(s, "heightfill_engine", 'NUMPY')
+    if engine == 'GEOMETRY_NODES':
+        engine = 'NUMPY'  # blend lives in the GN group; an explicit solve uses the NumPy reference
+    print(f"[MLD] Processing {len(eval_me.polygons)} polygons with NEW blending system ({engine} engine)...")
+    if engine != 'NUMPY' and getattr(s, "recalc_scope", 'ALL') != 'ALL':
+        print(f"[MLD] Scope: the {engine} engine always recalculates the whole mesh")
+
+    if engine == 'STREAMING':
+        try:
+            success = _solve_streaming(obj, s, stack, eval_me, uv_name, images)
+        except Exception as e:
+            print(f"[MLD] Streaming heightfill failed: {e}")
+            success = False
+        if success:
+            print(f"[MLD] NEW heightfill completed successfully on {vcount} vertices (streaming)")
+            _report_cull_stats(stack)
+        return success
+
+    offs_z = alphas_v = None
+    if engine == 'NUMPY':
+        try:
+            if getattr(s, "heightfill_worker", False):
+                offs_z, alphas_v = _solve_worker(obj, s, stack, eval_me, uv_name, images, scope_verts)
+            if offs_z is None:
+                offs_z, alphas_v = _solve_numpy(obj, s, stack, eval_me, uv_name, images, scope_verts)
+        except Exception as e:
+            print(f"[MLD] NumPy heightfill failed, falling back to Python engine: {e}")
+            offs_z = alphas_v = None
+            _LAST_SOLVE_STATS.clear()
+    if offs_z is None:
+        samplers, uv_from = _gather_layer_samplers(obj, s)
+        accum_offs, accum_alpha = _solve_python(obj, s, stack, eval_me, uv_name, samplers)
+        offs_z = np.array([o[2] for o in accum_offs], dtype=np.float32)
+        alphas_v = [np.asarray(a, dtype=np.float32) for a in accum_alpha]
+
     # Transfer results back to ORIGINAL mesh attributes
-    success = _transfer_result_to_original(obj.data, eval_me, accum_offs, accum_alpha, n_layers)
+    success = _transfer_result_to_original(obj.data, eval_me, offs_z, alphas_v, n_layers)
     
     if success:
-        print(f"[MLD] NEW heightfill completed successfully on {vcount} vertices")
-        blend_modes_used = [L.blend_mode for L in s.layers if L.enabled]
-        print(f"[MLD] Blend modes used: {blend_modes_used}")
+        _report_solve(vcount, stack)
     
-    return success
\ No newline at end of file
+    return success
+
+# ------------------------------------------------------------------------------
+# Alpha-only solve for material assignment
+# ------------------------------------------------------------------------------
+
+def solve_face_alphas(obj: bpy.types.Object, s) -> Optional[List[np.ndarray]]:
+    """
+    Per-face blend alpha of every layer straight from the current masks: the NumPy
+    solve with faces in place of vertices, so each face gets the average of its own
+    loops' alphas. Nothing is written to the mesh (no OFFS, carrier, GN or preview);
+    heights are only sampled where a HEIGHT_BLEND layer compares against them.
+    Returns one float32 (npoly,) array per layer, or None on error.
+    """
+    me = obj.data
+    uv_name = active_uv_layer_name(me)
+    if not uv_name:
+        print("[MLD] Error: No UV layer found")
+        return None
+    images = _gather_layer_images(s)
+    stack = snapshot_stack(s)._replace(strength=1.0, midlevel=0.0)
+    set_sampler_cache_budget(getattr(s, "sampler_cache_mb", DEFAULT_SAMPLER_CACHE_MB))
+    set_disk_cache_dir(getattr(s, "disk_cache_dir", ""))
+
+    loop_vi, uv = _read_loop_arrays(me, uv_name)
+    loop_start, loop_total = _read_poly_arrays(me)
+    npoly = len(loop_start)
+    filt = getattr(s, "sampling_filter", 'BILINEAR')
+    footprint = kernels.face_uv_footprint(uv, loop_start, loop_total) if filt == 'PREFILTERED' else None
+    ld = core.loop_data(uv, filt, footprint, getattr(s, "heightfill_threads", 0),
+                        getattr(s, "heightfill_chunk_size", DEFAULT_HEIGHTFILL_CHUNK))
+    # same keys as the heightfill, so both share the layer sample cache
+    ld.update(topo_key=cache.array_digest(loop_vi, len(me.vertices), npoly), uv_key=cache.array_digest(uv))
+    cache.prune_layer_samples(obj, len(stack.layers))
+
+    face_of_loop = np.repeat(np.arange(npoly, dtype=np.int32), loop_total)
+    smasks = [_read_mask_sparse(obj, me, L, loop_vi, uv_name, ld) if L.enabled else None
+              for L in stack.layers]
+    job = core.new_job(stack, ld, face_of_loop, npoly)
+    # layers whose heights no HEIGHT_BLEND layer reads get no plan: no pixels, no sampling
+    make_plan = lambda i, L, need: _layer_sample_plan(obj, s, i, L, images[i], ld, need) if len(need) else None
+    core.plan_job(job, smasks, make_plan, alphas_only=True)
+    n_heights = sum(int(np.count_nonzero(n)) for n in job.pop("needed") if n is not None)
+    print(f"[MLD] Alpha-only solve: {npoly} faces, {job['n_support']}/{job['nloops']} loops painted, "
+          f"{n_heights} height samples needed")
+    _run_numpy(job)
+    for plan in job["plans"]:
+        _store_layer_plan(obj, plan)
+    return job["result"][1]
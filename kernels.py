@@ -0,0 +1,491 @@
+# kernels.py — vectorized NumPy heightfill kernels (no bpy imports)
+"""
+Array counterparts of core.sample_bilinear_scalar and core.blend_layers_scalar.
+
+Everything here works on plain NumPy arrays: the Blender side bulk-reads mesh
+data once (foreach_get) and hands it over, so the hot path never touches RNA.
+"""
+from __future__ import annotations
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rec.709 luminance weights (used by sampling.make_sampler)
+LUMA_R, LUMA_G, LUMA_B = 0.2126, 0.7152, 0.0722
+
+# ------------------------------------------------------------------------------
+# Image sampling
+# ------------------------------------------------------------------------------
+
+def luminance_plane(px, w: int, h: int, ch: int) -> np.ndarray:
+    """Collapse a pixel buffer (flat w*h*ch or 2D (h, w*ch) view) into a (h, w) float32 height plane."""
+    texels = np.asarray(px, dtype=np.float32).reshape(h, w, ch)
+    if ch >= 3:
+        return (LUMA_R * texels[..., 0] + LUMA_G * texels[..., 1]
+                + LUMA_B * texels[..., 2]).astype(np.float32)
+    return np.ascontiguousarray(texels[..., 0])
+
+# Height plane storage: dtype and decode scale (stored value * scale = height)
+PLANE_STORAGE = {
+    'FLOAT32': (np.float32, 1.0),
+    'FLOAT16': (np.float16, 1.0),
+    'UINT16':  (np.uint16, 1.0 / 65535.0),
+}
+
+def encode_plane(lum: np.ndarray, storage: str = 'FLOAT32') -> Tuple[np.ndarray, float]:
+    """Store a float32 luminance plane as float32/float16/uint16; returns (plane, scale).
+    UINT16 quantizes texels to [0, 1] (samples are clamped to that range anyway)."""
+    dtype, scale = PLANE_STORAGE.get(storage, PLANE_STORAGE['FLOAT32'])
+    if dtype is np.uint16:
+        q = np.clip(lum, 0.0, 1.0) * 65535.0 + 0.5
+        return q.astype(np.uint16), scale
+    return lum.astype(dtype, copy=False), scale
+
+def sample_bilinear(plane: np.ndarray, u: np.ndarray, v: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    """Wrap-around bilinear lookup of many (u, v) pairs; mirrors core.sample_bilinear_scalar."""
+    h, w = plane.shape
+    u = np.asarray(u, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    u = u - np.trunc(u); u[u < 0.0] += 1.0
+    v = v - np.trunc(v); v[v < 0.0] += 1.0
+    x = u * (w - 1); y = v * (h - 1)
+    x0 = x.astype(np.int64); y0 = y.astype(np.int64)
+    tx = x - x0; ty = y - y0
+    x0 %= w; y0 %= h
+    x1 = (x0 + 1) % w; y1 = (y0 + 1) % h
+    c0 = plane[y0, x0] * (1.0 - tx) + plane[y0, x1] * tx
+    c1 = plane[y1, x0] * (1.0 - tx) + plane[y1, x1] * tx
+    val = c0 * (1.0 - ty) + c1 * ty
+    if scale != 1.0:
+        val *= scale
+    np.clip(val, 0.0, 1.0, out=val)
+    return val.astype(np.float32)
+
+def unique_coords(u: np.ndarray, v: np.ndarray, extra: Optional[np.ndarray] = None):
+    """
+    Deduplicate sample coordinates.
+    Returns (first, inverse): coords[first] are the unique ones, coords == coords[first][inverse].
+    u/v(/extra) are compared bit-exactly as float32.
+    """
+    ub = np.ascontiguousarray(u, dtype=np.float32).view(np.uint32).astype(np.uint64)
+    vb = np.ascontiguousarray(v, dtype=np.float32).view(np.uint32).astype(np.uint64)
+    if extra is None:
+        key = (ub << np.uint64(32)) | vb
+    else:
+        rows = np.stack([np.asarray(u, np.float32), np.asarray(v, np.float32),
+                         np.asarray(extra, np.float32)], axis=1)
+        key = np.ascontiguousarray(rows).view(np.dtype((np.void, rows.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return first, inverse.reshape(-1)
+
+# ------------------------------------------------------------------------------
+# Prefiltered sampling (mip pyramid + trilinear lookup)
+# ------------------------------------------------------------------------------
+
+def _downsample_wrap(a: np.ndarray) -> np.ndarray:
+    """2x2 box filter with wrap-around (odd sizes pair the last texel with the first)."""
+    h, w = a.shape
+    w2 = max(1, (w + 1) // 2); h2 = max(1, (h + 1) // 2)
+    xa = (2 * np.arange(w2)) % w; xb = (2 * np.arange(w2) + 1) % w
+    ya = (2 * np.arange(h2)) % h; yb = (2 * np.arange(h2) + 1) % h
+    cols = (a[:, xa] + a[:, xb]) * 0.5
+    return ((cols[ya, :] + cols[yb, :]) * 0.5).astype(np.float32)
+
+def build_mip_pyramid(plane: np.ndarray, scale: float = 1.0) -> List[Tuple[np.ndarray, float]]:
+    """Mip chain [(level, scale), ...]; level 0 is the plane itself, the rest decoded float32."""
+    levels = [(plane, scale)]
+    cur = np.asarray(plane, dtype=np.float32) * np.float32(scale)
+    while cur.shape[0] > 1 or cur.shape[1] > 1:
+        cur = _downsample_wrap(cur)
+        levels.append((cur, 1.0))
+    return levels
+
+def face_uv_footprint(uv: np.ndarray, loop_start: np.ndarray, loop_total: np.ndarray) -> np.ndarray:
+    """Per-loop UV footprint: sqrt of the UV area of the loop's face (shoelace)."""
+    nloops = len(uv)
+    face_of_loop = np.repeat(np.arange(len(loop_start)), loop_total)
+    nxt = np.arange(1, nloops + 1)
+    last = loop_start + loop_total - 1
+    nxt[last] = loop_start
+    u = uv[:, 0].astype(np.float64); v = uv[:, 1].astype(np.float64)
+    cross = u * v[nxt] - u[nxt] * v
+    area = 0.5 * np.abs(np.bincount(face_of_loop, weights=cross, minlength=len(loop_start)))
+    return np.sqrt(area)[face_of_loop].astype(np.float32)
+
+def sample_trilinear(mips: List[Tuple[np.ndarray, float]], u: np.ndarray, v: np.ndarray,
+                     footprint_texels: np.ndarray, bilinear: Optional[Callable] = None) -> np.ndarray:
+    """Average the texel footprint of each sample: pick mip level by log2(footprint), blend two levels.
+    bilinear: per-level lookup with sample_bilinear's signature (default: sample_bilinear)."""
+    if bilinear is None:
+        bilinear = sample_bilinear
+    n = len(u)
+    out = np.empty(n, dtype=np.float32)
+    top = len(mips) - 1
+    lod = np.clip(np.log2(np.maximum(footprint_texels, 1.0)), 0.0, float(top))
+    l0 = np.floor(lod).astype(np.int64)
+    t = (lod - l0).astype(np.float32)
+    for level in np.unique(l0):
+        sel = np.nonzero(l0 == level)[0]
+        plane, scale = mips[level]
+        a = bilinear(plane, u[sel], v[sel], scale)
+        if level < top:
+            tt = t[sel]
+            if np.any(tt > 0.0):
+                nplane, nscale = mips[level + 1]
+                a = a * (1.0 - tt) + bilinear(nplane, u[sel], v[sel], nscale) * tt
+        out[sel] = a
+    return out
+
+# ------------------------------------------------------------------------------
+# Blend modes (array versions of heightfill._apply_*_blend)
+# ------------------------------------------------------------------------------
+
+def blend_simple(base, height, mask):
+    fb = np.clip(mask, 0.0, 1.0)
+    return base * (1.0 - fb) + height * fb, fb
+
+def blend_height(base, height, mask, height_offset: float):
+    if height_offset <= 0.0:
+        return base, np.zeros_like(base)
+    if height_offset >= 1.0:
+        bf = np.ones_like(base)
+    else:
+        nd = (height - base + 1.0) * 0.5
+        bf = np.clip((nd - (1.0 - height_offset)) / height_offset, 0.0, 1.0)
+        # smoothstep (identity at 0 and 1, so no need to mask the endpoints)
+        bf = bf * bf * (3.0 - 2.0 * bf)
+    fb = np.where(mask > 0.0, bf * mask, 0.0).astype(base.dtype)
+    return base * (1.0 - fb) + height * fb, fb
+
+def blend_switch(base, height, mask, switch_opacity: float):
+    if switch_opacity <= 0.0:
+        return base, np.zeros_like(base)
+    fb = np.where(mask > 0.0, np.clip(switch_opacity * mask, 0.0, 1.0), 0.0).astype(base.dtype)
+    return base * (1.0 - fb) + height * fb, fb
+
+# ------------------------------------------------------------------------------
+# Sparse masks: only the painted elements of a layer mask
+# ------------------------------------------------------------------------------
+
+class SparseMask(NamedTuple):
+    """Nonzero elements of a per-loop (or per-point) mask: sorted indices + values."""
+    size: int
+    indices: np.ndarray   # int64, ascending
+    values: np.ndarray    # float32, all != 0
+
+    @classmethod
+    def from_dense(cls, dense: np.ndarray) -> "SparseMask":
+        dense = np.asarray(dense, dtype=np.float32)
+        idx = np.flatnonzero(dense)
+        return cls(len(dense), idx, dense[idx])
+
+    @classmethod
+    def empty(cls, size: int) -> "SparseMask":
+        return cls(size, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+    @property
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    @property
+    def coverage(self) -> float:
+        return self.nnz / max(1, self.size)
+
+    def dense(self, fill: float = 0.0) -> np.ndarray:
+        out = np.full(self.size, fill, dtype=np.float32)
+        out[self.indices] = self.values
+        return out
+
+    def take(self, positions: np.ndarray) -> np.ndarray:
+        """Values at arbitrary (sorted or not) positions; 0 where the mask is unpainted."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.nnz == 0:
+            return np.zeros(len(positions), dtype=np.float32)
+        k = np.minimum(np.searchsorted(self.indices, positions), self.nnz - 1)
+        return np.where(self.indices[k] == positions, self.values[k], 0.0).astype(np.float32)
+
+def sparse_support(masks: Sequence[Optional[SparseMask]]) -> np.ndarray:
+    """Sorted union of the painted indices of several masks."""
+    parts = [m.indices for m in masks if m is not None and m.nnz]
+    if not parts:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(parts))
+
+def scatter_to_support(mask: SparseMask, support: np.ndarray) -> np.ndarray:
+    """Mask values laid out over `support` (which must contain mask.indices)."""
+    out = np.zeros(len(support), dtype=np.float32)
+    out[np.searchsorted(support, mask.indices)] = mask.values
+    return out
+
+# ------------------------------------------------------------------------------
+# Layer stack snapshot + compiled blend table
+# ------------------------------------------------------------------------------
+
+class LayerParams(NamedTuple):
+    """Immutable copy of one MLD_Layer, taken once per solve (field names match the RNA ones)."""
+    enabled: bool
+    blend_mode: str
+    strength: float
+    bias: float
+    tiling: float
+    height_offset: float
+    switch_opacity: float
+    mask_name: str
+
+class StackParams(NamedTuple):
+    """Immutable copy of the MLD_Settings values the solver needs."""
+    layers: Tuple[LayerParams, ...]
+    strength: float
+    midlevel: float
+
+BlendKernel = Callable[[np.ndarray, np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+def _bind_simple(L: LayerParams) -> Optional[BlendKernel]:
+    return blend_simple
+
+def _bind_height(L: LayerParams) -> Optional[BlendKernel]:
+    off = float(L.height_offset)
+    return None if off <= 0.0 else (lambda base, height, mask: blend_height(base, height, mask, off))
+
+def _bind_switch(L: LayerParams) -> Optional[BlendKernel]:
+    op = float(L.switch_opacity)
+    return None if op <= 0.0 else (lambda base, height, mask: blend_switch(base, height, mask, op))
+
+# blend_mode -> binder(layer) -> kernel (None = the layer never contributes)
+BLEND_KERNELS = {
+    'SIMPLE': _bind_simple,
+    'HEIGHT_BLEND': _bind_height,
+    'SWITCH': _bind_switch,
+}
+
+def compile_blend_table(stack: StackParams) -> Tuple[Optional[BlendKernel], ...]:
+    """Resolve every layer's blend kernel once; None for disabled / no-op layers."""
+    table = []
+    for L in stack.layers:
+        bind = BLEND_KERNELS.get(L.blend_mode) if L.enabled else None
+        table.append(bind(L) if bind else None)
+    return tuple(table)
+
+def blend_stack(heights: Sequence[np.ndarray], masks: Sequence[np.ndarray],
+                table: Sequence[Optional[BlendKernel]]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Blend the whole layer stack for every loop at once.
+
+    heights/masks: one float32 array per layer (already strength/bias processed).
+    Returns (final_height, alphas) with the same semantics as core.blend_layers_scalar.
+    """
+    n_layers = len(heights)
+    if n_layers == 0:
+        return np.zeros(0, dtype=np.float32), []
+
+    current = heights[0] * masks[0]
+    alphas = [masks[0].astype(np.float32, copy=True)]
+
+    for i in range(1, n_layers):
+        kernel = table[i]
+        m = masks[i]
+        if kernel is None or not np.any(m > 0.0):
+            alphas.append(np.zeros_like(current))
+            continue
+        current, a = kernel(current, heights[i], m)
+        alphas.append(a)
+
+    return current, alphas
+
+# ------------------------------------------------------------------------------
+# Culling: which (layer, loop) heights can change the result at all
+# ------------------------------------------------------------------------------
+
+def _opaque(L: LayerParams, mask: np.ndarray) -> Optional[np.ndarray]:
+    """Loops where the layer's blend factor is exactly 1 (lower heights are replaced)."""
+    if L.blend_mode == 'SIMPLE':
+        return mask >= 1.0
+    if L.blend_mode == 'SWITCH' and L.switch_opacity > 0.0:
+        return (float(L.switch_opacity) * mask) >= 1.0
+    if L.blend_mode == 'HEIGHT_BLEND' and L.height_offset >= 1.0:
+        # factor is the unclamped mask: above 1 it extrapolates from the height below
+        return mask == 1.0
+    return None
+
+def _reads_base(L: LayerParams) -> bool:
+    """HEIGHT_BLEND with 0 < offset < 1 compares against the height below, so it needs it exactly."""
+    return L.blend_mode == 'HEIGHT_BLEND' and 0.0 < L.height_offset < 1.0
+
+def plan_culling(stack: StackParams, masks: Sequence[Optional[np.ndarray]],
+                 table: Sequence[Optional[BlendKernel]]) -> List[Optional[np.ndarray]]:
+    """
+    Per layer, the loops whose height must be sampled (None for disabled layers).
+
+    A height is not needed where the layer's mask is zero, or where an opaque
+    layer above replaced it — unless a HEIGHT_BLEND layer between them (or the
+    layer itself) reads it. Skipped heights may be left at 0: the blended
+    height and all alphas stay exactly the same.
+    """
+    n_layers = len(stack.layers)
+    needed: List[Optional[np.ndarray]] = [None] * n_layers
+    blocked = None
+    for i in reversed(range(n_layers)):
+        L = stack.layers[i]; m = masks[i]
+        if not L.enabled or m is None:
+            continue
+        active = m > 0.0
+        if i > 0 and (table[i] is None or not active.any()):
+            needed[i] = np.zeros(len(m), dtype=bool)   # never blended
+            continue
+        reads = i > 0 and _reads_base(L)
+        if blocked is None:
+            needed[i] = active
+        elif reads:
+            needed[i] = active                          # its own alpha needs the height
+        else:
+            needed[i] = active & ~blocked
+        if i == 0:
+            break
+        if reads and blocked is not None:
+            blocked = blocked & ~active
+        op = _opaque(L, m)
+        if op is not None:
+            blocked = op if blocked is None else (blocked | op)
+    return needed
+
+def plan_alpha_culling(stack: StackParams, masks: Sequence[Optional[np.ndarray]],
+                       table: Sequence[Optional[BlendKernel]]) -> List[Optional[np.ndarray]]:
+    """
+    plan_culling for callers that only need the alphas. SIMPLE / SWITCH alphas and
+    HEIGHT_BLEND alphas with offset >= 1 only depend on the masks; a height is only
+    needed where a HEIGHT_BLEND layer that reads the base sees it (its own height,
+    or the blended height below it until an opaque layer replaced that).
+    """
+    n_layers = len(stack.layers)
+    needed: List[Optional[np.ndarray]] = [None] * n_layers
+    read = None  # loops where the blended height below the current layer is read
+    for i in reversed(range(n_layers)):
+        L = stack.layers[i]; m = masks[i]
+        if not L.enabled or m is None:
+            continue
+        active = m > 0.0
+        if i > 0 and (table[i] is None or not active.any()):
+            needed[i] = np.zeros(len(m), dtype=bool)   # never blended
+            continue
+        reads = i > 0 and _reads_base(L)
+        own = active if reads else np.zeros(len(m), dtype=bool)
+        needed[i] = own if read is None else (own | (active & read))
+        if i == 0:
+            break
+        op = _opaque(L, m)
+        if read is not None and op is not None:
+            read = read & ~op
+        if reads:
+            read = own if read is None else (read | own)
+    return needed
+
+# ------------------------------------------------------------------------------
+# Loop → vertex reduction
+# ------------------------------------------------------------------------------
+
+def vertex_loops_csr(loop_vi: np.ndarray, vcount: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vertex → loops adjacency: loops of vertex v are order[offsets[v]:offsets[v + 1]]."""
+    order = np.argsort(loop_vi, kind='stable')
+    offsets = np.zeros(vcount + 1, dtype=np.int64)
+    np.cumsum(np.bincount(loop_vi, minlength=vcount)[:vcount], out=offsets[1:])
+    return order, offsets
+
+def loops_of_vertices(csr: Tuple[np.ndarray, np.ndarray], verts: np.ndarray) -> np.ndarray:
+    """Sorted indices of every loop of `verts` (csr from vertex_loops_csr)."""
+    order, offsets = csr
+    return np.sort(order[gather_ranges(offsets[verts], offsets[verts + 1] - offsets[verts])])
+
+def gather_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenated aranges [s, s + c) for every (s, c) pair."""
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    return np.repeat(np.asarray(starts, dtype=np.int64) - (ends - counts), counts) + np.arange(total)
+
+def loop_valence(loop_vi: np.ndarray, vcount: int) -> np.ndarray:
+    """Number of loops per vertex (min 1, so it is safe to divide by)."""
+    val = np.bincount(loop_vi, minlength=vcount)[:vcount]
+    return np.maximum(val, 1)
+
+# ------------------------------------------------------------------------------
+# Chunked execution (NumPy releases the GIL inside array ops, so threads scale)
+# ------------------------------------------------------------------------------
+
+def resolve_threads(threads: int) -> int:
+    """0 → one thread per CPU core."""
+    return max(1, int(threads) if threads and threads > 0 else (os.cpu_count() or 1))
+
+def chunk_ranges(n: int, size: int) -> List[Tuple[int, int]]:
+    """[(start, stop), ...] covering range(n) in order."""
+    size = max(1, int(size))
+    return [(a, min(a + size, n)) for a in range(0, n, size)]
+
+def chunks_in_flight(threads: int) -> int:
+    """Most chunk results map_chunks holds at once (for memory budgets)."""
+    return 1 if threads <= 1 else 2 * threads
+
+def map_chunks(fn: Callable, items: Sequence, threads: int = 1) -> Iterator:
+    """
+    fn over items, results yielded IN ITEM ORDER whatever the thread count.
+    At most chunks_in_flight(threads) results are in flight, so memory stays bounded.
+    """
+    if threads <= 1 or len(items) <= 1:
+        for it in items:
+            yield fn(it)
+        return
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        pending = deque()
+        for it in items:
+            pending.append(ex.submit(fn, it))
+            if len(pending) >= chunks_in_flight(threads):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def compact_vertices(loop_vi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (verts, local) with verts[local] == loop_vi and len(verts) <= len(loop_vi), so
+    per-chunk sums scale with the chunk, not with the vertex index range it spans
+    (loop order need not follow vertex order: scans, remeshed / decimated meshes).
+    """
+    if len(loop_vi) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lo = int(loop_vi.min()); span = int(loop_vi.max()) - lo + 1
+    if span <= len(loop_vi):
+        return np.arange(lo, lo + span, dtype=np.int64), loop_vi - lo  # dense chunk: no sort
+    verts, local = np.unique(loop_vi, return_inverse=True)
+    return verts.astype(np.int64), local.reshape(-1)
+
+def reduce_chunk(loop_vi: np.ndarray, values: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-vertex sums of one loop chunk over the vertices it touches.
+    Returns (verts, sums[len(values), len(verts)]) — add into the totals in chunk order.
+    """
+    verts, local = compact_vertices(loop_vi)
+    sums = np.empty((len(values), len(verts)), dtype=np.float64)
+    for k, v in enumerate(values):
+        sums[k] = np.bincount(local, weights=v, minlength=len(verts))
+    return verts, sums
+
+def compact_values(values: np.ndarray, max_codes: int = 256):
+    """
+    Lossless uint8 palette of an array with few distinct values (e.g. BYTE_COLOR masks).
+    Returns (codes, lut) so that lut[codes] == values, or (None, values) if there are too many.
+    """
+    lut, codes = np.unique(values, return_inverse=True)
+    if len(lut) > max_codes:
+        return None, values
+    return codes.reshape(-1).astype(np.uint8), lut.astype(values.dtype)
+
+def accumulate_chunks(results: Iterable[Tuple[np.ndarray, np.ndarray]], n_values: int, vcount: int,
+                      dtype=np.float64) -> np.ndarray:
+    """Deterministic reduction: chunk partial sums (reduce_chunk) are added strictly in chunk order."""
+    acc = np.zeros((n_values, vcount), dtype=dtype)
+    for verts, sums in results:
+        acc[:, verts] += sums  # verts are unique within a chunk
+    return acc
@@ -2,7 +2,8 @@ from __future__ import annotations
 import bpy
 from bpy.types import Operator
 from .utils import active_obj
-from .constants import ALPHA_PREFIX
+from .ops_materials import assign_materials_by_alpha, assign_materials_by_face_alpha
+from .heightfill import solve_face_alphas
 
 def _ensure_obj_active(obj: bpy.types.Object):
     ctx = bpy.context
@@ -24,25 +25,23 @@ def _ensure_mat_slot(obj: bpy.types.Object, mat: bpy.types.Material) -> int:
     mats.append(mat)
     return len(mats) - 1
 
-def _poly_alpha_for_layer(me: bpy.types.Mesh, layer_index: int, poly: bpy.types.MeshPolygon) -> float:
-    """Average point-domain ALPHA_i over polygon vertices."""
-    attr = me.attributes.get(f"{ALPHA_PREFIX}{layer_index}")
-    if not attr:
-        return 0.0
-    acc = 0.0
-    try:
-        for vi in poly.vertices:
-            acc += float(attr.data[vi].value)
-        return acc / max(1, len(poly.vertices))
-    except Exception:
-        return 0.0
-
 class MLD_OT_assign_from_disp(Operator):
     """Assign materials by *actual displacement* (ALPHA_i winner per polygon)."""
     bl_idname = "mld.assign_materials_from_disp"
     bl_label = "Assign (by displacement)"
     bl_options = {'REGISTER', 'UNDO'}
 
+    source: bpy.props.EnumProperty(
+        name="Source",
+        items=[
+            ('DISPLACEMENT', "Displacement", "Use the layer alphas written by the last Recalculate "
+                                             "(Geometry Nodes engine: falls back to Masks)"),
+            ('MASKS', "Masks (Alphas Only)", "Blend only the layer alphas from the current masks per face; "
+                                              "no displacement, carrier, GN or preview update"),
+        ],
+        default='DISPLACEMENT',
+    )
+
     def execute(self, context):
         obj = active_obj(context)
         if not obj or obj.type != 'MESH':
@@ -65,27 +64,27 @@ class MLD_OT_assign_from_disp(Operator):
             return {'CANCELLED'}
 
         thr = float(getattr(s, 'mat_assign_threshold', getattr(s, 'assign_threshold', getattr(s, 'mask_threshold', 0.05))))
-        changed = 0
-
-        for poly in me.polygons:
-            # choose layer with max avg alpha above threshold
-            best_i = None
-            best_a = 0.0
-            for i, L in enumerate(layers):
-                if i not in slot_by_layer:
-                    continue
-                a = _poly_alpha_for_layer(me, i, poly)
-                if a > best_a:
-                    best_a = a
-                    best_i = i
-            if best_i is not None and best_a >= thr:
-                si = slot_by_layer[best_i]
-                if poly.material_index != si:
-                    poly.material_index = si
-                    changed += 1
+        source = self.source
+        if source == 'DISPLACEMENT' and getattr(s, "heightfill_engine", 'NUMPY') == 'GEOMETRY_NODES':
+            # GN engine stores MLD_A_* on the evaluated geometry only; the ones on
+            # obj.data are from an older Recalculate (or missing) -> blend from masks
+            print("[MLD] Geometry Nodes engine: layer alphas are not on the mesh, assigning from masks")
+            self.report({'WARNING'}, "Geometry Nodes engine: assigning from masks instead of displacement alphas")
+            source = 'MASKS'
+        if source == 'MASKS':
+            # alpha-only fast path: no Recalculate needed
+            face_alphas = solve_face_alphas(obj, s)
+            if face_alphas is None:
+                self.report({'ERROR'}, "Could not blend layer alphas (see console).")
+                return {'CANCELLED'}
+            changed = assign_materials_by_face_alpha(me, face_alphas, slot_by_layer, thr)
+        else:
+            # choose layer with max avg alpha above threshold (sparse over painted vertices)
+            changed = assign_materials_by_alpha(me, slot_by_layer, thr)
 
         me.update()
-        self.report({'INFO'}, f"Assigned by displacement. Polygons changed: {changed}")
+        self.report({'INFO'}, f"Assigned by {'masks' if source == 'MASKS' else 'displacement'}. "
+                              f"Polygons changed: {changed}")
         return {'FINISHED'}
 
 def register():
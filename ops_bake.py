@@ -2,7 +2,7 @@
 import bpy
 from bpy.types import Operator
 from .utils import active_obj, polycount, safe_mode
-from .attrs import ensure_color_attr, color_attr_exists, loop_red
+from .attrs import packed_loop_colors
 from .constants import PACK_ATTR, ALPHA_PREFIX, GN_MOD_NAME, DECIMATE_MOD_NAME
 
 def _any_channel_assigned(s):
@@ -66,39 +66,8 @@ def _pack_vc_now(obj, s):
     
     print(f"[MLD] Channel assignments: {chan_map}")
 
-    # Default fill value
-    default_fill = 1.0 if getattr(s, 'fill_empty_vc_white', False) else 0.0
-    
-    # Build per-loop arrays
-    per_loop = {
-        'R': [default_fill] * nloops, 
-        'G': [default_fill] * nloops, 
-        'B': [default_fill] * nloops,
-        'A': [default_fill] * nloops
-    }
-
-    # Fill assigned channels from mask data
-    for ch, layer_idx in chan_map.items():
-        if layer_idx is None:
-            continue
-            
-        L = s.layers[layer_idx]
-        mask_name = getattr(L, 'mask_name', '')
-        
-        print(f"[MLD] Processing layer {layer_idx} channel {ch} with mask: {mask_name}")
-        
-        if not mask_name or not color_attr_exists(me, mask_name):
-            print(f"[MLD] Warning: Layer {layer_idx} channel {ch} has no mask: {mask_name}")
-            continue
-        
-        # Read mask data (red channel)
-        for li in range(nloops):
-            try:
-                mask_value = loop_red(me, mask_name, li)
-                if mask_value is not None:
-                    per_loop[ch][li] = float(mask_value)
-            except Exception:
-                pass
+    # Per-loop RGBA from sparse masks (shared with Pack VC)
+    packed = packed_loop_colors(me, s, chan_map, nloops)
 
     # Write packed data to vertex color layer
     try:
@@ -107,12 +76,7 @@ def _pack_vc_now(obj, s):
         # Определяем, какой API использовать для записи
         if hasattr(vc_layer, 'data'):
             # color_attributes или vertex_colors с .data
-            for li in range(nloops):
-                r = per_loop['R'][li]
-                g = per_loop['G'][li] 
-                b = per_loop['B'][li]
-                a = per_loop['A'][li]
-                vc_layer.data[li].color = (r, g, b, a)
+            vc_layer.data.foreach_set("color", packed.ravel())
         else:
             # Fallback если нет .data
             print(f"[MLD] Warning: vc_layer has no .data attribute")
@@ -185,6 +149,10 @@ def _pack_texture_mask_now(obj, s):
     # Create a coverage map to track which pixels have real UV data
     coverage_map = [[False for _ in range(width)] for _ in range(height)]
     
+    # Per-loop mask values, same packing as Pack VC (POINT masks per vertex)
+    packed = packed_loop_colors(me, s, chan_map, len(me.loops))
+    assigned = [(ch, "RGBA".index(ch)) for ch, layer_idx in chan_map.items() if layer_idx is not None]
+    
     # First pass: collect all UV coordinates and their mask values
     uv_data = {}  # (px, py) -> {channel: value}
     
@@ -208,24 +176,10 @@ def _pack_texture_mask_now(obj, s):
                 if (px, py) not in uv_data:
                     uv_data[(px, py)] = {}
                 
-                for ch, layer_idx in chan_map.items():
-                    if layer_idx is None:
-                        continue
-                        
-                    L = s.layers[layer_idx]
-                    mask_name = getattr(L, 'mask_name', '')
-                    
-                    if not mask_name or not color_attr_exists(me, mask_name):
-                        continue
-                    
-                    try:
-                        mask_value = loop_red(me, mask_name, loop_idx)
-                        if mask_value is not None:
-                            # Take maximum value if multiple loops map to same pixel
-                            current_val = uv_data[(px, py)].get(ch, 0.0)
-                            uv_data[(px, py)][ch] = max(current_val, float(mask_value))
-                    except Exception:
-                        pass
+                for ch, col in assigned:
+                    # Take maximum value if multiple loops map to same pixel
+                    current_val = uv_data[(px, py)].get(ch, 0.0)
+                    uv_data[(px, py)][ch] = max(current_val, float(packed[loop_idx, col]))
     
     # Second pass: write real UV data to pixels
     for (px, py), channel_data in uv_data.items():
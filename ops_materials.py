@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 import bpy
+import numpy as np
 from bpy.types import Operator
 from .utils import active_obj
 from .constants import ALPHA_PREFIX
+from .attrs import read_attr_array
+from .kernels import SparseMask, vertex_loops_csr, gather_ranges
 
 # ---------------- helpers ----------------
 
@@ -28,21 +31,78 @@ def _ensure_mat_slot(obj: bpy.types.Object, mat: bpy.types.Material) -> int:
     slots.append(mat)
     return len(slots) - 1
 
-def _poly_alpha(me: bpy.types.Mesh, layer_index: int, poly: bpy.types.MeshPolygon) -> float:
-    """Get average point-domain ALPHA_i over polygon vertices."""
-    attr = me.attributes.get(f"{ALPHA_PREFIX}{layer_index}")
-    if not attr:
-        return 0.0
-    
-    try:
-        acc = 0.0
-        cnt = len(poly.vertices)
-        for vi in poly.vertices:
-            if vi < len(attr.data):
-                acc += float(attr.data[vi].value)
-        return acc / max(1, cnt)
-    except Exception:
-        return 0.0
+def assign_materials_by_alpha(me: bpy.types.Mesh, slot_by_layer: dict, thr: float) -> int:
+    """
+    Per polygon pick the layer with the highest average point ALPHA_i (first
+    layer wins ties, must be > 0 and >= thr) and set its material slot.
+    ALPHA_i is read as a sparse mask: only polygons touching painted
+    vertices are evaluated. Returns the number of polygons changed.
+    """
+    npoly = len(me.polygons)
+    nloops = len(me.loops)
+    vcount = len(me.vertices)
+    if npoly == 0 or not slot_by_layer:
+        return 0
+    loop_start = np.empty(npoly, dtype=np.int64); me.polygons.foreach_get("loop_start", loop_start)
+    loop_total = np.empty(npoly, dtype=np.int64); me.polygons.foreach_get("loop_total", loop_total)
+    loop_vi = np.empty(nloops, dtype=np.int64); me.loops.foreach_get("vertex_index", loop_vi)
+    face_of_loop = np.repeat(np.arange(npoly), loop_total)
+    order, offsets = vertex_loops_csr(loop_vi, vcount)
+
+    def _face_averages():
+        for layer_idx in sorted(slot_by_layer):
+            alpha = read_attr_array(me, f"{ALPHA_PREFIX}{layer_idx}")
+            if alpha is None:
+                continue
+            sm = SparseMask.from_dense(alpha[:vcount])
+            if sm.nnz == 0:
+                continue
+            # polygons touching a painted vertex
+            touched = order[gather_ranges(offsets[sm.indices], offsets[sm.indices + 1] - offsets[sm.indices])]
+            cand = np.unique(face_of_loop[touched])
+            cand_loops = gather_ranges(loop_start[cand], loop_total[cand])
+            vals = alpha.astype(np.float64)[loop_vi[cand_loops]]
+            sums = np.add.reduceat(vals, np.concatenate(([0], np.cumsum(loop_total[cand])[:-1])))
+            yield layer_idx, cand, sums / np.maximum(1, loop_total[cand])
+
+    return _assign_winners(me, _face_averages(), slot_by_layer, thr)
+
+def assign_materials_by_face_alpha(me: bpy.types.Mesh, face_alphas, slot_by_layer: dict, thr: float) -> int:
+    """
+    assign_materials_by_alpha for per-face alphas already aggregated on the face
+    domain (heightfill.solve_face_alphas: one (npoly,) array per layer).
+    """
+    if len(me.polygons) == 0 or not slot_by_layer:
+        return 0
+
+    def _face_averages():
+        for layer_idx in sorted(slot_by_layer):
+            fa = face_alphas[layer_idx] if layer_idx < len(face_alphas) else None
+            if fa is None:
+                continue
+            cand = np.flatnonzero(fa > 0.0)
+            if len(cand):
+                yield layer_idx, cand, fa[cand].astype(np.float64)
+
+    return _assign_winners(me, _face_averages(), slot_by_layer, thr)
+
+def _assign_winners(me: bpy.types.Mesh, face_averages, slot_by_layer: dict, thr: float) -> int:
+    """face_averages: (layer, polygons, average alpha) in layer order; first layer wins ties."""
+    npoly = len(me.polygons)
+    best = np.zeros(npoly, dtype=np.float64)
+    best_slot = np.full(npoly, -1, dtype=np.int64)
+    for layer_idx, cand, avg in face_averages:
+        better = avg > best[cand]
+        best[cand[better]] = avg[better]
+        best_slot[cand[better]] = slot_by_layer[layer_idx]
+
+    mat = np.empty(npoly, dtype=np.int64)
+    me.polygons.foreach_get("material_index", mat)
+    change = (best_slot >= 0) & (best >= thr) & (mat != best_slot)
+    if change.any():
+        mat[change] = best_slot[change]
+        me.polygons.foreach_set("material_index", mat.astype(np.int32))
+    return int(np.count_nonzero(change))
 
 # ---------------- operator ----------------
 
@@ -89,27 +149,10 @@ class MLD_OT_assign_materials(Operator):
                            getattr(s, 'assign_threshold', 
                                   getattr(s, 'mask_threshold', 0.05))))
 
-        changed = 0
         total_polys = len(me.polygons)
 
         # Assign materials based on strongest displacement per polygon
-        for poly in me.polygons:
-            best_layer = None
-            best_alpha = 0.0
-            
-            # Find layer with highest alpha for this polygon
-            for layer_idx, slot_idx in slot_by_layer.items():
-                alpha = _poly_alpha(me, layer_idx, poly)
-                if alpha > best_alpha:
-                    best_alpha = alpha
-                    best_layer = layer_idx
-            
-            # Assign material if alpha is above threshold
-            if best_layer is not None and best_alpha >= thr:
-                target_slot = slot_by_layer[best_layer]
-                if poly.material_index != target_slot:
-                    poly.material_index = target_slot
-                    changed += 1
+        changed = assign_materials_by_alpha(me, slot_by_layer, thr)
 
         me.update()
         
@@ -3,7 +3,7 @@
 import bpy
 from bpy.types import Operator
 from .utils import active_obj
-from .attrs import ensure_color_attr, color_attr_exists, loop_red
+from .attrs import ensure_color_attr, packed_loop_colors
 from .constants import PACK_ATTR
 
 def _any_channel_assigned(s):
@@ -54,50 +54,13 @@ def _pack_vc_now(obj, s):
     
     print(f"[MLD] Channel assignments: {chan_map}")
 
-    # Default fill value
-    default_fill = 1.0 if getattr(s, 'fill_empty_vc_white', False) else 0.0
-    
-    # Build per-loop arrays
-    per_loop = {
-        'R': [default_fill] * nloops, 
-        'G': [default_fill] * nloops, 
-        'B': [default_fill] * nloops,
-        'A': [default_fill] * nloops
-    }
-
-    # Fill assigned channels from mask data
-    for ch, layer_idx in chan_map.items():
-        if layer_idx is None:
-            continue  # Use default fill
-            
-        L = s.layers[layer_idx]
-        mask_name = getattr(L, 'mask_name', '')
-        
-        print(f"[MLD] Processing layer {layer_idx} channel {ch} with mask: {mask_name}")
-        
-        if not mask_name or not color_attr_exists(me, mask_name):
-            print(f"[MLD] Warning: Layer {layer_idx} channel {ch} has no mask: {mask_name}")
-            continue
-        
-        # Read mask data (red channel)
-        for li in range(nloops):
-            try:
-                mask_value = loop_red(me, mask_name, li)
-                if mask_value is not None:
-                    per_loop[ch][li] = float(mask_value)
-            except Exception:
-                pass
+    # Per-loop RGBA (unassigned channels keep the default fill)
+    packed = packed_loop_colors(me, s, chan_map, nloops)
 
     # Write packed data to vertex color layer
     try:
         print(f"[MLD] Writing {nloops} loops to vertex color layer: {vc_layer.name}")
-        for li in range(nloops):
-            r = per_loop['R'][li]
-            g = per_loop['G'][li] 
-            b = per_loop['B'][li]
-            a = per_loop['A'][li]
-            vc_layer.data[li].color = (r, g, b, a)
-        
+        vc_layer.data.foreach_set("color", packed.ravel())
         me.update()
         print(f"[MLD] Successfully packed to vertex color layer: {vc_layer.name}")
         return True, vc_layer.name
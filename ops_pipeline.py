@@ -3,10 +3,19 @@
 from __future__ import annotations
 import bpy
 
-from .heightfill import solve_heightfill  # ИСПОЛЬЗУЕМ НОВУЮ ФУНКЦИЮ
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .heightfill import (  # ИСПОЛЬЗУЕМ НОВУЮ ФУНКЦИЮ
+    solve_heightfill, begin_heightfill, run_heightfill_job, end_heightfill, stale_heightfill_target,
+    last_solve_stats, clear_solve_stats, _gather_layer_images, recalc_scope_vertices,
+)
 from .materials import build_heightlerp_preview_shader_new  # НОВЫЙ PREVIEW
 from .constants import GN_MOD_NAME, DECIMATE_MOD_NAME, OFFS_ATTR
-from .carrier import ensure_carrier, sync_carrier_mesh
+from .carrier import ensure_carrier, sync_carrier_mesh, carrier_name
+from .attrs import ensure_float_attr, copy_attr_array, write_offs_z, read_attr_array
+from .sampling import active_uv_layer_name
+from . import cache
 
 
 
@@ -25,15 +34,11 @@ def _write_displacement_to_carrier(obj: bpy.types.Object, carrier, mesh, per_ver
         if not offs_attr:
             offs_attr = carrier_mesh.attributes.new(name=OFFS_ATTR, type='FLOAT_VECTOR', domain='POINT')
         
-        # БЕЗОПАСНАЯ запись displacement в carrier
+        # Bulk write displacement into carrier (Z = scalar displacement)
         max_writes = min(len(offs_attr.data), len(per_vert_displacement))
-        for vi in range(max_writes):
-            try:
-                displacement = float(per_vert_displacement[vi])
-                offs_attr.data[vi].vector = (0.0, 0.0, displacement)  # Z = scalar displacement
-            except Exception as e:
-                print(f"[MLD] Warning: failed to write displacement for vertex {vi}: {e}")
-                continue
+        if not write_offs_z(carrier_mesh, OFFS_ATTR, per_vert_displacement):
+            print(f"[MLD] Warning: failed to write displacement to carrier")
+            max_writes = 0
         
         carrier_mesh.update()
         print(f"[MLD] Wrote displacement to carrier: {max_writes} values")
@@ -45,16 +50,22 @@ def _write_displacement_to_carrier(obj: bpy.types.Object, carrier, mesh, per_ver
         traceback.print_exc()
         return False
 
-def _ensure_gn_modifier(obj: bpy.types.Object):
-    """Ensure GN modifier exists and reads from carrier."""
+def _ensure_gn_modifier(obj: bpy.types.Object, s=None):
+    """Ensure GN modifier exists, reads from carrier and has current Strength/Midlevel."""
     try:
-        from .gn import ensure_gn
+        from .gn import ensure_gn, set_gn_inputs
         md = ensure_gn(obj)
+        if md is not None and s is not None:
+            set_gn_inputs(obj, getattr(s, "strength", 1.0), getattr(s, "midlevel", 0.5))
         return md is not None
     except Exception as e:
         print(f"[MLD] Failed to create GN modifier: {e}")
         return False
 
+def _native_gn(s) -> bool:
+    """Geometry Nodes engine: the blend runs in the modifier, no carrier/heightfill stages."""
+    return getattr(s, "heightfill_engine", 'NUMPY') == 'GEOMETRY_NODES'
+
 def _ensure_decimate(obj: bpy.types.Object, s):
     """Create decimate modifier after GN."""
     md = obj.modifiers.get(DECIMATE_MOD_NAME)
@@ -97,127 +108,225 @@ def _ensure_decimate(obj: bpy.types.Object, s):
                 pass
         return None
 
+# ------------------------------------------------------------------------------
+# Stages and invalidation map
+# Recalculate runs STAGES in order; a stage re-runs when its key changed or any
+# upstream stage ran. Keys are built from the properties mapped to the stage
+# below plus cheap external inputs (mask content, images, presence of outputs).
+# ------------------------------------------------------------------------------
+
+STAGES = ("carrier", "heightfill", "transfer", "gn", "decimate", "preview")
+
+# MLD_Settings property -> first stage it invalidates (None = no effect on the result).
+# Properties missing from the table invalidate the first stage.
+SETTINGS_STAGE = {
+    "active_index": None, "painting": None, "is_painting": None, "active_layer_index": None,
+    "strength": "gn", "midlevel": "gn", "fill_power": None,  # applied as GN modifier inputs
+    "heightfill_engine": "heightfill", "sampler_precision": "heightfill", "sampling_filter": "heightfill",
+    "sampler_cache_mb": None, "disk_cache_enable": None, "disk_cache_dir": None,
+    "heightfill_threads": None, "heightfill_chunk_size": None, "heightfill_memory_mb": None,
+    "incremental_recalc": None, "heightfill_worker": None,
+    "recalc_scope": "heightfill", "recalc_vertex_group": "heightfill",
+    "layers": "heightfill",  # per-layer entries use LAYER_STAGE
+    "auto_assign_materials": None, "auto_assign_on_recalc": None,
+    "mask_threshold": None, "assign_threshold": None, "mat_assign_threshold": None,
+    "preview_enable": "preview", "preview_blend": "preview",
+    "preview_mask_influence": "preview", "preview_contrast": "preview",
+    "decimate_enable": "decimate", "decimate_ratio": "decimate",
+    "fill_empty_vc_white": None, "fill_empty_vc_channels_with_white": None, "vc_attribute_name": None,
+    "bake_pack_vc": None, "bake_vc_attribute_name": None, "pack_to_texture_mask": None,
+    "texture_mask_name": None, "texture_mask_uv": None, "texture_mask_resolution": None,
+    "vc_packed": None, "texture_mask_packed": None,
+    "last_poly_v": None, "last_poly_f": None, "last_poly_t": None,
+}
+
+# MLD_Layer property -> first stage it invalidates
+LAYER_STAGE = {
+    "enabled": "heightfill", "name": None, "material": "heightfill",
+    "strength": "heightfill", "bias": "heightfill", "blend_mode": "heightfill",
+    "height_offset": "heightfill", "switch_opacity": "heightfill", "tiling": "heightfill",
+    "mask_name": "heightfill", "vc_channel": None, "multiplier": None,
+}
+
+def _prop_names(group, table) -> List[str]:
+    try:
+        return [p.identifier for p in group.bl_rna.properties if p.identifier != "rna_type"]
+    except Exception:
+        return list(table)
+
+def _prop_value(v):
+    if isinstance(v, bpy.types.ID):
+        return (v.as_pointer(), v.name_full)
+    if isinstance(v, (bool, int, float, str)) or v is None:
+        return v
+    try:
+        return tuple(v)
+    except Exception:
+        return repr(v)
+
+def _attr_digest(me, name: str):
+    arr = read_attr_array(me, name) if name else None
+    return None if arr is None else cache.array_digest(arr)
+
+def _read_scope(obj, s):
+    """Recalc scope vertices, read once per Recalculate (a vertex group is walked vertex by vertex)."""
+    return recalc_scope_vertices(obj, s, obj.data) if getattr(s, "recalc_scope", 'ALL') != 'ALL' else None
+
+def _stage_inputs(obj, s, scope=None) -> Dict[str, Tuple]:
+    """
+    External inputs per stage (everything not covered by properties); outputs are
+    checked separately by _stage_outputs.
+    scope: _read_scope() result; the selection / vertex group decides which vertices are rewritten.
+    """
+    me = obj.data
+    topo = (me.as_pointer(), len(me.vertices), len(me.loops), len(me.polygons))
+    images = []
+    for img in _gather_layer_images(s):
+        images.append(cache.image_fingerprint(img) if img is not None else None)
+    uv_name = active_uv_layer_name(me)
+    return {
+        "carrier": (topo,),
+        "heightfill": (
+            tuple(_attr_digest(me, getattr(L, "mask_name", "")) if L.enabled else None for L in s.layers),
+            tuple(images), uv_name, _attr_digest(me, uv_name) if uv_name else None,
+            None if scope is None else cache.array_digest(scope),
+        ),
+        "transfer": (), "gn": (), "decimate": (), "preview": (),
+    }
+
+def _stage_outputs(obj) -> Dict[str, Tuple]:
+    """Presence of every stage's outputs (no attribute data is read)."""
+    me = obj.data
+    carr = bpy.data.objects.get(carrier_name(obj))
+    carr_ok = carr is not None and carr.type == 'MESH'
+    offs = carr.data.attributes.get(OFFS_ATTR) if carr_ok else None
+    md_gn = obj.modifiers.get(GN_MOD_NAME)
+    return {
+        "carrier": (carr_ok,),
+        "heightfill": (me.attributes.get(OFFS_ATTR) is not None,),
+        "transfer": (offs is not None and len(offs.data) == len(me.vertices),),
+        "gn": (md_gn is not None and md_gn.type == 'NODES' and md_gn.node_group is not None,),
+        "decimate": (obj.modifiers.get(DECIMATE_MOD_NAME) is not None,),
+        "preview": (any(m and m.name.startswith("MLD_Preview::") for m in me.materials),),
+    }
+
+def stage_keys(obj, s, scope=None) -> Dict[str, Tuple]:
+    """Memo key of every stage for the current settings, inputs and outputs (scope: see _stage_inputs)."""
+    params = {st: [] for st in STAGES}
+    for name in _prop_names(s, SETTINGS_STAGE):
+        if name == "layers":
+            continue
+        st = SETTINGS_STAGE.get(name, STAGES[0])
+        if st:
+            params[st].append((name, _prop_value(getattr(s, name, None))))
+    params["heightfill"].append(("layers", len(s.layers)))
+    for i, L in enumerate(s.layers):
+        for name in _prop_names(L, LAYER_STAGE):
+            st = LAYER_STAGE.get(name, STAGES[0])
+            if st:
+                params[st].append((i, name, _prop_value(getattr(L, name, None))))
+    inputs, outputs = _stage_inputs(obj, s, scope), _stage_outputs(obj)
+    return {st: (tuple(params[st]), inputs[st], outputs[st]) for st in STAGES}
+
+def with_stage_outputs(obj, keys: Dict[str, Tuple]) -> Dict[str, Tuple]:
+    """keys with only the output presence re-checked (after the stages ran)."""
+    outputs = _stage_outputs(obj)
+    return {st: keys[st][:2] + (outputs[st],) for st in STAGES}
+
+def dirty_stages(old: Dict[str, Tuple], new: Dict[str, Tuple]) -> List[str]:
+    """Stages to run: the first one whose key changed and everything downstream."""
+    for i, st in enumerate(STAGES):
+        if old.get(st) != new[st]:
+            return list(STAGES[i:])
+    return []
+
 class MLD_OT_recalculate(bpy.types.Operator):
     bl_idname = "mld.recalculate"
     bl_label = "Recalculate"
     bl_options = {'REGISTER', 'UNDO'}
 
-    def execute(self, context):
-        obj = context.object
-        if not obj or obj.type != 'MESH':
-            self.report({'ERROR'}, "Select a mesh object.")
-            return {'CANCELLED'}
+    force: bpy.props.BoolProperty(
+        name="Force Full Recalc", default=False,
+        description="Run every stage even if its inputs did not change",
+    )
 
-        s = getattr(obj, "mld_settings", None)
-        if s is None:
-            self.report({'ERROR'}, "No MLD settings found.")
-            return {'CANCELLED'}
-
-        # ДИАГНОСТИКА настроек
-        print(f"[MLD] === SETTINGS DEBUG ===")
-        print(f"[MLD] Settings object: {s}")
-        print(f"[MLD] Settings type: {type(s)}")
-        print(f"[MLD] ======================")
+    # --- stages (each returns True on success; failure of carrier/heightfill/gn cancels) ---
 
-        if len(s.layers) == 0:
-            self.report({'WARNING'}, "No layers to process.")
-            return {'CANCELLED'}
-
-        # БЕЗОПАСНАЯ проверка сложности меша
-        vert_count = len(obj.data.vertices)
-        poly_count = len(obj.data.polygons)
-        
-        print(f"[MLD] Mesh complexity check: {vert_count} verts, {poly_count} polys")
-        
-        # ПРЕДУПРЕЖДЕНИЕ о сложности
-        if vert_count > 100000:
-            self.report({'WARNING'}, f"High poly mesh ({vert_count:,} vertices). Consider simplifying the mesh.")
-        
-        # Ensure Object mode
-        try:
-            if obj.mode != 'OBJECT':
-                bpy.ops.object.mode_set(mode='OBJECT')
-        except Exception:
-            pass
-
-        print("[MLD] === NEW BLENDING SYSTEM RECALCULATE START ===")
-        
-        # STEP 1: Create carrier for topology
+    def _stage_carrier(self, context, obj, s):
+        if _native_gn(s):
+            print("[MLD] ○ Carrier: not used by the Geometry Nodes engine")
+            return True
         try:
             carrier = ensure_carrier(obj)
             print(f"[MLD] ✓ Carrier created: {carrier.name}")
+            return True
         except Exception as e:
             print(f"[MLD] ✗ Carrier creation failed: {e}")
-            return {'CANCELLED'}
+            return False
 
-        # STEP 5: НОВАЯ система heightfill + Carrier integration
+    def _stage_heightfill(self, context, obj, s):
+        if _native_gn(s):
+            print("[MLD] ○ Heightfill: blended live by the Geometry Nodes engine")
+            return True
         print("[MLD] Computing heightfill with NEW blending system...")
         try:
-            # ИСПОЛЬЗУЕМ НОВУЮ ФУНКЦИЮ из heightfill.py
-            success = solve_heightfill(obj, s, context, obj.data)
+            success = solve_heightfill(obj, s, context, obj.data, scope_verts=self._scope)
             if not success:
                 raise Exception("New heightfill returned False")
-            
             print(f"[MLD] ✓ NEW Heightfill computed successfully")
-            
-            # STEP 5.5: Transfer results to carrier for GN
-            print("[MLD] Transferring heightfill results to carrier...")
-            try:
-                from .attrs import ensure_float_attr
-                from .constants import OFFS_ATTR
-                
-                # Ensure carrier has proper attributes
-                carrier_mesh = carrier.data
-                offs_attr = ensure_float_attr(carrier_mesh, OFFS_ATTR, domain='POINT', data_type='FLOAT_VECTOR')
-                
-                # Copy displacement data from original mesh to carrier
-                orig_offs_attr = obj.data.attributes.get(OFFS_ATTR)
-                if orig_offs_attr and offs_attr:
-                    # Direct copy for same topology
-                    max_copy = min(len(orig_offs_attr.data), len(offs_attr.data))
-                    for vi in range(max_copy):
-                        try:
-                            offs_attr.data[vi].vector = orig_offs_attr.data[vi].vector
-                        except Exception:
-                            offs_attr.data[vi].vector = (0.0, 0.0, 0.0)
-                    
-                    carrier_mesh.update()
-                    print(f"[MLD] ✓ Transferred {max_copy} displacement values to carrier")
-                else:
-                    print(f"[MLD] ⚠ Could not find displacement attributes for carrier transfer")
-                    
-            except Exception as e:
-                print(f"[MLD] ⚠ Carrier transfer failed: {e}")
-                # Continue anyway - displacement might still work
-            
+            return True
         except Exception as e:
             print(f"[MLD] ✗ NEW heightfill failed: {e}")
             import traceback
             traceback.print_exc()
             self.report({'ERROR'}, "Height solve failed (check UV and height maps).")
-            return {'CANCELLED'}
+            return False
+
+    def _stage_transfer(self, context, obj, s):
+        # Transfer results to carrier for GN
+        if _native_gn(s):
+            return True
+        print("[MLD] Transferring heightfill results to carrier...")
+        try:
+            carrier = ensure_carrier(obj)
+            carrier_mesh = carrier.data
+            offs_attr = ensure_float_attr(carrier_mesh, OFFS_ATTR, domain='POINT', data_type='FLOAT_VECTOR')
 
-        # STEP 2: Setup GN modifier to read from carrier
+            # Copy displacement data from original mesh to carrier (one bulk read + write)
+            if obj.data.attributes.get(OFFS_ATTR) and offs_attr:
+                max_copy = copy_attr_array(obj.data, carrier_mesh, OFFS_ATTR)
+                carrier_mesh.update()
+                print(f"[MLD] ✓ Transferred {max_copy} displacement values to carrier")
+            else:
+                print(f"[MLD] ⚠ Could not find displacement attributes for carrier transfer")
+        except Exception as e:
+            print(f"[MLD] ⚠ Carrier transfer failed: {e}")
+            # Continue anyway - displacement might still work
+        return True
+
+    def _stage_gn(self, context, obj, s):
         print("[MLD] Setting up Geometry Nodes...")
         try:
-            gn_ok = _ensure_gn_modifier(obj)
+            if _native_gn(s):
+                from .gn_blend import ensure_blend_gn
+                gn_ok = ensure_blend_gn(obj, s) is not None
+            else:
+                gn_ok = _ensure_gn_modifier(obj, s)
             if not gn_ok:
                 raise Exception("Failed to create GN modifier")
-            
-
             print("[MLD] ✓ Geometry Nodes displacement ready")
-            
+            return True
         except Exception as e:
             print(f"[MLD] ✗ GN setup failed: {e}")
             self.report({'ERROR'}, f"GN setup failed: {e}")
-            return {'CANCELLED'}
+            return False
 
-        # STEP 3: Setup decimate
+    def _stage_decimate(self, context, obj, s):
         try:
             decimate_md = _ensure_decimate(obj, s)
             if decimate_md:
                 print(f"[MLD] ✓ Decimate: {decimate_md.ratio} ratio")
-                
+
                 # Принудительное обновление после decimate
                 try:
                     context.view_layer.update()
@@ -228,27 +337,20 @@ class MLD_OT_recalculate(bpy.types.Operator):
                 print("[MLD] ○ Decimate: disabled")
         except Exception as e:
             print(f"[MLD] ✗ Decimate setup failed: {e}")
+        return True
 
-        # STEP 4: Auto-assign materials
-        try:
-            if getattr(s, "auto_assign_materials", False):
-                print("[MLD] Auto-assigning materials...")
-                print("[MLD] ○ Material assignment skipped (needs carrier support)")
-        except Exception as e:
-            print(f"[MLD] ✗ Auto assign failed: {e}")
-
-        # STEP 5: НОВАЯ система preview материала
+    def _stage_preview(self, context, obj, s):
         try:
             if getattr(s, "preview_enable", False):
                 print("[MLD] Building preview material with NEW blending...")
-                
+
                 # Используем новую функцию preview
                 mat = build_heightlerp_preview_shader_new(
                     obj, s,
                     preview_influence=getattr(s, "preview_mask_influence", 1.0),
                     preview_contrast=getattr(s, "preview_contrast", 1.0),
                 )
-                
+
                 if mat:
                     print("[MLD] ✓ NEW Preview material built")
                 else:
@@ -257,6 +359,84 @@ class MLD_OT_recalculate(bpy.types.Operator):
             print(f"[MLD] ✗ NEW Preview build failed: {e}")
             import traceback
             traceback.print_exc()
+        return True
+
+    # --- shared driver ---
+
+    def _check(self, context):
+        """Validate the active object and enter Object mode. Returns (obj, s) or None."""
+        obj = context.object
+        if not obj or obj.type != 'MESH':
+            self.report({'ERROR'}, "Select a mesh object.")
+            return None
+
+        s = getattr(obj, "mld_settings", None)
+        if s is None:
+            self.report({'ERROR'}, "No MLD settings found.")
+            return None
+
+        # ДИАГНОСТИКА настроек
+        print(f"[MLD] === SETTINGS DEBUG ===")
+        print(f"[MLD] Settings object: {s}")
+        print(f"[MLD] Settings type: {type(s)}")
+        print(f"[MLD] ======================")
+
+        if len(s.layers) == 0:
+            self.report({'WARNING'}, "No layers to process.")
+            return None
+
+        # БЕЗОПАСНАЯ проверка сложности меша
+        vert_count = len(obj.data.vertices)
+        poly_count = len(obj.data.polygons)
+        
+        print(f"[MLD] Mesh complexity check: {vert_count} verts, {poly_count} polys")
+        
+        # ПРЕДУПРЕЖДЕНИЕ о сложности
+        if vert_count > 100000:
+            self.report({'WARNING'}, f"High poly mesh ({vert_count:,} vertices). Consider simplifying the mesh.")
+        
+        # Ensure Object mode
+        try:
+            if obj.mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode='OBJECT')
+        except Exception:
+            pass
+
+        print("[MLD] === NEW BLENDING SYSTEM RECALCULATE START ===")
+        return obj, s
+
+    def _plan(self, obj, s):
+        """Only stages downstream of the first changed input run. Returns (keys, todo)."""
+        self._scope = _read_scope(obj, s)
+        keys = stage_keys(obj, s, self._scope)
+        memo = {} if self.force else cache.get_stage_keys(obj)
+        todo = dirty_stages(memo, keys)
+        print(f"[MLD] Stages to run: {', '.join(todo) if todo else 'none (all up to date)'}")
+        if "heightfill" not in todo:
+            clear_solve_stats()
+        return keys, todo
+
+    def _run_stages(self, context, obj, s, stages, keys) -> bool:
+        for st in stages:
+            if not getattr(self, f"_stage_{st}")(context, obj, s):
+                cache.store_stage_keys(obj, {k: keys[k] for k in STAGES[:STAGES.index(st)]})
+                return False
+        return True
+
+    def _finish(self, context, obj, s, keys, todo):
+        # outputs of the stages are part of the keys: re-check their presence after running.
+        # Inputs keep the digests of `keys`, which the stages ran with (edits made while a
+        # background solve ran are picked up by the next Recalculate).
+        done = with_stage_outputs(obj, keys) if todo else keys
+        cache.store_stage_keys(obj, done)
+
+        # Auto-assign materials
+        try:
+            if getattr(s, "auto_assign_materials", False):
+                print("[MLD] Auto-assigning materials...")
+                print("[MLD] ○ Material assignment skipped (needs carrier support)")
+        except Exception as e:
+            print(f"[MLD] ✗ Auto assign failed: {e}")
 
         # STEP 6: Cleanup
 
@@ -304,11 +484,183 @@ class MLD_OT_recalculate(bpy.types.Operator):
             print(f"[MLD] Warning: viewport update failed: {e}")
 
         print("[MLD] === NEW BLENDING SYSTEM RECALCULATE COMPLETE ===")
-        self.report({'INFO'}, "Displacement calculated using NEW blending system.")
+        self.report({'INFO'}, "Displacement calculated using NEW blending system." + _stage_summary(todo) + _cull_summary())
         return {'FINISHED'}
 
+    def execute(self, context):
+        chk = self._check(context)
+        if chk is None:
+            return {'CANCELLED'}
+        obj, s = chk
+        keys, todo = self._plan(obj, s)
+        if not self._run_stages(context, obj, s, todo, keys):
+            return {'CANCELLED'}
+        return self._finish(context, obj, s, keys, todo)
+
+# ------------------------------------------------------------------------------
+# Background variant: the NumPy heightfill runs on a worker thread while a modal
+# timer reports progress; Esc cancels. Inputs are snapshotted and results applied
+# on the main thread, the other stages run there as usual.
+# ------------------------------------------------------------------------------
+
+_BACKGROUND_PROGRESS: Dict[str, float] = {}
+
+def background_progress(obj) -> Optional[float]:
+    """Progress (0..1) of a running background recalc of obj, else None."""
+    return _BACKGROUND_PROGRESS.get(obj.name) if obj else None
+
+def _redraw_ui(context):
+    try:
+        for area in context.screen.areas:
+            if area.type in {'VIEW_3D', 'PROPERTIES'}:
+                area.tag_redraw()
+    except Exception:
+        pass
+
+class MLD_OT_recalculate_background(MLD_OT_recalculate):
+    bl_idname = "mld.recalculate_background"
+    bl_label = "Recalculate (Background)"
+    bl_description = "Recalculate without blocking the UI: the height solve runs on a worker thread (Esc to cancel)"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    force: bpy.props.BoolProperty(
+        name="Force Full Recalc", default=False,
+        description="Run every stage even if its inputs did not change",
+    )
+
+    def invoke(self, context, event):
+        chk = self._check(context)
+        if chk is None:
+            return {'CANCELLED'}
+        obj, s = chk
+        if obj.name in _BACKGROUND_PROGRESS:
+            self.report({'WARNING'}, "A background recalculation is already running for this object.")
+            return {'CANCELLED'}
+        keys, todo = self._plan(obj, s)
+        if "heightfill" not in todo or _native_gn(s):
+            if not self._run_stages(context, obj, s, todo, keys):
+                return {'CANCELLED'}
+            return self._finish(context, obj, s, keys, todo)
+
+        split = todo.index("heightfill")
+        if not self._run_stages(context, obj, s, todo[:split], keys):
+            return {'CANCELLED'}
+        job = None
+        try:
+            job = begin_heightfill(obj, s, context, obj.data, scope_verts=self._scope)
+        except Exception as e:
+            print(f"[MLD] Background solve setup failed, solving in the foreground: {e}")
+        if job is None:
+            # other engines (or setup failure) solve synchronously
+            if not self._run_stages(context, obj, s, todo[split:], keys):
+                return {'CANCELLED'}
+            return self._finish(context, obj, s, keys, todo)
+
+        self._obj_name, self._keys, self._todo, self._job = obj.name, keys, todo, job
+        self._cancel = threading.Event()
+        self._state = {"done": 0, "total": 1, "ok": None, "error": None}
+
+        def _work():
+            try:
+                self._state["ok"] = run_heightfill_job(
+                    job, lambda d, t: self._state.update(done=d, total=max(1, t)), self._cancel.is_set)
+            except Exception as e:
+                self._state["ok"], self._state["error"] = False, e
+
+        self._thread = threading.Thread(target=_work, name="MLD-heightfill", daemon=True)
+        self._thread.start()
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.progress_begin(0, 100)
+        _BACKGROUND_PROGRESS[obj.name] = 0.0
+        wm.modal_handler_add(self)
+        print("[MLD] Heightfill running in the background (Esc to cancel)")
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        # redo / scripted calls have no event loop to poll a worker: run in the foreground
+        return MLD_OT_recalculate.execute(self, context)
+
+    def _cleanup(self, context):
+        wm = context.window_manager
+        try:
+            wm.event_timer_remove(self._timer)
+        except Exception:
+            pass
+        wm.progress_end()
+        _BACKGROUND_PROGRESS.pop(self._obj_name, None)
+        _redraw_ui(context)
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self._cancel.set()
+            print("[MLD] Cancelling background heightfill...")
+            return {'RUNNING_MODAL'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        frac = self._state["done"] / self._state["total"]
+        _BACKGROUND_PROGRESS[self._obj_name] = frac
+        context.window_manager.progress_update(int(100 * frac))
+        _redraw_ui(context)
+        if self._thread.is_alive():
+            return {'RUNNING_MODAL'}
+
+        self._thread.join()
+        self._cleanup(context)
+        obj = bpy.data.objects.get(self._obj_name)
+        keys, todo = self._keys, self._todo
+        split = todo.index("heightfill")
+        if obj is None:
+            self.report({'WARNING'}, "Recalculate: object was removed.")
+            return {'CANCELLED'}
+        s = obj.mld_settings
+        if not self._state["ok"]:
+            # stages before the solve did run; the solve and its downstream stay dirty
+            cache.store_stage_keys(obj, {k: keys[k] for k in STAGES[:STAGES.index("heightfill")]})
+            if self._state["error"] is not None:
+                print(f"[MLD] ✗ Background heightfill failed: {self._state['error']}")
+                self.report({'ERROR'}, "Height solve failed (check UV and height maps).")
+            else:
+                self.report({'WARNING'}, "Recalculate cancelled.")
+            return {'CANCELLED'}
+
+        reason = stale_heightfill_target(obj, self._job)
+        if reason is not None:
+            # mesh changed under the solve: drop the result, heightfill and downstream stay dirty
+            self._job = None
+            done = cache.get_stage_keys(obj)
+            cache.store_stage_keys(obj, {k: v for k, v in done.items()
+                                         if k in STAGES[:STAGES.index("heightfill")]})
+            print(f"[MLD] ✗ Background heightfill discarded: {reason}")
+            self.report({'WARNING'}, f"Recalculate cancelled: {reason}.")
+            return {'CANCELLED'}
+        if not end_heightfill(obj, self._job):
+            self.report({'ERROR'}, "Height solve failed (check UV and height maps).")
+            return {'CANCELLED'}
+        print(f"[MLD] ✓ NEW Heightfill computed successfully (background)")
+        self._job = None
+        if not self._run_stages(context, obj, s, todo[split + 1:], keys):
+            return {'CANCELLED'}
+        return self._finish(context, obj, s, keys, todo)
+
+def _stage_summary(todo) -> str:
+    if len(todo) == len(STAGES):
+        return ""
+    return f" Re-ran {len(todo)}/{len(STAGES)} stage(s)" + (f" from '{todo[0]}'." if todo else ".")
+
+def _cull_summary() -> str:
+    """Skipped-work part of the Recalculate report (empty when the solver kept no stats)."""
+    st = last_solve_stats()
+    total = st.get("layer_loops", 0)
+    if not total:
+        return ""
+    skipped = total - st.get("sampled_loops", 0)
+    return (f" Skipped {100.0 * skipped / total:.0f}% of layer samples "
+            f"({st.get('culled_layers', 0)} empty layer(s), {st.get('occluded_loops', 0):,} occluded).")
+
 # Register
-classes = (MLD_OT_recalculate,)
+classes = (MLD_OT_recalculate, MLD_OT_recalculate_background)
 
 def register():
     for c in classes:
@@ -147,7 +147,22 @@ class MLD_OT_reset_layers(Operator):
         self.report({'INFO'}, f"Layers reset completed")
         return {'FINISHED'}
 
-_CLASSES = (MLD_OT_reset_displacement, MLD_OT_reset_layers)
+class MLD_OT_clear_height_cache(Operator):
+    bl_idname = "mld.clear_height_cache"
+    bl_label = "Clear Disk Height Cache"
+    bl_description = "Delete all decoded height planes (.npy sidecars) from the disk cache directory"
+
+    def execute(self, ctx):
+        from .sampling import set_disk_cache_dir, clear_disk_cache, disk_cache_dir
+        s = getattr(getattr(ctx, "object", None), "mld_settings", None)
+        if s is not None:
+            set_disk_cache_dir(getattr(s, "disk_cache_dir", ""))
+        removed = clear_disk_cache()
+        print(f"[MLD] Removed {removed} height cache file(s) from {disk_cache_dir()}")
+        self.report({'INFO'}, f"Removed {removed} height cache file(s)")
+        return {'FINISHED'}
+
+_CLASSES = (MLD_OT_reset_displacement, MLD_OT_reset_layers, MLD_OT_clear_height_cache)
 
 def register():
     for cls in _CLASSES:
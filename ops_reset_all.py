@@ -7,7 +7,10 @@ from .constants import (
     GN_MOD_NAME, DECIMATE_MOD_NAME,
     # Default values
     DEFAULT_ACTIVE_INDEX, DEFAULT_PAINTING, DEFAULT_VC_PACKED,
-    DEFAULT_STRENGTH, DEFAULT_MIDLEVEL, DEFAULT_FILL_POWER,
+    DEFAULT_STRENGTH, DEFAULT_MIDLEVEL, DEFAULT_FILL_POWER, DEFAULT_HEIGHTFILL_ENGINE, DEFAULT_SAMPLER_PRECISION,
+    DEFAULT_SAMPLER_CACHE_MB, DEFAULT_LAYER_SAMPLE_CACHE_MB, DEFAULT_DISK_CACHE_ENABLE, DEFAULT_SAMPLING_FILTER,
+    DEFAULT_HEIGHTFILL_THREADS, DEFAULT_HEIGHTFILL_CHUNK, DEFAULT_HEIGHTFILL_MEMORY_MB,
+    DEFAULT_INCREMENTAL_RECALC, DEFAULT_HEIGHTFILL_WORKER, DEFAULT_RECALC_SCOPE, DEFAULT_RECALC_VERTEX_GROUP,
     DEFAULT_AUTO_ASSIGN_MATERIALS, DEFAULT_MASK_THRESHOLD, DEFAULT_ASSIGN_THRESHOLD,
     DEFAULT_PREVIEW_ENABLE, DEFAULT_PREVIEW_BLEND, DEFAULT_PREVIEW_MASK_INFLUENCE, DEFAULT_PREVIEW_CONTRAST,
     DEFAULT_DECIMATE_ENABLE, DEFAULT_DECIMATE_RATIO,
@@ -119,6 +122,17 @@ class MLD_OT_reset_all(Operator):
         except Exception as e:
             print(f"[MLD] Failed to clean attributes: {e}")
 
+        # Drop cached height samples, incremental solve state and stage memo of this object
+        try:
+            from .cache import clear_layer_samples, clear_solve_state, clear_stage_keys
+            clear_layer_samples(obj)
+            clear_solve_state(obj)
+            clear_stage_keys(obj)
+            from .worker import forget_samples
+            forget_samples(obj.name)
+        except Exception:
+            pass
+
         # Remove ALL MLD-related materials
         try:
             removed_mats = self._remove_all_mld_materials(obj)
@@ -148,6 +162,19 @@ class MLD_OT_reset_all(Operator):
         s.strength = DEFAULT_STRENGTH
         s.midlevel = DEFAULT_MIDLEVEL
         s.fill_power = DEFAULT_FILL_POWER
+        s.heightfill_engine = DEFAULT_HEIGHTFILL_ENGINE
+        s.sampler_precision = DEFAULT_SAMPLER_PRECISION
+        s.sampling_filter = DEFAULT_SAMPLING_FILTER
+        s.sampler_cache_mb = DEFAULT_SAMPLER_CACHE_MB
+        s.layer_sample_cache_mb = DEFAULT_LAYER_SAMPLE_CACHE_MB
+        s.disk_cache_enable = DEFAULT_DISK_CACHE_ENABLE
+        s.heightfill_threads = DEFAULT_HEIGHTFILL_THREADS
+        s.heightfill_chunk_size = DEFAULT_HEIGHTFILL_CHUNK
+        s.heightfill_memory_mb = DEFAULT_HEIGHTFILL_MEMORY_MB
+        s.incremental_recalc = DEFAULT_INCREMENTAL_RECALC
+        s.heightfill_worker = DEFAULT_HEIGHTFILL_WORKER
+        s.recalc_scope = DEFAULT_RECALC_SCOPE
+        s.recalc_vertex_group = DEFAULT_RECALC_VERTEX_GROUP
         
         # Reset material assignment settings
         s.auto_assign_materials = DEFAULT_AUTO_ASSIGN_MATERIALS
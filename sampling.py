@@ -1,7 +1,16 @@
 # Self-contained UV/image helpers + bilinear CPU sampler
 from __future__ import annotations
 import bpy
+import os
+import hashlib
+import tempfile
+import numpy as np
+from collections import OrderedDict
 from typing import Optional, Tuple
+from . import kernels
+from .core import sample_bilinear_scalar
+from .cache import image_fingerprint, image_file_stat
+from .constants import DEFAULT_SAMPLER_CACHE_MB
 
 def active_uv_layer_name(me: bpy.types.Mesh) -> Optional[str]:
     uvs = getattr(me, "uv_layers", None)
@@ -68,9 +77,127 @@ def find_image_and_uv_from_displacement(mat: bpy.types.Material):
                                 return n2.image, None
     return find_basecolor_image_and_uv(mat)
 
-def make_sampler(img: Optional[bpy.types.Image]):
+def _read_pixels(img: bpy.types.Image, w: int, h: int, ch: int) -> np.ndarray:
+    """Copy image pixels once into a preallocated float32 buffer (no Python floats)."""
+    px = np.empty(w * h * ch, dtype=np.float32)
+    try:
+        img.pixels.foreach_get(px)
+    except Exception:
+        # very old builds / odd image types: slower but still a single copy
+        px[:] = np.asarray(img.pixels[:], dtype=np.float32)[:px.size]
+    return px
+
+# ------------------------------------------------------------------------------
+# Disk-backed plane cache (.npy sidecars, memory-mapped on load)
+# ------------------------------------------------------------------------------
+
+_DISK_CACHE_DIR = ""  # empty = default location (see disk_cache_dir)
+
+def set_disk_cache_dir(path: str):
+    global _DISK_CACHE_DIR
+    _DISK_CACHE_DIR = bpy.path.abspath(path) if path else ""
+
+def disk_cache_dir() -> str:
+    """Directory for decoded-plane sidecars (created on demand)."""
+    path = _DISK_CACHE_DIR
+    if not path:
+        try:
+            path = bpy.utils.user_resource('DATAFILES', path="mld_height_cache", create=True)
+        except Exception:
+            path = os.path.join(tempfile.gettempdir(), "mld_height_cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def _sidecar_path(img: bpy.types.Image, storage: str) -> Optional[str]:
+    """
+    Sidecar file for an unmodified file-backed image: "<source>_<version>.npy" where
+    source = filepath, colorspace, storage and version = mtime, size (os.stat only,
+    the image is not loaded).
+    """
+    stat = image_file_stat(img)
+    if stat is None:
+        return None
+    src, mtime, size = stat
+    colorspace = getattr(getattr(img, "colorspace_settings", None), "name", "")
+    name = f"{_digest(f'{src}|{colorspace}|{storage}')}_{_digest(f'{mtime}|{size}')}.npy"
+    return os.path.join(disk_cache_dir(), name)
+
+def _load_sidecar(path: str, storage: str):
+    try:
+        plane = np.load(path, mmap_mode='r')
+    except Exception:
+        return None
+    dtype = kernels.PLANE_STORAGE.get(storage, kernels.PLANE_STORAGE['FLOAT32'])[0]
+    return plane if plane.ndim == 2 and plane.dtype == dtype and plane.size else None
+
+def _remove_superseded(path: str):
+    """Drop sidecars of older versions of the same source file (re-saved images)."""
+    root, name = os.path.split(path)
+    prefix = name.split("_", 1)[0] + "_"
+    try:
+        for other in os.listdir(root):
+            if other.startswith(prefix) and other.endswith(".npy") and other != name:
+                try:
+                    os.remove(os.path.join(root, other))
+                except Exception:
+                    pass  # still mapped elsewhere (Windows): removed next time
+    except Exception:
+        pass
+
+def _save_sidecar(path: str, plane: np.ndarray):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, plane)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[MLD] Could not write height cache {path}: {e}")
+        try: os.remove(tmp)
+        except Exception: pass
+        return
+    _remove_superseded(path)
+
+def clear_disk_cache() -> int:
+    """Remove all sidecars from the cache directory; returns removed count."""
+    removed = 0
+    try:
+        root = disk_cache_dir()
+        for name in os.listdir(root):
+            if name.endswith(".npy"):
+                try:
+                    os.remove(os.path.join(root, name)); removed += 1
+                except Exception:
+                    pass
+    except Exception:
+        pass
+    return removed
+
+def make_sampler(img: Optional[bpy.types.Image], storage: str = 'FLOAT32', disk_cache: bool = False):
+    """
+    Build a sampler for image. The pixels are collapsed once into a single
+    Rec.709 luminance plane; the RGBA buffer is dropped right after. Keys:
+      w, h    : image size
+      plane   : (h, w) luminance plane stored as float32 / float16 / uint16
+      scale   : decode factor (plane value * scale = height)
+      storage : 'FLOAT32' | 'FLOAT16' | 'UINT16'
+    With disk_cache the plane of a file-backed image is persisted as an .npy
+    sidecar and later runs memory-map it (read-only, pages load lazily).
+    """
     if not img:
         return None
+    scale = kernels.PLANE_STORAGE.get(storage, kernels.PLANE_STORAGE['FLOAT32'])[1]
+
+    # sidecar hit: size comes from the .npy header, the image itself is never loaded
+    sidecar = _sidecar_path(img, storage) if disk_cache else None
+    if sidecar and os.path.exists(sidecar):
+        plane = _load_sidecar(sidecar, storage)
+        if plane is not None:
+            h, w = plane.shape
+            return {"w": w, "h": h, "plane": plane, "scale": scale, "storage": storage}
+
     try:
         w, h = int(img.size[0]), int(img.size[1])
     except Exception:
@@ -78,36 +205,79 @@ def make_sampler(img: Optional[bpy.types.Image]):
     if w <= 0 or h <= 0:
         return None
     ch = int(getattr(img, "channels", 4))
-    px = list(img.pixels[:])
-    return {"w": w, "h": h, "ch": ch, "px": px}
-
-def _pix(px, w, h, ch, x, y):
-    x %= w; y %= h
-    idx = (y * w + x) * ch
-    r = px[idx] if idx < len(px) else 0.0
-    if ch >= 3:
-        g = px[idx+1] if idx+1 < len(px) else r
-        b = px[idx+2] if idx+2 < len(px) else r
-        return 0.2126*r + 0.7152*g + 0.0722*b
-    return r
-
-def _sample_bilinear(sampler, u: float, v: float) -> float:
-    w = sampler["w"]; h = sampler["h"]; ch = sampler["ch"]; px = sampler["px"]
-    u = u - int(u); v = v - int(v)
-    if u < 0: u += 1.0
-    if v < 0: v += 1.0
-    x = u * (w - 1); y = v * (h - 1)
-    x0 = int(x); y0 = int(y)
-    x1 = (x0 + 1) % w; y1 = (y0 + 1) % h
-    tx = x - x0; ty = y - y0
-    c00 = _pix(px, w, h, ch, x0, y0)
-    c10 = _pix(px, w, h, ch, x1, y0)
-    c01 = _pix(px, w, h, ch, x0, y1)
-    c11 = _pix(px, w, h, ch, x1, y1)
-    c0 = c00*(1-tx) + c10*tx
-    c1 = c01*(1-tx) + c11*tx
-    val = c0*(1-ty) + c1*ty
-    return max(0.0, min(1.0, float(val)))
+    px = _read_pixels(img, w, h, ch)
+    lum = kernels.luminance_plane(px.reshape(h, w * ch), w, h, ch)
+    del px
+    plane, scale = kernels.encode_plane(lum, storage)
+    if sidecar:
+        _save_sidecar(sidecar, plane)
+    return {"w": w, "h": h, "plane": plane, "scale": scale, "storage": storage}
+
+# ------------------------------------------------------------------------------
+# Process-wide sampler cache (LRU under a memory budget)
+# ------------------------------------------------------------------------------
+
+_SAMPLER_CACHE: "OrderedDict[tuple, dict]" = OrderedDict()
+_SAMPLER_CACHE_BUDGET = DEFAULT_SAMPLER_CACHE_MB * 1024 * 1024  # bytes
+_SAMPLER_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+def _sampler_nbytes(sp) -> int:
+    if not sp:
+        return 0
+    return int(sp["plane"].nbytes) + sum(int(m.nbytes) for m, _ in sp.get("mips", [])[1:])
+
+def ensure_mips(sp):
+    """Build (once) the mip pyramid of a sampler for prefiltered sampling."""
+    if sp is not None and "mips" not in sp:
+        before = _sampler_nbytes(sp)
+        sp["mips"] = kernels.build_mip_pyramid(sp["plane"], sp["scale"])
+        if any(v is sp for v in _SAMPLER_CACHE.values()):
+            _SAMPLER_CACHE_STATS["bytes"] += _sampler_nbytes(sp) - before
+            _evict_samplers(_SAMPLER_CACHE_BUDGET)
+    return sp["mips"] if sp is not None else None
+
+def _evict_samplers(budget: int):
+    while _SAMPLER_CACHE and _SAMPLER_CACHE_STATS["bytes"] > budget:
+        _, old = _SAMPLER_CACHE.popitem(last=False)
+        _SAMPLER_CACHE_STATS["bytes"] -= _sampler_nbytes(old)
+        _SAMPLER_CACHE_STATS["evictions"] += 1
+
+def set_sampler_cache_budget(megabytes: float):
+    """Set the cache memory budget (MB) and evict down to it."""
+    global _SAMPLER_CACHE_BUDGET
+    _SAMPLER_CACHE_BUDGET = max(0, int(float(megabytes) * 1024 * 1024))
+    _evict_samplers(_SAMPLER_CACHE_BUDGET)
+
+def sampler_cache_stats() -> dict:
+    return dict(_SAMPLER_CACHE_STATS, entries=len(_SAMPLER_CACHE), budget=_SAMPLER_CACHE_BUDGET)
+
+def clear_sampler_cache():
+    _SAMPLER_CACHE.clear()
+    _SAMPLER_CACHE_STATS.update(hits=0, misses=0, evictions=0, bytes=0)
+
+def get_sampler(img: Optional[bpy.types.Image], storage: str = 'FLOAT32', disk_cache: bool = False):
+    """make_sampler through the process-wide cache: each image (and pixel generation) is decoded once."""
+    if not img:
+        return None
+    key = (image_fingerprint(img), storage)
+    sp = _SAMPLER_CACHE.get(key)
+    if sp is not None:
+        _SAMPLER_CACHE.move_to_end(key)
+        _SAMPLER_CACHE_STATS["hits"] += 1
+        return sp
+    _SAMPLER_CACHE_STATS["misses"] += 1
+    sp = make_sampler(img, storage, disk_cache)
+    if sp is None:
+        return None
+    nbytes = _sampler_nbytes(sp)
+    if nbytes <= _SAMPLER_CACHE_BUDGET:
+        # drop stale generations of the same image right away
+        for k in [k for k in _SAMPLER_CACHE if k[0][0] == key[0][0] and k[1] == storage]:
+            _SAMPLER_CACHE_STATS["bytes"] -= _sampler_nbytes(_SAMPLER_CACHE.pop(k))
+        _SAMPLER_CACHE[key] = sp
+        _SAMPLER_CACHE_STATS["bytes"] += nbytes
+        _evict_samplers(_SAMPLER_CACHE_BUDGET)
+    return sp
 
 def sample_height_at_loop(me: bpy.types.Mesh, uv_name: str, loop_index: int, tiling: float, sampler) -> float:
     if not sampler or not uv_name:
@@ -121,4 +291,10 @@ def sample_height_at_loop(me: bpy.types.Mesh, uv_name: str, loop_index: int, til
         return 0.0
     u = float(uv.x) * float(tiling)
     v = float(uv.y) * float(tiling)
-    return _sample_bilinear(sampler, u, v)
+    return sample_bilinear_scalar(sampler, u, v)
+
+def register():
+    pass
+
+def unregister():
+    clear_sampler_cache()
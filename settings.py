@@ -9,7 +9,11 @@ from bpy.props import (
 from .constants import (
     # Default values
     DEFAULT_ACTIVE_INDEX, DEFAULT_PAINTING, DEFAULT_VC_PACKED,
-    DEFAULT_STRENGTH, DEFAULT_MIDLEVEL, DEFAULT_FILL_POWER,
+    DEFAULT_STRENGTH, DEFAULT_MIDLEVEL, DEFAULT_FILL_POWER, DEFAULT_HEIGHTFILL_ENGINE,
+    DEFAULT_SAMPLER_PRECISION, DEFAULT_SAMPLER_CACHE_MB, DEFAULT_LAYER_SAMPLE_CACHE_MB, DEFAULT_DISK_CACHE_ENABLE,
+    DEFAULT_SAMPLING_FILTER, DEFAULT_HEIGHTFILL_THREADS, DEFAULT_HEIGHTFILL_CHUNK,
+    DEFAULT_HEIGHTFILL_MEMORY_MB, DEFAULT_INCREMENTAL_RECALC, DEFAULT_HEIGHTFILL_WORKER,
+    DEFAULT_RECALC_SCOPE, DEFAULT_RECALC_VERTEX_GROUP,
     DEFAULT_AUTO_ASSIGN_MATERIALS, DEFAULT_MASK_THRESHOLD, DEFAULT_ASSIGN_THRESHOLD,
     DEFAULT_PREVIEW_ENABLE, DEFAULT_PREVIEW_BLEND, DEFAULT_PREVIEW_MASK_INFLUENCE, DEFAULT_PREVIEW_CONTRAST,
     DEFAULT_DECIMATE_ENABLE, DEFAULT_DECIMATE_RATIO,
@@ -53,6 +57,37 @@ def _on_preview_param(self, context):
 
 
 
+def _on_global_displacement(self, context):
+    """Strength/Midlevel live in the GN modifier inputs: no re-solve, just push the values."""
+    try:
+        from .gn import set_gn_inputs
+        set_gn_inputs(self.id_data, self.strength, self.midlevel)
+    except Exception as e:
+        print("[MLD] GN input update failed:", e)
+
+def _on_heightfill_worker(self, context):
+    """Turning the worker off frees its process and warm caches."""
+    if not self.heightfill_worker:
+        try:
+            from .worker import stop_worker
+            stop_worker()
+        except Exception as e:
+            print("[MLD] Worker stop failed:", e)
+
+def _on_sampler_cache_budget(self, context):
+    try:
+        from .sampling import set_sampler_cache_budget
+        set_sampler_cache_budget(self.sampler_cache_mb)
+    except Exception as e:
+        print("[MLD] Sampler cache budget update failed:", e)
+
+def _on_layer_sample_budget(self, context):
+    try:
+        from .cache import set_layer_sample_budget
+        set_layer_sample_budget(self.layer_sample_cache_mb)
+    except Exception as e:
+        print("[MLD] Layer sample cache budget update failed:", e)
+
 # ------------------------------------------------------------------------------
 # Layer switching callback (OPTIMIZED)
 # ------------------------------------------------------------------------------
@@ -92,6 +127,34 @@ VC_ENUM = [
     ('A', 'A', "Alpha"),
 ]
 
+# Heightfill engines (NUMPY = vectorized, PYTHON = per-loop reference)
+HEIGHTFILL_ENGINES = [
+    ('NUMPY', "NumPy", "Vectorized engine: bulk-read mesh data and blend all loops with array ops"),
+    ('STREAMING', "NumPy (Streaming)", "NumPy engine over fixed-size loop windows with float32 accumulators; peak memory stays within the budget"),
+    ('PYTHON', "Python", "Per-loop reference engine (slow, kept for validation)"),
+    ('GEOMETRY_NODES', "Geometry Nodes", "Blend inside a generated Geometry Nodes group; layer parameters, mask paint and image edits update live"),
+]
+
+# Part of the mesh a heightfill recalc rewrites
+RECALC_SCOPES = [
+    ('ALL', "Whole Mesh", "Recompute every vertex"),
+    ('SELECTED', "Selected Faces", "Recompute vertices of selected faces; the rest keeps its current values"),
+    ('VERTEX_GROUP', "Vertex Group", "Recompute vertices with weight in a vertex group; the rest keeps its current values"),
+]
+
+# Storage of the per-image luminance plane used for height sampling
+SAMPLER_PRECISIONS = [
+    ('FLOAT32', "Float32", "Full precision (4 bytes per texel)"),
+    ('FLOAT16', "Float16", "Half precision (2 bytes per texel)"),
+    ('UINT16', "UInt16", "16-bit fixed point in 0..1 (2 bytes per texel)"),
+]
+
+# Height image filtering
+SAMPLING_FILTERS = [
+    ('BILINEAR', "Bilinear", "Four texels per sample (aliases on coarse meshes with dense textures)"),
+    ('PREFILTERED', "Prefiltered", "Mip pyramid: average the texel footprint implied by local UV density (NumPy engine)"),
+]
+
 # НОВЫЕ режимы смешивания (добавлен SIMPLE)
 BLEND_MODES = [
     ('SIMPLE', "Simple", "Direct mask blending (lerp by mask only)"),
@@ -99,6 +162,18 @@ BLEND_MODES = [
     ('SWITCH', "Switch", "Simple lerp/switch blending"),
 ]
 
+def _on_layer_gn_param(self, context):
+    """Geometry Nodes engine: layer parameters are modifier inputs, push them live."""
+    obj = self.id_data
+    s = getattr(obj, "mld_settings", None)
+    if s is None or getattr(s, "heightfill_engine", 'NUMPY') != 'GEOMETRY_NODES':
+        return
+    try:
+        from .gn_blend import set_layer_inputs
+        set_layer_inputs(obj, s)
+    except Exception as e:
+        print("[MLD] Layer GN input update failed:", e)
+
 class MLD_Layer(PropertyGroup):
     enabled: BoolProperty(
         name="Enabled", default=DEFAULT_LAYER_ENABLED,
@@ -121,10 +196,12 @@ class MLD_Layer(PropertyGroup):
     strength: FloatProperty(
         name="Height Strength", default=DEFAULT_LAYER_MULTIPLIER, soft_min=-8.0, soft_max=8.0,
         description="Multiply height values for this layer (applied before blending)",
+        update=_on_layer_gn_param,
     )
     bias: FloatProperty(
         name="Height Bias", default=DEFAULT_LAYER_BIAS, soft_min=-1.0, soft_max=1.0,
         description="Add to height values for this layer (applied before blending)",
+        update=_on_layer_gn_param,
     )
     
     # ОБНОВЛЕННЫЕ настройки смешивания (default изменен на SIMPLE)
@@ -137,18 +214,21 @@ class MLD_Layer(PropertyGroup):
     height_offset: FloatProperty(
         name="Height Offset", default=0.5, min=0.0, max=1.0,
         description="Height threshold for blending (0=no blend, 1=full override)",
+        update=_on_layer_gn_param,
     )
     
     # Switch blend specific  
     switch_opacity: FloatProperty(
         name="Switch Opacity", default=0.5, min=0.0, max=1.0,
         description="Opacity for switch blending (0=hidden, 1=full)",
+        update=_on_layer_gn_param,
     )
     
     # Остальные настройки без изменений
     tiling: FloatProperty(
         name="Tiling", default=DEFAULT_LAYER_TILING, min=1e-6, soft_min=0.01, soft_max=32.0,
         description="UV scale for this layer",
+        update=_on_layer_gn_param,
     )
     mask_name: StringProperty(
         name="Mask Attribute", default=DEFAULT_LAYER_MASK_NAME,
@@ -249,17 +329,81 @@ class MLD_Settings(PropertyGroup):
     # Global displacement parameters
     strength: FloatProperty(
         name="Global Strength", default=DEFAULT_STRENGTH, soft_min=-5.0, soft_max=5.0,
-        description="Overall displacement strength applied to the height result",
+        description="Overall displacement strength applied to the height result (live, in Geometry Nodes)",
+        update=_on_global_displacement,
     )
     midlevel: FloatProperty(
         name="Midlevel", default=DEFAULT_MIDLEVEL, min=0.0, max=1.0,
-        description="Reference midlevel (subtracted from blended height before strength)",
+        description="Reference midlevel (subtracted from blended height before strength; live, in Geometry Nodes)",
+        update=_on_global_displacement,
     )
     fill_power: FloatProperty(
         name="Fill Power", default=DEFAULT_FILL_POWER, min=0.0, soft_max=4.0,
         description="DEPRECATED: no longer used in new blending system",
     )
 
+    # Heightfill engine
+    heightfill_engine: EnumProperty(
+        name="Engine", items=HEIGHTFILL_ENGINES, default=DEFAULT_HEIGHTFILL_ENGINE,
+        description="Heightfill solver used by Recalculate",
+    )
+    sampler_precision: EnumProperty(
+        name="Height Precision", items=SAMPLER_PRECISIONS, default=DEFAULT_SAMPLER_PRECISION,
+        description="Storage of the luminance plane each height image is collapsed into for sampling",
+    )
+    sampling_filter: EnumProperty(
+        name="Filter", items=SAMPLING_FILTERS, default=DEFAULT_SAMPLING_FILTER,
+        description="How height images are filtered when sampled per loop",
+    )
+    sampler_cache_mb: IntProperty(
+        name="Sampler Cache (MB)", default=DEFAULT_SAMPLER_CACHE_MB, min=0, soft_max=16384,
+        description="Memory budget of the shared decoded-image cache (least recently used images are evicted)",
+        update=_on_sampler_cache_budget,
+    )
+    layer_sample_cache_mb: IntProperty(
+        name="Sample Cache (MB)", default=DEFAULT_LAYER_SAMPLE_CACHE_MB, min=0, soft_max=16384,
+        description="Memory budget of the per-layer height sample cache kept between recalcs (least recently used layers are evicted)",
+        update=_on_layer_sample_budget,
+    )
+    disk_cache_enable: BoolProperty(
+        name="Disk Height Cache", default=DEFAULT_DISK_CACHE_ENABLE,
+        description="Persist decoded height planes of file images as .npy sidecars and memory-map them on later runs",
+    )
+    disk_cache_dir: StringProperty(
+        name="Cache Folder", default="", subtype='DIR_PATH',
+        description="Folder for height cache sidecars (empty = Blender user data folder)",
+    )
+    heightfill_threads: IntProperty(
+        name="Threads", default=DEFAULT_HEIGHTFILL_THREADS, min=0, soft_max=64,
+        description="Worker threads of the NumPy engine (0 = one per CPU core). Results do not depend on this",
+    )
+    heightfill_chunk_size: IntProperty(
+        name="Chunk Size", default=DEFAULT_HEIGHTFILL_CHUNK, min=1024, soft_max=4194304,
+        description="Loops per work chunk of the NumPy engine; per-vertex sums are reduced in chunk order",
+    )
+    heightfill_memory_mb: IntProperty(
+        name="Memory Budget (MB)", default=DEFAULT_HEIGHTFILL_MEMORY_MB, min=64, soft_max=65536,
+        description="Peak working memory of the Streaming engine; loop windows are sized to fit",
+    )
+    incremental_recalc: BoolProperty(
+        name="Incremental Recalc", default=DEFAULT_INCREMENTAL_RECALC,
+        description="NumPy engine: after mask edits only re-blend vertices touching changed mask blocks",
+    )
+    heightfill_worker: BoolProperty(
+        name="Worker Process", default=DEFAULT_HEIGHTFILL_WORKER,
+        description="NumPy engine: solve in a persistent background process that keeps decoded height images "
+                    "and layer samples warm between recalcs (arrays are exchanged through shared memory)",
+        update=_on_heightfill_worker,
+    )
+    recalc_scope: EnumProperty(
+        name="Scope", items=RECALC_SCOPES, default=DEFAULT_RECALC_SCOPE,
+        description="NumPy engine: part of the mesh whose displacement and layer alphas are recomputed",
+    )
+    recalc_vertex_group: StringProperty(
+        name="Vertex Group", default=DEFAULT_RECALC_VERTEX_GROUP,
+        description="Vertex group limiting the recalc when Scope is Vertex Group",
+    )
+
     # Layers
     layers: CollectionProperty(type=MLD_Layer)
     def _layers_len(self):  # convenience accessor
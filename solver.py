@@ -0,0 +1,182 @@
+# solver.py — NumPy heightfill job runner (no bpy imports)
+"""
+Array half of the NumPy heightfill. heightfill._prepare_numpy reads everything
+from Blender into a job dict of plain arrays and tuples; run_job samples and
+blends it. Nothing here touches RNA, so a job may run on a worker thread or in
+the out-of-process worker (worker.py).
+"""
+from __future__ import annotations
+import numpy as np
+from typing import Optional
+from . import kernels, backend
+
+class SolveCancelled(Exception):
+    """Raised inside a background NumPy solve when its cancel flag is set."""
+
+def unique_loop_coords(ld):
+    """Unique (UV[, footprint]) set of the work mesh, computed once per solve on first use.
+    Tiling scales all coordinates alike, so one set serves every layer."""
+    if ld.get("unique") is None:
+        uv = ld["uv"]
+        ld["unique"] = kernels.unique_coords(uv[:, 0], uv[:, 1], ld["footprint"])
+        print(f"[MLD] UV dedup: {len(ld['unique'][0])} unique sample coords for {len(uv)} loops")
+    return ld["unique"]
+
+def sample_plan(i: int, key, hit, tiling: float, need: Optional[np.ndarray] = None) -> dict:
+    """
+    Sample plan of layer i from a sample-cache hit ((raw, valid) or None).
+    plan["cached"] is set when the hit already covers `need` (None = all loops);
+    otherwise the caller attaches a sampler (and mips) before layer_samples_from_plan.
+    """
+    raw, valid = hit if hit is not None else (None, None)
+    plan = {"index": i, "key": key, "raw": raw, "valid": valid, "tiling": tiling,
+            "missing": need, "sampler": None, "mips": None, "cached": False, "store": False}
+    if raw is not None:
+        missing = None if valid is None else (np.flatnonzero(~valid) if need is None else need[~valid[need]])
+        if valid is None or not len(missing):
+            plan["cached"] = True
+            return plan
+        plan["missing"] = missing
+    return plan
+
+def layer_samples_from_plan(plan: Optional[dict], ld, stats, cancelled=None) -> np.ndarray:
+    """
+    Sample each missing unique coordinate once and scatter back to loops.
+    The merged samples stay in the plan (plan["store"]) for the caller's sample cache.
+    """
+    uv = ld["uv"]
+    if plan is None:
+        return np.zeros(len(uv), dtype=np.float32)
+    if plan["cached"]:
+        stats["cached"] += 1
+        return plan["raw"]
+    raw, valid, missing = plan["raw"], plan["valid"], plan["missing"]
+    tiling, sp = plan["tiling"], plan["sampler"]
+
+    first, inverse = unique_loop_coords(ld)
+    if missing is None:
+        sel = np.arange(len(first))
+    else:
+        want = np.zeros(len(first), dtype=bool)
+        want[inverse[missing]] = True
+        sel = np.nonzero(want)[0]
+    su = np.zeros(len(first), dtype=np.float32)
+    if sp is not None and len(sel):
+        uu = uv[first[sel], 0] * tiling; vv = uv[first[sel], 1] * tiling
+        if ld["filter"] == 'PREFILTERED':
+            # footprint in level-0 texels: UV footprint * tiling * image size
+            fp = ld["footprint"][first[sel]] * np.float32(tiling * max(sp["w"], sp["h"]))
+            mips = plan["mips"]
+            fn = lambda r: kernels.sample_trilinear(mips, uu[r[0]:r[1]], vv[r[0]:r[1]], fp[r[0]:r[1]],
+                                                   backend.sample_bilinear)
+        else:
+            fn = lambda r: backend.sample_bilinear(sp["plane"], uu[r[0]:r[1]], vv[r[0]:r[1]], sp["scale"])
+        parts = []
+        for part in kernels.map_chunks(fn, kernels.chunk_ranges(len(sel), ld["chunk"]), ld["threads"]):
+            if cancelled is not None and cancelled():
+                raise SolveCancelled()
+            parts.append(part)
+        if parts:
+            su[sel] = np.concatenate(parts)
+    elif len(sel):
+        sel = sel[:0]  # image without pixels: zeros are the final samples
+        missing = None
+    new = su[inverse]
+    stats["coords"] += len(sel)
+
+    if missing is None:
+        raw, valid = new, None
+    else:
+        got = want[inverse]
+        if raw is None:
+            raw, valid = new, got
+        else:
+            raw, valid = np.where(valid, raw, new), valid | got
+        if valid.all():
+            valid = None
+    plan.update(raw=raw, valid=valid, store=True, sampler=None, mips=None)
+    stats["sampled"] += 1
+    return raw
+
+def blend_reduce(loop_vi, raws, masks, stack, table):
+    """Blend one loop chunk (None = disabled layer) and return its per-vertex partial sums."""
+    return backend.blend_reduce(loop_vi, raws, masks, stack, table)
+
+def run_job(job, progress=None, cancelled=None):
+    """
+    Sampling and chunked blending of a prepared job on arrays only.
+    progress(done, total) is called per finished unit (sampled layer / blended chunk);
+    raises SolveCancelled once cancelled() is true.
+    Sets job["result"] = (offs_z, alphas) as per-vertex float32 arrays.
+    """
+    if job["result"] is not None:
+        return
+    stack, table, ld, stats = job["stack"], job["table"], job["ld"], job["stats"]
+    loop_vi, vcount, n_layers = job["loop_vi"], job["vcount"], job["n_layers"]
+    sup_r, masks, plans = job["sup_r"], job["masks"], job["plans"]
+    threads, chunk = ld["threads"], ld["chunk"]
+
+    ranges = kernels.chunk_ranges(len(sup_r), chunk)
+    total = sum(1 for p in plans if p is not None) + len(ranges)
+    done = 0
+
+    def _tick():
+        nonlocal done
+        done += 1
+        if progress is not None:
+            progress(done, total)
+        if cancelled is not None and cancelled():
+            raise SolveCancelled()
+
+    raws = []
+    for i, plan in enumerate(plans):
+        if masks[i] is None:
+            raws.append(None)
+            continue
+        raw = layer_samples_from_plan(plan, ld, stats, cancelled)
+        raws.append(raw[sup_r])
+        if plan is not None:
+            _tick()
+
+    print(f"[MLD] Height samples: {stats['sampled']} layer(s) resampled ({stats['coords']} coords), "
+          f"{stats['cached']} from cache; {job['n_support']}/{job['nloops']} loops painted")
+
+    sup_vi = loop_vi[sup_r]
+
+    def _chunk(r):
+        a, b = r
+        return blend_reduce(sup_vi[a:b], [None if x is None else x[a:b] for x in raws],
+                            [None if x is None else x[a:b] for x in masks], stack, table)
+
+    def _chunks():
+        for part in kernels.map_chunks(_chunk, ranges, threads):
+            yield part
+            _tick()
+
+    acc = kernels.accumulate_chunks(_chunks(), 1 + n_layers, vcount)
+    print(f"[MLD] Blended {len(sup_r)} loops in {len(ranges)} chunk(s) on {min(threads, max(1, len(ranges)))} thread(s)")
+
+    # Unpainted loops: every mask is 0, so the height is 0 and all alphas are 0
+    counts = np.bincount(loop_vi, minlength=vcount)[:vcount]
+    unpainted = counts - np.bincount(sup_vi, minlength=vcount)[:vcount]
+    acc[0] += unpainted * float((np.float32(0.0) - np.float32(stack.midlevel)) * np.float32(stack.strength))
+
+    valence = np.maximum(counts, 1)
+    offs_z = (acc[0] / valence).astype(np.float32)
+    alphas_v = [(acc[1 + i] / valence).astype(np.float32) for i in range(n_layers)]
+    job["result"] = merge_region(job, offs_z, alphas_v)
+
+def merge_region(job, offs_z, alphas_v):
+    """
+    Incremental solves only blend the region's loops: region vertices own all their
+    loops, so their values are complete; every other vertex keeps the previous result.
+    """
+    verts_r, state = job["verts_r"], job["state"]
+    if verts_r is None:
+        return offs_z, alphas_v
+    out = state["offs_z"].copy()
+    out[verts_r] = offs_z[verts_r]
+    out_a = [a.copy() for a in state["alphas"]]
+    for i in range(job["n_layers"]):
+        out_a[i][verts_r] = alphas_v[i][verts_r]
+    return out, out_a
@@ -0,0 +1,7 @@
+# conftest.py — import the addon as a package outside Blender (bpy-free modules only)
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT.parent) not in sys.path:
+    sys.path.insert(0, str(ROOT.parent))
@@ -0,0 +1,219 @@
+# test_core.py — array solve vs the per-loop scalar reference (Python engine)
+import importlib
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PKG = Path(__file__).resolve().parents[1].name
+core = importlib.import_module(PKG + ".core")
+kernels = importlib.import_module(PKG + ".kernels")
+solver = importlib.import_module(PKG + ".solver")
+
+# ------------------------------------------------------------------------------
+# helpers
+# ------------------------------------------------------------------------------
+
+def _scene(seed, nloops=3000, vcount=700, n_layers=4, coverage=0.6):
+    rng = np.random.default_rng(seed); r = random.Random(seed)
+    loop_vi = rng.integers(0, vcount, nloops)
+    uv = (rng.random((nloops, 2)) * 4 - 2).astype(np.float32)
+    # FLOAT_COLOR masks can exceed 1 (HEIGHT_BLEND then extrapolates from the height below)
+    masks = [np.where(rng.random(nloops) < coverage, rng.choice([1.0, .3, .7, 1.5], nloops), 0).astype(np.float32)
+             for _ in range(n_layers)]
+    planes = [rng.random((r.randint(3, 40), r.randint(3, 40))).astype(np.float32) for _ in range(n_layers)]
+    layers = [dict(blend_mode=r.choice(['SIMPLE', 'HEIGHT_BLEND', 'SWITCH']),
+                   strength=r.uniform(-2, 2), bias=r.uniform(-.5, .5), tiling=r.uniform(.3, 3),
+                   height_offset=r.choice([0.0, 1.0, 1.5, r.random()]), switch_opacity=r.choice([0.0, 1.0, r.random()]))
+              for _ in range(n_layers)]
+    return uv, loop_vi, vcount, masks, planes, layers
+
+def _reference(uv, loop_vi, vcount, masks, planes, layers, strength=1.0, midlevel=0.0):
+    """Per-loop scalar blend averaged per vertex (what the Python engine computes)."""
+    stack = core.make_stack(layers, strength, midlevel)
+    table = core.compile_scalar_blend_table(stack.layers)
+    samplers = [core.make_plane_sampler(p) for p in planes]
+    n = len(stack.layers)
+    acc = np.zeros(vcount); acc_a = np.zeros((n, vcount)); cnt = np.zeros(vcount)
+    for li in range(len(loop_vi)):
+        layer_data = []
+        for i, L in enumerate(stack.layers):
+            if not L.enabled:
+                layer_data.append({'height': 0.0, 'mask': 0.0, 'layer': L})
+                continue
+            h = core.sample_bilinear_scalar(samplers[i], float(uv[li, 0]) * L.tiling, float(uv[li, 1]) * L.tiling)
+            layer_data.append({'height': h * L.strength + L.bias, 'mask': float(masks[i][li]), 'layer': L})
+        height, alphas = core.blend_layers_scalar(layer_data, table)
+        v = loop_vi[li]
+        acc[v] += (height - midlevel) * strength
+        acc_a[:, v] += alphas
+        cnt[v] += 1
+    cnt = np.maximum(cnt, 1)
+    return acc / cnt, acc_a / cnt
+
+def _job(uv, loop_vi, vcount, masks, planes, layers, threads=1, chunk=1024, sampled=None):
+    """core.new_job over plain arrays; sampled collects the loops each layer was asked to sample."""
+    stack = core.make_stack(layers)
+    samplers = [core.make_plane_sampler(p) for p in planes]
+
+    def make_plan(i, L, need):
+        if sampled is not None:
+            sampled[i] = need
+        plan = solver.sample_plan(i, None, None, max(1e-8, L.tiling), need)
+        plan["sampler"] = samplers[i]
+        return plan
+
+    job = core.new_job(stack, core.loop_data(uv, 'BILINEAR', None, threads, chunk),
+                       np.ascontiguousarray(loop_vi, dtype=np.int32), vcount)
+    smasks = [kernels.SparseMask.from_dense(m) if L.enabled else None for m, L in zip(masks, stack.layers)]
+    return job, smasks, make_plan
+
+# ------------------------------------------------------------------------------
+# solve_arrays
+# ------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("threads", [1, 4])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_solve_arrays_matches_scalar_reference(seed, threads):
+    uv, loop_vi, vcount, masks, planes, layers = _scene(seed)
+    offs, alphas = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers,
+                                     strength=0.7, midlevel=0.4, threads=threads, chunk=1024)
+    ref, ref_a = _reference(uv, loop_vi, vcount, masks, planes, layers, 0.7, 0.4)
+    assert offs.dtype == np.float32 and offs.shape == (vcount,)
+    assert np.abs(offs - ref).max() < 1e-5
+    assert np.abs(np.array(alphas) - ref_a).max() < 1e-5
+
+def test_solve_arrays_threads_are_bit_exact():
+    uv, loop_vi, vcount, masks, planes, layers = _scene(3)
+    one = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers, threads=1, chunk=1024)
+    many = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers, threads=4, chunk=1024)
+    assert np.array_equal(one[0], many[0])
+    for a, b in zip(one[1], many[1]):
+        assert np.array_equal(a, b)
+
+def test_disabled_layer_has_no_effect():
+    uv, loop_vi, vcount, masks, planes, layers = _scene(4)
+    layers[2]["enabled"] = False
+    offs, alphas = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers)
+    ref, ref_a = _reference(uv, loop_vi, vcount, masks, planes, layers)
+    assert np.abs(offs - ref).max() < 1e-5
+    assert not alphas[2].any()
+    # same as the stack without it
+    keep = [0, 1, 3]
+    offs_k, alphas_k = core.solve_arrays(uv, loop_vi, vcount, [masks[i] for i in keep],
+                                         [planes[i] for i in keep], [layers[i] for i in keep])
+    assert np.abs(offs - offs_k).max() < 1e-6
+    for a, i in zip(alphas_k, keep):
+        assert np.abs(alphas[i] - a).max() < 1e-6
+
+def test_unpainted_mesh_is_flat():
+    uv, loop_vi, vcount, masks, planes, layers = _scene(5)
+    zeros = [np.zeros_like(m) for m in masks]
+    offs, alphas = core.solve_arrays(uv, loop_vi, vcount, zeros, planes, layers, midlevel=0.25)
+    used = np.bincount(loop_vi, minlength=vcount) > 0  # loose vertices stay at 0
+    assert np.allclose(offs[used], -0.25) and not offs[~used].any()
+    assert not any(a.any() for a in alphas)
+
+# ------------------------------------------------------------------------------
+# culling
+# ------------------------------------------------------------------------------
+
+def test_culling_skips_covered_heights():
+    uv, loop_vi, vcount, masks, planes, layers = _scene(6, n_layers=3)
+    # top layer opaque everywhere: nothing below it needs a height
+    masks[2] = np.ones_like(masks[2])
+    layers[2].update(blend_mode='SIMPLE')
+    layers[1].update(blend_mode='SIMPLE')
+    sampled = {}
+    job, smasks, make_plan = _job(uv, loop_vi, vcount, masks, planes, layers, sampled=sampled)
+    core.plan_job(job, smasks, make_plan)
+    solver.run_job(job)
+    assert len(sampled[0]) == 0 and len(sampled[1]) == 0
+    assert len(sampled[2]) == len(loop_vi)
+    ref, ref_a = _reference(uv, loop_vi, vcount, masks, planes, layers)
+    assert np.abs(job["result"][0] - ref).max() < 1e-5
+    assert np.abs(np.array(job["result"][1]) - ref_a).max() < 1e-5
+
+@pytest.mark.parametrize("seed", [7, 8, 9])
+def test_alpha_culling_keeps_alphas(seed):
+    uv, loop_vi, vcount, masks, planes, layers = _scene(seed)
+    full = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers)
+    sampled = {}
+    job, smasks, make_plan = _job(uv, loop_vi, vcount, masks, planes, layers, sampled=sampled)
+    core.plan_job(job, smasks, make_plan, alphas_only=True)
+    solver.run_job(job)
+    for a, b in zip(job["result"][1], full[1]):
+        assert np.array_equal(a, b)
+    needed_full = kernels.plan_culling(job["stack"], job["masks"], job["table"])
+    for i, need in enumerate(job["needed"]):
+        assert np.count_nonzero(need) <= np.count_nonzero(needed_full[i])
+
+def _over_one_stack():
+    """Opaque-looking HEIGHT_BLEND (offset 1) at mask 1.5 over two SIMPLE layers, read by a HEIGHT_BLEND above."""
+    uv = np.zeros((1, 2), dtype=np.float32); loop_vi = np.zeros(1, dtype=np.int32)
+    planes = [np.full((2, 2), h, dtype=np.float32) for h in (0.2, 0.7, 0.9, 1.0)]
+    masks = [np.array([m], dtype=np.float32) for m in (1.0, 1.0, 1.5, 1.0)]
+    layers = [dict(blend_mode='SIMPLE'), dict(blend_mode='SIMPLE'),
+              dict(blend_mode='HEIGHT_BLEND', height_offset=1.0),
+              dict(blend_mode='HEIGHT_BLEND', height_offset=0.5, strength=1.5)]
+    return uv, loop_vi, 1, masks, planes, layers
+
+def test_culling_with_mask_above_one():
+    uv, loop_vi, vcount, masks, planes, layers = _over_one_stack()
+    expected, _ = core.apply_height_blend(0.7, 0.9, 1.5, 1.0)
+    offs, _ = core.solve_arrays(uv, loop_vi, vcount, masks[:3], planes[:3], layers[:3])
+    assert abs(float(offs[0]) - expected) < 1e-6
+    offs, alphas = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers)
+    ref, ref_a = _reference(uv, loop_vi, vcount, masks, planes, layers)
+    assert abs(float(offs[0]) - ref[0]) < 1e-6
+    assert np.abs(np.array(alphas)[:, 0] - ref_a[:, 0]).max() < 1e-6
+
+def test_alpha_culling_with_mask_above_one():
+    uv, loop_vi, vcount, masks, planes, layers = _over_one_stack()
+    _, ref_a = _reference(uv, loop_vi, vcount, masks, planes, layers)
+    job, smasks, make_plan = _job(uv, loop_vi, vcount, masks, planes, layers)
+    core.plan_job(job, smasks, make_plan, alphas_only=True)
+    solver.run_job(job)
+    assert np.abs(np.array(job["result"][1])[:, 0] - ref_a[:, 0]).max() < 1e-6
+
+# ------------------------------------------------------------------------------
+# incremental (region) solves
+# ------------------------------------------------------------------------------
+
+def test_merge_region_keeps_outside_vertices():
+    job = {"verts_r": np.array([1, 3]), "n_layers": 1,
+           "state": {"offs_z": np.full(5, 9.0, np.float32), "alphas": [np.full(5, 0.5, np.float32)]}}
+    offs, alphas = solver.merge_region(job, np.arange(5, dtype=np.float32), [np.zeros(5, np.float32)])
+    assert offs.tolist() == [9.0, 1.0, 9.0, 3.0, 9.0]
+    assert alphas[0].tolist() == [0.5, 0.0, 0.5, 0.0, 0.5]
+    assert job["state"]["offs_z"][1] == 9.0  # previous result is not modified
+    job["verts_r"] = None
+    assert solver.merge_region(job, offs, alphas)[0] is offs
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_region_solve_matches_full_solve(threads):
+    uv, loop_vi, vcount, masks, planes, layers = _scene(10)
+    old = core.solve_arrays(uv, loop_vi, vcount, masks, planes, layers)
+
+    # repaint some vertices, then only solve their loops
+    rng = np.random.default_rng(11)
+    verts = np.unique(rng.integers(0, vcount, 80))
+    loops = kernels.loops_of_vertices(kernels.vertex_loops_csr(loop_vi, vcount), verts)
+    new_masks = [m.copy() for m in masks]
+    for m in new_masks:
+        m[loops] = rng.choice([0.0, 0.5, 1.0], len(loops))
+    full = core.solve_arrays(uv, loop_vi, vcount, new_masks, planes, layers, threads=threads, chunk=1024)
+
+    job, smasks, make_plan = _job(uv, loop_vi, vcount, new_masks, planes, layers, threads=threads)
+    job["state"] = {"offs_z": old[0], "alphas": old[1]}
+    core.plan_job(job, smasks, make_plan, region=(loops, verts))
+    solver.run_job(job)
+    offs, alphas = job["result"]
+
+    outside = np.ones(vcount, dtype=bool); outside[verts] = False
+    assert np.abs(offs[verts] - full[0][verts]).max() < 1e-6
+    assert np.array_equal(offs[outside], old[0][outside])
+    for i in range(len(layers)):
+        assert np.abs(alphas[i][verts] - full[1][i][verts]).max() < 1e-6
+        assert np.array_equal(alphas[i][outside], old[1][i][outside])
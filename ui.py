@@ -99,6 +99,13 @@ def _get_detailed_polycount_info(obj: bpy.types.Object, s) -> list:
     
     return info_lines
 
+def _background_progress(obj):
+    try:
+        from .ops_pipeline import background_progress
+        return background_progress(obj)
+    except Exception:
+        return None
+
 def _op(layout, idname, text=None, icon='NONE'):
     try:
         return layout.operator(idname, text=text if text is not None else "", icon=icon)
@@ -461,10 +468,48 @@ class VIEW3D_PT_mld(bpy.types.Panel):
         box = layout.box()
         col = box.column(align=True); col.enabled = not painting
         
-        # Recalculate button - 2x height
+        # Recalculate button - 2x height (progress bar while a background recalc runs)
         recalc_row = col.row(align=True)
         recalc_row.scale_y = 2.0
-        _op(recalc_row, "mld.recalculate", text="Recalculate", icon='FILE_REFRESH')
+        progress = _background_progress(obj)
+        if progress is not None:
+            try:
+                recalc_row.progress(factor=progress, text=f"Recalculating {progress * 100:.0f}% (Esc to cancel)")
+            except Exception:
+                recalc_row.label(text=f"Recalculating {progress * 100:.0f}% (Esc to cancel)", icon='TIME')
+        else:
+            _op(recalc_row, "mld.recalculate", text="Recalculate", icon='FILE_REFRESH')
+            _op(recalc_row, "mld.recalculate_background", text="", icon='SORTTIME')
+            _set(_op(col, "mld.assign_materials_from_disp", text="Assign Materials from Masks", icon='MATERIAL'),
+                 source='MASKS')
+        col.prop(s, "heightfill_engine", text="Engine")
+        col.prop(s, "sampler_precision", text="Precision")
+        col.prop(s, "sampling_filter", text="Filter")
+        col.prop(s, "sampler_cache_mb", text="Image Cache (MB)")
+        col.prop(s, "layer_sample_cache_mb", text="Sample Cache (MB)")
+        col.prop(s, "disk_cache_enable", text="Disk Height Cache")
+        if getattr(s, "disk_cache_enable", False):
+            row = col.row(align=True)
+            row.prop(s, "disk_cache_dir", text="")
+            _op(row, "mld.clear_height_cache", text="", icon='TRASH')
+        engine = getattr(s, "heightfill_engine", 'NUMPY')
+        if engine in ('NUMPY', 'STREAMING'):
+            try:
+                from .backend import backend_info
+                col.label(text=f"Kernels: {backend_info()['label']}", icon='MEMORY')
+            except Exception:
+                pass
+            row = col.row(align=True)
+            row.prop(s, "heightfill_threads", text="Threads")
+            if engine == 'STREAMING':
+                row.prop(s, "heightfill_memory_mb", text="Budget (MB)")
+            else:
+                row.prop(s, "heightfill_chunk_size", text="Chunk")
+                col.prop(s, "incremental_recalc", text="Incremental Recalc")
+                col.prop(s, "heightfill_worker", text="Worker Process")
+                col.prop(s, "recalc_scope", text="Scope")
+                if getattr(s, "recalc_scope", 'ALL') == 'VERTEX_GROUP':
+                    col.prop_search(s, "recalc_vertex_group", obj, "vertex_groups", text="")
         
         # Reset buttons
         row = col.row(align=True)
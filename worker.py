@@ -0,0 +1,416 @@
+# worker.py — persistent out-of-process heightfill worker (no bpy imports)
+"""
+Optional local process that runs NumPy heightfill jobs (solver.run_job) outside
+Blender and stays alive between Recalculates, so decoded height planes, their mip
+pyramids, unique UV sets and per-layer samples stay warm. Arrays travel through
+multiprocessing.shared_memory blocks; the connection only carries small control
+messages (block names, array layout, cache keys, the layer stack snapshot).
+
+Blender side: run_remote_job / stop_worker. Worker side: _main, started by a
+bootstrap that mounts the add-on folder as a package without running its
+__init__ (which imports bpy).
+"""
+from __future__ import annotations
+import os
+import sys
+import glob
+import secrets
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from . import backend, kernels, solver
+
+class WorkerError(RuntimeError):
+    """The worker process could not be started or failed to answer."""
+
+# ------------------------------------------------------------------------------
+# Shared memory transport: one packed input block per request, one result block
+# ------------------------------------------------------------------------------
+
+_ALIGN = 64
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Open an existing block without handing it to this process's resource tracker."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+def _pack(arrays: Dict[str, Optional[np.ndarray]]):
+    """Copy arrays into one new block. Returns (block, layout); layout[name] is None for None arrays."""
+    layout, size = {}, 0
+    for name, a in arrays.items():
+        if a is None:
+            layout[name] = None
+            continue
+        layout[name] = (size, tuple(a.shape), np.asarray(a).dtype.str)
+        size += (a.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+    shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+    for name, a in arrays.items():
+        if a is not None:
+            off, shape, dt = layout[name]
+            np.ndarray(shape, np.dtype(dt), buffer=shm.buf, offset=off)[...] = a
+    return shm, layout
+
+def _unpack(name: str, layout) -> Dict[str, Optional[np.ndarray]]:
+    """Private copies of every array of a packed block (the block is closed again right away)."""
+    shm = _attach(name)
+    try:
+        return {k: None if d is None else np.ndarray(d[1], np.dtype(d[2]), buffer=shm.buf, offset=d[0]).copy()
+                for k, d in layout.items()}
+    finally:
+        shm.close()
+
+def _release(shm: Optional[shared_memory.SharedMemory]):
+    if shm is None:
+        return
+    try:
+        shm.close()
+        shm.unlink()
+    except Exception:
+        pass
+
+# ------------------------------------------------------------------------------
+# Worker side: warm planes (LRU under the sampler cache budget) and samples
+# ------------------------------------------------------------------------------
+
+_PLANES: "OrderedDict[tuple, Optional[dict]]" = OrderedDict()
+_PLANE_BYTES = [0]
+_SAMPLES: Dict[tuple, tuple] = {}   # (scope, layer index) -> (key, raw, valid)
+_UNIQUE: Dict[str, tuple] = {}      # scope -> (uv key, filter, unique coords)
+
+def _plane_nbytes(sp) -> int:
+    if not sp:
+        return 0
+    return int(sp["plane"].nbytes) + sum(int(m.nbytes) for m, _ in sp.get("mips", [])[1:])
+
+def _evict_planes(budget: int, keep=()):
+    for k in list(_PLANES):
+        if _PLANE_BYTES[0] <= budget:
+            break
+        if k not in keep:
+            _PLANE_BYTES[0] -= _plane_nbytes(_PLANES.pop(k))
+
+def _put_plane(msg):
+    sp = None
+    if msg["layout"] is not None:
+        sp = dict(msg["meta"], plane=_unpack(msg["block"], msg["layout"])["plane"])
+    old = _PLANES.pop(msg["key"], None)
+    _PLANE_BYTES[0] += _plane_nbytes(sp) - _plane_nbytes(old)
+    _PLANES[msg["key"]] = sp
+    return True
+
+def _worker_plan(scope, rp, need, filt):
+    i, key = rp["index"], rp["key"]
+    hit = _SAMPLES.get((scope, i))
+    plan = solver.sample_plan(i, key, (hit[1], hit[2]) if hit is not None and hit[0] == key else None,
+                              rp["tiling"], need)
+    if plan["cached"]:
+        return plan
+    if rp["plane"] not in _PLANES:
+        raise WorkerError("height plane was evicted before the solve")
+    sp = _PLANES[rp["plane"]]
+    _PLANES.move_to_end(rp["plane"])
+    plan["sampler"] = sp
+    if sp is not None and filt == 'PREFILTERED':
+        if "mips" not in sp:
+            sp["mips"] = kernels.build_mip_pyramid(sp["plane"], sp["scale"])
+            _PLANE_BYTES[0] += _plane_nbytes(sp) - int(sp["plane"].nbytes)
+        plan["mips"] = sp["mips"]
+    return plan
+
+def _solve(msg):
+    scope, n_layers, vcount = msg["scope"], msg["n_layers"], msg["vcount"]
+    arrays = _unpack(msg["block"], msg["layout"])
+    filt = msg["filter"]
+    ld = {"uv": arrays["uv"], "filter": filt, "footprint": arrays["footprint"], "unique": None,
+          "threads": msg["threads"], "chunk": msg["chunk"]}
+    warm = _UNIQUE.get(scope)
+    if warm is not None and warm[:2] == (msg["uv_key"], filt):
+        ld["unique"] = warm[2]
+    plans = [None if rp is None else _worker_plan(scope, rp, arrays[f"need{rp['index']}"], filt)
+             for rp in msg["plans"]]
+    job = {"stack": msg["stack"], "table": kernels.compile_blend_table(msg["stack"]), "ld": ld,
+           "loop_vi": arrays["loop_vi"], "nloops": msg["nloops"], "vcount": vcount, "n_layers": n_layers,
+           "stats": {"sampled": 0, "cached": 0, "coords": 0}, "result": None,
+           "sup_r": arrays["sup_r"], "masks": [arrays[f"mask{i}"] for i in range(n_layers)],
+           "plans": plans, "n_support": msg["n_support"], "verts_r": None, "state": None}
+    solver.run_job(job, msg.get("progress"))
+    if ld["unique"] is not None:
+        _UNIQUE[scope] = (msg["uv_key"], filt, ld["unique"])
+    for plan in plans:
+        if plan is not None and plan["store"]:
+            _SAMPLES[(scope, plan["index"])] = (plan["key"], plan["raw"], plan["valid"])
+    for k in [k for k in _SAMPLES if k[0] == scope and k[1] >= n_layers]:
+        del _SAMPLES[k]
+    _evict_planes(msg["plane_budget"])
+
+    offs_z, alphas_v = job["result"]
+    shm = _attach(msg["result"])
+    try:
+        out = np.ndarray((1 + n_layers, vcount), np.float32, buffer=shm.buf)
+        out[0] = offs_z
+        for i, a in enumerate(alphas_v):
+            out[1 + i] = a
+        del out
+    finally:
+        shm.close()
+    return job["stats"]
+
+def _forget(msg):
+    scope = msg.get("scope")
+    for k in [k for k in _SAMPLES if scope is None or k[0] == scope]:
+        del _SAMPLES[k]
+    if scope is None:
+        _UNIQUE.clear()
+    else:
+        _UNIQUE.pop(scope, None)
+    return True
+
+_HANDLERS = {
+    "missing_planes": lambda msg: [k for k in msg["keys"] if k not in _PLANES],
+    "put_plane": _put_plane,
+    "solve": _solve,
+    "forget": _forget,
+    "ping": lambda msg: os.getpid(),
+}
+
+def _serve(conn):
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg.get("op") == "stop":
+            break
+        # progress messages let the Blender side tell a long solve from a hung worker
+        msg["progress"] = lambda done, total: conn.send({"progress": (done, total)})
+        try:
+            reply = {"ok": True, "value": _HANDLERS[msg["op"]](msg)}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            break
+
+def _exit_with_parent():
+    """Blender keeps our stdin open; EOF means it quit (or crashed)."""
+    try:
+        sys.stdin.read()
+    finally:
+        os._exit(0)
+
+def _main():
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    threading.Thread(target=_exit_with_parent, daemon=True).start()
+    backend.select_backend()
+    with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        print(f"MLD_WORKER_PORT {listener.address[1]}", flush=True)
+        conn = listener.accept()
+    try:
+        sys.stdout.reconfigure(line_buffering=True)
+    except Exception:
+        pass
+    print(f"[MLD] Heightfill worker {os.getpid()} ready")
+    try:
+        _serve(conn)
+    finally:
+        conn.close()
+
+# ------------------------------------------------------------------------------
+# Blender side: start on demand, one request at a time
+# ------------------------------------------------------------------------------
+
+_BOOTSTRAP = (
+    "import sys, types, importlib\n"
+    "name, path = sys.argv[1], sys.argv[2]\n"
+    "pkg = types.ModuleType(name); pkg.__path__ = [path]; sys.modules[name] = pkg\n"
+    "importlib.import_module(name + '.worker')._main()\n"
+)
+
+_LOCK = threading.RLock()
+_WORKER: dict = {}
+_REPLY_TIMEOUT = 60.0  # s without any message (reply or solve progress) before the worker counts as hung
+
+def _python_exe() -> str:
+    """Blender's bundled interpreter (sys.executable is Python itself since 2.91)."""
+    exe = sys.executable
+    if "python" in os.path.basename(exe).lower():
+        return exe
+    found = sorted(glob.glob(os.path.join(sys.prefix, "bin", "python3*")))
+    if not found:
+        raise WorkerError(f"no Python interpreter next to {exe}")
+    return found[0]
+
+def _echo(stream):
+    """Forward the worker's console output to Blender's console."""
+    try:
+        for line in stream:
+            print(line.rstrip())
+    except Exception:
+        pass
+
+def _start():
+    authkey = secrets.token_bytes(32)
+    try:
+        proc = subprocess.Popen(
+            [_python_exe(), "-c", _BOOTSTRAP, __package__, os.path.dirname(os.path.abspath(__file__))],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+        )
+        proc.stdin.write(authkey.hex() + "\n")
+        proc.stdin.flush()
+    except Exception as e:
+        raise WorkerError(f"could not start worker: {e}")
+    port = None
+    for line in proc.stdout:
+        if line.startswith("MLD_WORKER_PORT "):
+            port = int(line.split()[1])
+            break
+        print(line.rstrip())
+    if port is None:
+        proc.kill()
+        raise WorkerError(f"worker exited during startup (code {proc.wait()})")
+    try:
+        conn = Client(("127.0.0.1", port), authkey=authkey)
+    except Exception as e:
+        proc.kill()
+        raise WorkerError(f"could not connect to worker: {e}")
+    threading.Thread(target=_echo, args=(proc.stdout,), daemon=True).start()
+    _WORKER.update(proc=proc, conn=conn)
+    print(f"[MLD] Started heightfill worker (pid {proc.pid})")
+
+def _recv(conn, proc, timeout: float):
+    """Next message from the worker; never blocks longer than `timeout` s of silence."""
+    deadline = time.monotonic() + timeout
+    while not conn.poll(0.1):
+        if proc.poll() is not None:
+            raise WorkerError(f"worker exited (code {proc.returncode})")
+        if time.monotonic() > deadline:
+            raise WorkerError(f"worker did not answer within {timeout:.0f} s")
+    return conn.recv()
+
+def _call(msg):
+    with _LOCK:
+        if not _WORKER or _WORKER["proc"].poll() is not None:
+            _WORKER.clear()
+            _start()
+        conn, proc = _WORKER["conn"], _WORKER["proc"]
+        try:
+            conn.send(msg)
+            reply = _recv(conn, proc, _REPLY_TIMEOUT)
+            while "progress" in reply:
+                reply = _recv(conn, proc, _REPLY_TIMEOUT)
+        except WorkerError:
+            stop_worker()
+            raise
+        except (EOFError, OSError) as e:
+            stop_worker()
+            raise WorkerError(f"lost connection to worker: {e}")
+    if not reply["ok"]:
+        raise WorkerError(reply["error"])
+    return reply["value"]
+
+def worker_pid() -> Optional[int]:
+    """PID of the running worker, None when it is not running."""
+    proc = _WORKER.get("proc")
+    return proc.pid if proc is not None and proc.poll() is None else None
+
+def stop_worker():
+    """Ask the worker to exit (killed if it does not within 2 s); its warm caches are lost."""
+    with _LOCK:
+        w = dict(_WORKER)
+        _WORKER.clear()
+    if not w:
+        return
+    try:
+        w["conn"].send({"op": "stop"})
+        w["conn"].close()
+    except Exception:
+        pass
+    proc = w["proc"]
+    try:
+        proc.stdin.close()
+        proc.wait(timeout=2.0)
+    except Exception:
+        proc.kill()
+    print(f"[MLD] Stopped heightfill worker (pid {proc.pid})")
+
+def forget_samples(scope: Optional[str] = None):
+    """Drop the worker's samples of one object (None = all); no-op when it is not running."""
+    if worker_pid() is not None:
+        try:
+            _call({"op": "forget", "scope": scope})
+        except WorkerError:
+            pass
+
+def _send_plane(key, sp):
+    block = layout = None
+    meta = None
+    if sp is not None:
+        block, layout = _pack({"plane": sp["plane"]})
+        meta = {k: sp[k] for k in ("w", "h", "scale", "storage")}
+    try:
+        _call({"op": "put_plane", "key": key, "meta": meta,
+               "block": block.name if block else None, "layout": layout})
+    finally:
+        _release(block)
+
+def run_remote_job(job: dict, scope: str, get_plane: Callable[[dict], Optional[dict]], budget_mb: float):
+    """
+    Solve a job prepared with remote plans (heightfill._prepare_numpy(remote=True)) in the
+    worker and set job["result"]. get_plane(plan) decodes a layer's plane; it is only
+    called for planes the worker does not hold yet. Raises WorkerError on any failure.
+    """
+    if job["result"] is not None:
+        return
+    plans = job["plans"]
+    remote = [p for p in plans if p is not None]
+    first = {}
+    for p in remote:
+        first.setdefault(p["plane"], p)
+    for key in _call({"op": "missing_planes", "keys": list(first)}):
+        _send_plane(key, get_plane(first[key]))
+
+    ld, n_layers, vcount = job["ld"], job["n_layers"], job["vcount"]
+    arrays = {"loop_vi": job["loop_vi"], "uv": ld["uv"], "footprint": ld["footprint"], "sup_r": job["sup_r"]}
+    arrays.update((f"mask{i}", m) for i, m in enumerate(job["masks"]))
+    arrays.update((f"need{p['index']}", p["need"]) for p in remote)
+    block = result = None
+    try:
+        block, layout = _pack(arrays)
+        result = shared_memory.SharedMemory(create=True, size=max(1, 4 * (1 + n_layers) * vcount))
+        stats = _call({
+            "op": "solve", "scope": scope, "block": block.name, "layout": layout, "result": result.name,
+            "stack": job["stack"], "vcount": vcount, "nloops": job["nloops"], "n_layers": n_layers,
+            "n_support": job["n_support"], "filter": ld["filter"], "uv_key": ld["uv_key"],
+            "threads": ld["threads"], "chunk": ld["chunk"], "plane_budget": int(float(budget_mb) * 1048576),
+            "plans": [None if p is None else {"index": p["index"], "key": p["key"], "tiling": p["tiling"],
+                                              "plane": p["plane"]} for p in plans],
+        })
+        out = np.ndarray((1 + n_layers, vcount), np.float32, buffer=result.buf).copy()
+    finally:
+        _release(block)
+        _release(result)
+    for k, v in stats.items():
+        job["stats"][k] += v
+    print(f"[MLD] Worker: {stats['sampled']} layer(s) resampled, {stats['cached']} from its cache")
+    job["result"] = solver.merge_region(job, out[0], [out[1 + i] for i in range(n_layers)])
+
+def register():
+    pass
+
+def unregister():
+    stop_worker()